@@ -0,0 +1,329 @@
+"""Regras de ocupacao da agenda: conflitos de sala/medico e horarios livres."""
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, time as dt_time, timedelta, timezone
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import and_, func, or_, select
+
+from config import settings
+from models import Agendamento
+from rollups import mes_de
+
+# Agendamentos cancelados ou excluidos nao ocupam a sala nem o medico (mesmo filtro das constraints)
+STATUS_CANCELADO = "cancelado"
+# Duracao maxima de um agendamento (CHECK ck_agendamentos_duracao da 0011). Da um limite inferior a
+# data_hora_inicio nas buscas de sobreposicao, o que deixa o Postgres ler so as particoes do periodo
+DURACAO_MAXIMA = timedelta(hours=24)
+
+
+def erro_de_horario(inicio: datetime, fim: datetime) -> Optional[str]:
+    """Mensagem do 400 para um intervalo de agendamento invalido; None se ele for valido."""
+    if fim <= inicio:
+        return "Horario final deve ser maior que o inicial"
+    if fim - inicio > DURACAO_MAXIMA:
+        return "Agendamento limitado a 24 horas"
+    return None
+
+
+def sobrepoe(dialect_name: str, inicio: datetime, fim: datetime):
+    """Predicado de sobreposicao com o intervalo [inicio, fim).
+
+    No Postgres usa a mesma expressao tstzrange das constraints de exclusao
+    (migracao 0006), para que o planner use os indices GiST delas. Os limites
+    em data_hora_inicio descartam as particoes fora do periodo.
+    """
+    inicio_no_periodo = and_(
+        Agendamento.data_hora_inicio < fim, Agendamento.data_hora_inicio > inicio - DURACAO_MAXIMA
+    )
+    if dialect_name == "postgresql":
+        intervalo = func.tstzrange(Agendamento.data_hora_inicio, Agendamento.data_hora_fim, "[)")
+        return and_(intervalo.op("&&")(func.tstzrange(inicio, fim, "[)")), inicio_no_periodo)
+    return and_(inicio_no_periodo, Agendamento.data_hora_fim > inicio)
+
+
+async def conferir_sobreposicao(db, inicio: datetime, fim: datetime) -> bool:
+    """Se a sobreposicao de um agendamento novo deve ser conferida com buscar_conflitos antes do commit.
+
+    No Postgres as constraints de exclusao barram a sobreposicao, mas cada uma
+    so enxerga a propria particao mensal (particoes.py). Perto da virada do mes
+    (em UTC) o agendamento pode sobrepor outro da particao vizinha: nesse caso a
+    conferencia e feita sob um advisory lock de transacao, que serializa as
+    insercoes na virada. No SQLite, sem as constraints, sempre.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return True
+    if mes_de(inicio - DURACAO_MAXIMA) == mes_de(fim - timedelta(microseconds=1)):
+        return False
+    await db.execute(select(func.pg_advisory_xact_lock(func.hashtext("agendamentos_virada_de_mes"))))
+    return True
+
+
+async def buscar_conflitos(
+    db,
+    inicio: datetime,
+    fim: datetime,
+    sala: Optional[str],
+    responsavel_id: Optional[int],
+    ignorar_id: Optional[int] = None,
+) -> list[dict]:
+    recursos = []
+    if sala:
+        recursos.append(Agendamento.sala == sala)
+    if responsavel_id is not None:
+        recursos.append(Agendamento.responsavel_id == responsavel_id)
+    if not recursos:
+        return []
+
+    query = select(Agendamento).where(
+        sobrepoe(db.get_bind().dialect.name, inicio, fim),
+        Agendamento.status != STATUS_CANCELADO,
+        Agendamento.deleted_at.is_(None),
+        or_(*recursos),
+    )
+    if ignorar_id is not None:
+        query = query.where(Agendamento.id != ignorar_id)
+
+    conflitos = []
+    for ag in (await db.scalars(query.order_by(Agendamento.data_hora_inicio))).all():
+        motivos = []
+        if sala and ag.sala == sala:
+            motivos.append("sala")
+        if responsavel_id is not None and ag.responsavel_id == responsavel_id:
+            motivos.append("responsavel")
+        conflitos.append(
+            {
+                "id": ag.id,
+                "paciente_id": ag.paciente_id,
+                "data_hora_inicio": ag.data_hora_inicio,
+                "data_hora_fim": ag.data_hora_fim,
+                "sala": ag.sala,
+                "responsavel_id": ag.responsavel_id,
+                "motivos": motivos,
+            }
+        )
+    return conflitos
+
+
+def conflito_exception(conflitos: list[dict]) -> HTTPException:
+    return HTTPException(
+        status_code=409,
+        detail=jsonable_encoder({"message": "Conflito de horario", "conflitos": conflitos}),
+    )
+
+
+# --- Disponibilidade -------------------------------------------------------
+
+Intervalo = tuple[datetime, datetime]
+
+
+def _utc(valor: datetime) -> datetime:
+    # SQLite devolve datetimes sem fuso; todos os horarios sao gravados em UTC
+    return valor.replace(tzinfo=timezone.utc) if valor.tzinfo is None else valor.astimezone(timezone.utc)
+
+
+def _dias_tocados(inicio: datetime, fim: datetime, tz: ZoneInfo) -> list[date]:
+    dia, ultimo = inicio.astimezone(tz).date(), (fim - timedelta(microseconds=1)).astimezone(tz).date()
+    dias = []
+    while dia <= ultimo:
+        dias.append(dia)
+        dia += timedelta(days=1)
+    return dias
+
+
+class OcupacaoCache:
+    """Intervalos ocupados por (dia, recurso), onde recurso e ("sala", nome) ou ("responsavel", id).
+
+    Invalidado por `invalidar` a cada agendamento criado ou alterado naquele dia;
+    o TTL limita a defasagem entre processos.
+
+    Uma leitura que consultou o banco antes de um `invalidar` concorrente nao pode
+    gravar o resultado depois dele: quem le pega `geracao(chave)` antes da consulta
+    e `put` so grava se ela nao mudou. `invalidar` troca a geracao das chaves
+    tocadas; as geracoes esquecidas (LRU) valem `_piso`, sempre maior que qualquer
+    uma ja descartada.
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[tuple, tuple[float, list[Intervalo]]]" = OrderedDict()
+        self._geracoes: "OrderedDict[tuple, int]" = OrderedDict()
+        self._contador = 0
+        self._piso = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, chave: tuple) -> Optional[list[Intervalo]]:
+        with self._lock:
+            entry = self._entries.get(chave)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(chave)
+                self.hits += 1
+                return entry[1]
+            self._entries.pop(chave, None)
+            self.misses += 1
+            return None
+
+    def geracao(self, chave: tuple) -> int:
+        with self._lock:
+            return self._geracoes.get(chave, self._piso)
+
+    def put(self, chave: tuple, intervalos: list[Intervalo], geracao: int) -> None:
+        with self._lock:
+            if self._geracoes.get(chave, self._piso) != geracao:
+                # Invalidado enquanto a consulta rodava: o resultado pode nao ter o agendamento novo
+                return
+            self._entries[chave] = (time.monotonic() + self.ttl_seconds, intervalos)
+            self._entries.move_to_end(chave)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidar(self, inicio: datetime, fim: datetime, sala: Optional[str], responsavel_id: Optional[int]) -> None:
+        recursos = []
+        if sala:
+            recursos.append(("sala", sala))
+        if responsavel_id is not None:
+            recursos.append(("responsavel", responsavel_id))
+        with self._lock:
+            for dia in _dias_tocados(_utc(inicio), _utc(fim), ZoneInfo(settings.clinic_timezone)):
+                for recurso in recursos:
+                    self._entries.pop((dia, recurso), None)
+                    self._contador += 1
+                    self._geracoes[(dia, recurso)] = self._contador
+                    self._geracoes.move_to_end((dia, recurso))
+            while len(self._geracoes) > self.maxsize:
+                _, descartada = self._geracoes.popitem(last=False)
+                self._piso = max(self._piso, descartada)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+ocupacao_cache = OcupacaoCache(
+    maxsize=settings.availability_cache_size,
+    ttl_seconds=settings.availability_cache_ttl_seconds,
+)
+
+
+async def _carregar_ocupacao(db, dias: list[date], recursos: list[tuple], tz: ZoneInfo) -> dict:
+    """Busca numa unica consulta os agendamentos dos (dia, recurso) ausentes do cache."""
+    janela_inicio = datetime.combine(min(dias), dt_time.min, tz).astimezone(timezone.utc)
+    janela_fim = datetime.combine(max(dias) + timedelta(days=1), dt_time.min, tz).astimezone(timezone.utc)
+
+    filtros = []
+    salas = [valor for tipo, valor in recursos if tipo == "sala"]
+    responsaveis = [valor for tipo, valor in recursos if tipo == "responsavel"]
+    if salas:
+        filtros.append(Agendamento.sala.in_(salas))
+    if responsaveis:
+        filtros.append(Agendamento.responsavel_id.in_(responsaveis))
+
+    ocupado: dict[tuple, list[Intervalo]] = {(dia, recurso): [] for dia in dias for recurso in recursos}
+    # Antes da consulta: um invalidar que chegue durante ela descarta o put abaixo
+    geracoes = {chave: ocupacao_cache.geracao(chave) for chave in ocupado}
+    result = await db.execute(
+        select(Agendamento.data_hora_inicio, Agendamento.data_hora_fim, Agendamento.sala, Agendamento.responsavel_id)
+        .where(
+            Agendamento.data_hora_inicio < janela_fim,
+            Agendamento.data_hora_inicio > janela_inicio - DURACAO_MAXIMA,
+            Agendamento.data_hora_fim > janela_inicio,
+            Agendamento.status != STATUS_CANCELADO,
+            Agendamento.deleted_at.is_(None),
+            or_(*filtros),
+        )
+        .order_by(Agendamento.data_hora_inicio)
+    )
+
+    for inicio, fim, sala, responsavel_id in result.all():
+        inicio, fim = _utc(inicio), _utc(fim)
+        for dia in _dias_tocados(inicio, fim, tz):
+            for recurso in (("sala", sala), ("responsavel", responsavel_id)):
+                if (dia, recurso) in ocupado:
+                    ocupado[(dia, recurso)].append((inicio, fim))
+    for chave, intervalos in ocupado.items():
+        ocupacao_cache.put(chave, intervalos, geracoes[chave])
+    return ocupado
+
+
+def intervalos_livres(
+    janela: Intervalo, ocupados: list[Intervalo], duracao: timedelta
+) -> list[Intervalo]:
+    """Varredura sobre os intervalos ocupados ordenados: devolve as lacunas >= duracao."""
+    livres = []
+    cursor, fim_janela = janela
+    for inicio, fim in sorted(ocupados):
+        if inicio >= fim_janela:
+            break
+        if inicio - cursor >= duracao:
+            livres.append((cursor, inicio))
+        cursor = max(cursor, fim)
+        if cursor >= fim_janela:
+            return livres
+    if fim_janela - cursor >= duracao:
+        livres.append((cursor, fim_janela))
+    return livres
+
+
+async def calcular_disponibilidade(
+    db,
+    inicio: date,
+    fim: date,
+    duracao: timedelta,
+    salas: list[str],
+    responsavel_id: Optional[int],
+    hora_inicio: dt_time,
+    hora_fim: dt_time,
+    dias_semana: set[int],
+) -> list[dict]:
+    tz = ZoneInfo(settings.clinic_timezone)
+    dias = []
+    dia = inicio
+    while dia <= fim:
+        if dia.weekday() in dias_semana:
+            dias.append(dia)
+        dia += timedelta(days=1)
+
+    recursos = [("sala", sala) for sala in salas]
+    if responsavel_id is not None:
+        recursos.append(("responsavel", responsavel_id))
+
+    ocupacao = {(dia, recurso): ocupacao_cache.get((dia, recurso)) for dia in dias for recurso in recursos}
+    ausentes = sorted({dia for (dia, _), intervalos in ocupacao.items() if intervalos is None})
+    if ausentes:
+        ocupacao.update(await _carregar_ocupacao(db, ausentes, recursos, tz))
+
+    resultado = []
+    for sala in salas or [None]:
+        livres = []
+        for dia in dias:
+            janela = (
+                datetime.combine(dia, hora_inicio, tz).astimezone(timezone.utc),
+                datetime.combine(dia, hora_fim, tz).astimezone(timezone.utc),
+            )
+            ocupados = []
+            if sala is not None:
+                ocupados.extend(ocupacao[(dia, ("sala", sala))])
+            if responsavel_id is not None:
+                ocupados.extend(ocupacao[(dia, ("responsavel", responsavel_id))])
+            livres.extend(intervalos_livres(janela, ocupados, duracao))
+        resultado.append(
+            {
+                "sala": sala,
+                "responsavel_id": responsavel_id,
+                "livres": [{"inicio": a, "fim": b} for a, b in livres],
+            }
+        )
+    return resultado
@@ -0,0 +1,244 @@
+"""Cache das respostas das listagens e do resumo financeiro, versionado por usuario.
+
+O mesmo medico abre o app varias vezes por hora e as listagens repetiam as
+mesmas consultas. Agora a resposta (corpo JSON ja serializado e cabecalhos,
+ETag incluso) fica em cache pela chave (rota, usuario, query string, versao).
+
+- A versao vem de `versoes_dados`: toda rota de escrita chama
+  `incrementar_versao` antes do commit, na mesma transacao, para o responsavel
+  das linhas que mudou (0 para linhas sem responsavel, vistas por todos). A
+  chave usa a versao do usuario e a versao 0.
+- A rota le a versao antes de consultar os dados, na mesma sessao (replica ou
+  primario). Uma escrita confirmada muda a chave, entao uma entrada antiga
+  nunca e servida depois dela, em nenhum processo; as entradas velhas apenas
+  deixam de ser lidas e saem pelo LRU/TTL. Um acerto custa a leitura da versao
+  (uma linha pela PK) em vez da consulta e da serializacao.
+- Escritas feitas fora das rotas (scripts, SQL manual) nao mudam a versao: o
+  RESPONSE_CACHE_TTL_SECONDS limita por quanto tempo elas ficam invisiveis.
+
+Backends (RESPONSE_CACHE_BACKEND):
+
+- "memory" (padrao): LRU no processo, limitado a RESPONSE_CACHE_MAX_BYTES.
+- "redis": qualquer servidor que fale o protocolo do Redis em
+  RESPONSE_CACHE_REDIS_URL, compartilhado entre workers. Precisa do pacote
+  `redis`; o limite de memoria e a politica de despejo sao os do servidor
+  (maxmemory + allkeys-lru). Para desenvolvimento serve qualquer servidor local
+  compativel (redis-server, valkey ou o TcpFakeServer do pacote fakeredis).
+  Erros do Redis viram falta de cache, nunca erro na rota.
+- "off": desliga o cache (a versao continua sendo mantida nas escritas).
+
+Acertos, faltas, taxa de acerto e memoria usada ficam em /internal/response-cache.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+from urllib.parse import urlencode
+
+import orjson
+from fastapi import Request, Response
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from config import settings
+from models import VersaoDados
+from serializacao import cabecalhos_condicionais, dumps, responder_corpo
+
+logger = logging.getLogger(__name__)
+
+# Versao das linhas sem responsavel (pacientes/transacoes compartilhados)
+COMPARTILHADO = 0
+
+
+async def incrementar_versao(db, *responsavel_ids: Optional[int]) -> None:
+    """Avanca a versao dos responsaveis (None = linhas compartilhadas); o commit fica com o chamador."""
+    # Ordenados: duas transacoes que tocam os mesmos usuarios travam as linhas na mesma ordem
+    ids = sorted({COMPARTILHADO if r is None else r for r in responsavel_ids})
+    insert_fn = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    stmt = insert_fn(VersaoDados).values([{"responsavel_id": r, "versao": 1} for r in ids])
+    await db.execute(
+        stmt.on_conflict_do_update(index_elements=["responsavel_id"], set_={"versao": VersaoDados.versao + 1})
+    )
+
+
+async def versao_dos_dados(db, usuario_id: int) -> tuple[int, int]:
+    """(versao do usuario, versao compartilhada); leia antes de consultar os dados."""
+    result = await db.execute(
+        select(VersaoDados.responsavel_id, VersaoDados.versao).where(
+            VersaoDados.responsavel_id.in_((usuario_id, COMPARTILHADO))
+        )
+    )
+    versoes = dict(result.all())
+    return versoes.get(usuario_id, 0), versoes.get(COMPARTILHADO, 0)
+
+
+# --- Backends ----------------------------------------------------------------
+
+class BackendMemoria:
+    """LRU no processo, limitado pelo tamanho somado dos valores."""
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple[float, bytes]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    async def obter(self, chave: str) -> Optional[bytes]:
+        with self._lock:
+            entrada = self._entries.get(chave)
+            if entrada is None:
+                return None
+            expira_em, valor = entrada
+            if expira_em < time.monotonic():
+                self._remover(chave)
+                return None
+            self._entries.move_to_end(chave)
+            return valor
+
+    async def guardar(self, chave: str, valor: bytes) -> None:
+        if len(valor) > self.max_bytes:
+            return
+        with self._lock:
+            if chave in self._entries:
+                self._remover(chave)
+            self._entries[chave] = (time.monotonic() + self.ttl, valor)
+            self._bytes += len(valor)
+            while self._bytes > self.max_bytes:
+                self._remover(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remover(self, chave: str) -> None:
+        _, valor = self._entries.pop(chave)
+        self._bytes -= len(valor)
+
+    async def memoria(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "used_bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+            }
+
+    async def fechar(self) -> None:
+        pass
+
+
+class BackendRedis:
+    """GET/SET com expiracao num servidor que fale o protocolo do Redis."""
+
+    PREFIXO = "aura:resp:"
+
+    def __init__(self, url: str, ttl: float):
+        import redis.asyncio as redis  # dependencia opcional: so com RESPONSE_CACHE_BACKEND=redis
+
+        self.ttl = ttl
+        self._cliente = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    async def obter(self, chave: str) -> Optional[bytes]:
+        return await self._cliente.get(self.PREFIXO + chave)
+
+    async def guardar(self, chave: str, valor: bytes) -> None:
+        await self._cliente.set(self.PREFIXO + chave, valor, px=int(self.ttl * 1000))
+
+    async def memoria(self) -> dict:
+        info = await self._cliente.info("memory")
+        return {
+            "used_bytes": info.get("used_memory"),
+            "max_bytes": info.get("maxmemory") or None,
+            "eviction_policy": info.get("maxmemory_policy"),
+        }
+
+    async def fechar(self) -> None:
+        await self._cliente.aclose()
+
+
+# --- Cache -------------------------------------------------------------------
+
+class CacheRespostas:
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "backend_errors": 0}
+
+    def _contar(self, nome: str) -> None:
+        with self._lock:
+            self._stats[nome] += 1
+
+    @staticmethod
+    def chave(request: Request, usuario_id: int, versoes: tuple[int, int]) -> str:
+        rota = getattr(request.scope.get("route"), "path", request.url.path)
+        consulta = urlencode(sorted(request.query_params.multi_items()))
+        # Usuario e versao fora do hash: da para ver no Redis (SCAN) quais entradas ficaram velhas
+        resumo = hashlib.sha256(f"{request.method} {rota}?{consulta}".encode()).hexdigest()[:32]
+        return f"{usuario_id}:{versoes[0]}.{versoes[1]}:{resumo}"
+
+    async def obter(self, request: Request, usuario_id: int, versoes: tuple[int, int]) -> Optional[Response]:
+        """Resposta em cache (ou 304) para esta versao; None se for preciso consultar."""
+        if self.backend is None:
+            return None
+        try:
+            valor = await self.backend.obter(self.chave(request, usuario_id, versoes))
+        except Exception as exc:
+            logger.warning("cache de respostas indisponivel (%s)", type(exc).__name__)
+            self._contar("backend_errors")
+            valor = None
+        if valor is None:
+            self._contar("misses")
+            return None
+        self._contar("hits")
+        cabecalhos, corpo = valor.split(b"\n", 1)
+        return responder_corpo(request, corpo, orjson.loads(cabecalhos))
+
+    async def responder(
+        self, request: Request, usuario_id: int, versoes: tuple[int, int], conteudo: Any,
+        headers: Optional[dict] = None,
+    ) -> Response:
+        """Serializa `conteudo` uma vez, guarda no cache e responde (com ETag/304)."""
+        corpo = dumps(conteudo)
+        cabecalhos = cabecalhos_condicionais(corpo, headers)
+        if self.backend is not None:
+            try:
+                valor = dumps(cabecalhos) + b"\n" + corpo
+                await self.backend.guardar(self.chave(request, usuario_id, versoes), valor)
+                self._contar("stores")
+            except Exception as exc:
+                logger.warning("cache de respostas indisponivel (%s)", type(exc).__name__)
+                self._contar("backend_errors")
+        return responder_corpo(request, corpo, cabecalhos)
+
+    async def snapshot(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        consultas = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / consultas, 4) if consultas else None
+        stats["backend"] = settings.response_cache_backend
+        if self.backend is not None:
+            try:
+                stats["memory"] = await self.backend.memoria()
+            except Exception as exc:
+                stats["memory"] = {"error": type(exc).__name__}
+        return stats
+
+    async def fechar(self) -> None:
+        if self.backend is not None:
+            await self.backend.fechar()
+
+
+def _criar_backend():
+    tipo = settings.response_cache_backend
+    if tipo == "memory":
+        return BackendMemoria(settings.response_cache_max_bytes, settings.response_cache_ttl_seconds)
+    if tipo == "redis":
+        return BackendRedis(settings.response_cache_redis_url, settings.response_cache_ttl_seconds)
+    if tipo == "off":
+        return None
+    raise ValueError(f"RESPONSE_CACHE_BACKEND invalido: {tipo!r} (use memory, redis ou off)")
+
+
+cache_respostas = CacheRespostas(_criar_backend())
@@ -1,25 +1,240 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+import re
+import unicodedata
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import CursorResult
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
 
 from config import settings
+from db_pool import PoolStats, engine_kwargs
+from metricas import instrumentar_engine
 
 # --- CORREÇÃO IMPORTANTE PARA FLY.IO ---
 # O Fly.io pode fornecer a URL como "postgres://...", mas o SQLAlchemy
 # moderno exige "postgresql://...". Esta linha corrige isso automaticamente.
-db_url = settings.database_url
-if db_url and db_url.startswith("postgres://"):
-    db_url = db_url.replace("postgres://", "postgresql://", 1)
+def _normalizar_url(url: str) -> str:
+    if url and url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql://", 1)
+    return url
+
+
+db_url = _normalizar_url(settings.database_url)
+
+
+def _async_url(url: str) -> str:
+    """Troca o driver sincrono pelo equivalente assincrono (asyncpg / aiosqlite)."""
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    if url.startswith("postgresql+psycopg2://"):
+        return url.replace("postgresql+psycopg2://", "postgresql+asyncpg://", 1)
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    return url
+
+
+def remover_acentos(texto):
+    if texto is None:
+        return None
+    return "".join(c for c in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(c))
+
+
+def _sqlite_digitos(texto):
+    return None if texto is None else re.sub(r"\D", "", texto)
+
+
+def _registrar_funcoes_sqlite(dbapi_connection, connection_record) -> None:
+    # Equivalentes das funcoes f_unaccent / f_digitos criadas no Postgres pela migracao 0007
+    dbapi_connection.create_function("f_unaccent", 1, remover_acentos, deterministic=True)
+    dbapi_connection.create_function("f_digitos", 1, _sqlite_digitos, deterministic=True)
+
+
+pool_stats = PoolStats()
+async_pool_stats = PoolStats()
+
+# Engine sincrona: usada pelo Alembic, pelos scripts e pelas rotas quando DATABASE_ASYNC=false
+_sync_url, _sync_kwargs = engine_kwargs(db_url, pool_stats)
+engine = create_engine(_sync_url, **_sync_kwargs)
+instrumentar_engine(engine)
+if engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", _registrar_funcoes_sqlite)
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 
-# Cria a engine com a URL corrigida
-engine = create_engine(db_url, pool_pre_ping=True)
+# Engine assincrona: caminho padrao das rotas (nao ocupa o threadpool enquanto espera o banco)
+async_engine = None
+if settings.database_async:
+    _async_db_url, _async_kwargs = engine_kwargs(_async_url(db_url), async_pool_stats, assincrono=True)
+    async_engine = create_async_engine(_async_db_url, **_async_kwargs)
+    instrumentar_engine(async_engine.sync_engine)
+if async_engine is not None and async_engine.dialect.name == "sqlite":
+    event.listen(async_engine.sync_engine, "connect", _registrar_funcoes_sqlite)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = (
+    async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False) if async_engine is not None else None
+)
 
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
+
+class Replica:
+    """Replica de leitura: engine propria (assincrona ou sincrona, como a principal) e seu pool.
+
+    Quem decide quando uma leitura pode ir para a replica e `replicas.py`.
+    """
+
+    def __init__(self, nome: str, url: str):
+        self.nome = nome
+        self.pool_stats = PoolStats()
+        url = _normalizar_url(url)
+        if settings.database_async:
+            url, kwargs = engine_kwargs(_async_url(url), self.pool_stats, assincrono=True)
+            self.engine = create_async_engine(url, **kwargs)
+            self.sync_engine = self.engine.sync_engine
+            self._sessoes = async_sessionmaker(self.engine, autoflush=False, expire_on_commit=False)
+        else:
+            url, kwargs = engine_kwargs(url, self.pool_stats)
+            self.engine = self.sync_engine = create_engine(url, **kwargs)
+            self._sessoes = sessionmaker(autoflush=False, expire_on_commit=False, bind=self.engine)
+        instrumentar_engine(self.sync_engine)
+        if self.sync_engine.dialect.name == "sqlite":
+            event.listen(self.sync_engine, "connect", _registrar_funcoes_sqlite)
+
+
+replicas = [Replica(f"replica{i}", url) for i, url in enumerate(settings.database_replica_urls)]
+
+
+class SyncStreamResult:
+    """Resultado de `SyncSessionAdapter.stream`: le o cursor do servidor em lotes no threadpool."""
+
+    def __init__(self, result):
+        self._result = result
+
+    async def partitions(self, size=None):
+        while True:
+            rows = await run_in_threadpool(self._result.fetchmany, size)
+            if not rows:
+                return
+            yield rows
+
+    async def close(self) -> None:
+        await run_in_threadpool(self._result.close)
+
+
+class SyncSessionAdapter:
+    """Expõe uma Session sincrona com a interface awaitable da AsyncSession.
+
+    Cada operacao de I/O roda no threadpool, permitindo que as rotas `async def`
+    funcionem sem driver assincrono quando DATABASE_ASYNC=false.
+    """
+
+    def __init__(self, session: Session):
+        self.sync_session = session
+
+    def add(self, instance) -> None:
+        self.sync_session.add(instance)
+
+    def add_all(self, instances) -> None:
+        self.sync_session.add_all(instances)
+
+    def get_bind(self):
+        return self.sync_session.get_bind()
+
+    def _execute_buffered(self, statement, params=None, **kwargs):
+        # Consome o cursor ainda no threadpool: o resultado devolvido ao event loop nao faz I/O
+        result = self.sync_session.execute(statement, params, **kwargs)
+        if isinstance(result, CursorResult) and not result.returns_rows:
+            return result
+        return result.freeze()()
+
+    async def execute(self, statement, params=None, **kwargs):
+        return await run_in_threadpool(self._execute_buffered, statement, params, **kwargs)
+
+    async def stream(self, statement, params=None, **kwargs):
+        statement = statement.execution_options(stream_results=True)
+        result = await run_in_threadpool(self.sync_session.execute, statement, params, **kwargs)
+        return SyncStreamResult(result)
+
+    async def scalar(self, statement, params=None, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalar, statement, params, **kwargs)
+
+    async def scalars(self, statement, params=None, **kwargs):
+        result = await self.execute(statement, params, **kwargs)
+        return result.scalars()
+
+    async def get(self, entity, ident, **kwargs):
+        return await run_in_threadpool(self.sync_session.get, entity, ident, **kwargs)
+
+    async def delete(self, instance) -> None:
+        await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def flush(self) -> None:
+        await run_in_threadpool(self.sync_session.flush)
+
+    async def commit(self) -> None:
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self) -> None:
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def refresh(self, instance, attribute_names=None) -> None:
+        await run_in_threadpool(self.sync_session.refresh, instance, attribute_names)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+    async def close(self) -> None:
+        await run_in_threadpool(self.sync_session.close)
+
+
+@asynccontextmanager
+async def open_session(replica: Optional[Replica] = None):
+    """Sessao (assincrona ou adaptada) fechada ao sair do bloco.
+
+    Use direto quando o trabalho sobrevive a requisicao, como no corpo de uma
+    StreamingResponse; nas rotas, prefira a dependencia `get_db`. Com `replica`,
+    a sessao usa a engine dela (so leitura; ver replicas.py).
+    """
+    if replica is not None:
+        fabrica = replica._sessoes
+    else:
+        fabrica = AsyncSessionLocal if settings.database_async else SessionLocal
+    if settings.database_async:
+        async with fabrica() as db:
+            yield db
+        return
+
+    db = SyncSessionAdapter(fabrica())
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        await db.close()
+
+
+def violou_unicidade(exc: IntegrityError, tabela: str, coluna: str) -> bool:
+    """Se o IntegrityError veio da restricao de unicidade de `tabela.coluna`.
+
+    SQLite cita "tabela.coluna"; o Postgres cita a constraint (tabela_coluna_key,
+    ou o indice unico ix_tabela_coluna) e, no DETAIL, "Key (coluna)=".
+    """
+    texto = str(exc.orig)
+    marcas = (f"{tabela}.{coluna}", f'"{tabela}_{coluna}_key"', f'"ix_{tabela}_{coluna}"', f"Key ({coluna})=")
+    return any(marca in texto for marca in marcas)
+
+
+def pool_snapshot() -> dict:
+    snapshot = {"sync": pool_stats.snapshot(engine.pool)}
+    if async_engine is not None:
+        snapshot["async"] = async_pool_stats.snapshot(async_engine.pool)
+    for replica in replicas:
+        snapshot[replica.nome] = replica.pool_stats.snapshot(replica.engine.pool)
+    return snapshot
+
+
+async def get_db():
+    async with open_session() as db:
+        yield db
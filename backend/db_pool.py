@@ -0,0 +1,98 @@
+"""Configuracao e instrumentacao dos pools de conexao do banco.
+
+Tamanho, overflow, recycle, timeout e pre-ping vem de `config.Settings`. Com
+DB_PGBOUNCER=true o pooling fica com o PgBouncer (modo transaction): a aplicacao
+usa NullPool e desliga os prepared statements do asyncpg, que nao sobrevivem a
+troca de conexao no servidor entre uma transacao e outra.
+
+Cada pool mede quanto os checkouts esperam por uma conexao (inclui abrir uma
+conexao nova quando o pool ainda nao chegou ao limite) e quantos estouram o
+timeout; `snapshot` junta isso aos gauges do proprio pool para /internal/db-pool.
+"""
+import threading
+import time
+from uuid import uuid4
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, Pool, QueuePool
+
+from config import settings
+
+
+class PoolStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "checkout_wait_seconds_total": 0.0,
+            "checkout_wait_seconds_max": 0.0,
+        }
+
+    def registrar(self, espera: float, timeout: bool = False) -> None:
+        with self._lock:
+            self._stats["timeouts" if timeout else "checkouts"] += 1
+            self._stats["checkout_wait_seconds_total"] += espera
+            self._stats["checkout_wait_seconds_max"] = max(self._stats["checkout_wait_seconds_max"], espera)
+
+    def snapshot(self, pool: Pool) -> dict:
+        gauges = {"pool": type(pool).__name__}
+        # NullPool nao mantem conexoes: so ha contadores
+        if isinstance(pool, QueuePool):
+            gauges.update(
+                size=pool.size(),
+                max_overflow=settings.db_max_overflow,
+                checked_out=pool.checkedout(),
+                checked_in=pool.checkedin(),
+                overflow=max(pool.overflow(), 0),
+            )
+        with self._lock:
+            return {**gauges, **self._stats}
+
+
+def _pool_medido(base: type[Pool], stats: PoolStats) -> type[Pool]:
+    # _do_get e o ponto onde o checkout espera na fila ou abre uma conexao nova
+    class PoolMedido(base):
+        def _do_get(self):
+            inicio = time.perf_counter()
+            try:
+                conexao = super()._do_get()
+            except PoolTimeoutError:
+                stats.registrar(time.perf_counter() - inicio, timeout=True)
+                raise
+            stats.registrar(time.perf_counter() - inicio)
+            return conexao
+
+    PoolMedido.__name__ = f"{base.__name__}Medido"
+    return PoolMedido
+
+
+def engine_kwargs(url: str, stats: PoolStats, assincrono: bool = False) -> tuple[str, dict]:
+    """URL e argumentos de create_engine/create_async_engine conforme as configuracoes."""
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        # Banco em memoria: o pool padrao (uma conexao por thread) e o que mantem os dados
+        return url, {}
+
+    if settings.db_pgbouncer:
+        kwargs = {"poolclass": _pool_medido(NullPool, stats)}
+        if parsed.get_driver_name() == "asyncpg":
+            url = parsed.update_query_dict({"prepared_statement_cache_size": "0"}).render_as_string(
+                hide_password=False
+            )
+            kwargs["connect_args"] = {
+                "statement_cache_size": 0,
+                # Nomes unicos: o statement de uma transacao pode cair em outra conexao do servidor
+                "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+            }
+        return url, kwargs
+
+    return url, {
+        "poolclass": _pool_medido(AsyncAdaptedQueuePool if assincrono else QueuePool, stats),
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_recycle": settings.db_pool_recycle_seconds,
+        "pool_timeout": settings.db_pool_timeout_seconds,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
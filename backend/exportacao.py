@@ -0,0 +1,104 @@
+"""Exportacao em CSV/NDJSON com memoria constante.
+
+A consulta roda num cursor do servidor (`yield_per`/`stream_results`) e cada lote
+de linhas e codificado e enviado antes do proximo ser lido, entao o consumo de
+memoria depende de LOTE, nao do total exportado.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+from typing import AsyncIterator, Optional
+from zoneinfo import ZoneInfo
+
+from fastapi.responses import StreamingResponse
+
+from config import settings
+from database import Replica, open_session
+
+LOTE = 2_000
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def inicio_do_dia(dia: date) -> datetime:
+    """Meia-noite do dia no fuso da clinica, para filtros por data inclusivos."""
+    return datetime.combine(dia, time.min, ZoneInfo(settings.clinic_timezone)).astimezone(timezone.utc)
+
+
+def fim_do_dia(dia: date) -> datetime:
+    return inicio_do_dia(dia + timedelta(days=1))
+
+
+def _iso(valor: date) -> str:
+    # SQLite devolve datetimes sem fuso; todos os horarios sao gravados em UTC
+    if isinstance(valor, datetime) and valor.tzinfo is None:
+        valor = valor.replace(tzinfo=timezone.utc)
+    return valor.isoformat()
+
+
+def _celula(valor):
+    if valor is None:
+        return ""
+    if isinstance(valor, date):
+        return _iso(valor)
+    return valor
+
+
+def _json_default(valor):
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, date):
+        return _iso(valor)
+    raise TypeError(f"Tipo nao serializavel: {type(valor).__name__}")
+
+
+async def _lotes(query, replica: Optional[Replica]) -> AsyncIterator[list]:
+    # Sessao propria: o corpo e gerado depois que a rota (e o get_db dela) ja retornou
+    async with open_session(replica) as db:
+        result = await db.stream(query.execution_options(yield_per=LOTE))
+        try:
+            async for lote in result.partitions(LOTE):
+                yield lote
+        finally:
+            await result.close()
+
+
+async def _csv(colunas: list[str], lotes: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(colunas)
+    yield buffer.getvalue().encode()
+    async for lote in lotes:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_celula(v) for v in linha] for linha in lote)
+        yield buffer.getvalue().encode()
+
+
+async def _ndjson(colunas: list[str], lotes: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    async for lote in lotes:
+        yield "".join(
+            json.dumps(dict(zip(colunas, linha)), default=_json_default, ensure_ascii=False) + "\n"
+            for linha in lote
+        ).encode()
+
+
+def exportar(
+    query, formato: str, nome: str, colunas: Optional[list[str]] = None, replica: Optional[Replica] = None
+) -> StreamingResponse:
+    """StreamingResponse com o resultado de `query`; as colunas saem na ordem do select.
+
+    `replica`: onde ler (ver replicas.replica_de_leitura); None le do primario.
+    """
+    colunas = colunas or [c.key for c in query.selected_columns]
+    codificar = _ndjson if formato == "ndjson" else _csv
+    return StreamingResponse(
+        codificar(colunas, _lotes(query, replica)),
+        media_type=MEDIA_TYPES[formato],
+        headers={"Content-Disposition": f'attachment; filename="{nome}.{formato}"'},
+    )
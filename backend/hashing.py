@@ -0,0 +1,121 @@
+"""Pool dedicado para o hashing de senhas (bcrypt) com controle de admissao.
+
+O bcrypt e propositalmente lento (~250 ms por operacao). Rodar no threadpool do
+Starlette deixaria um pico de logins sem slots para as demais rotas, entao as
+operacoes vao para um executor proprio, de tamanho fixo. Quando a fila enche a
+requisicao e recusada na hora com 503 em vez de esperar indefinidamente.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from config import settings
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.bcrypt_rounds)
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_and_update(plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    """Verifica a senha e, se o hash usa parametros antigos, devolve um novo hash."""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+def _aquecer() -> None:
+    # Carrega (e autotesta) o backend do bcrypt no worker; no ProcessPool, em cada processo
+    pwd_context.dummy_verify()
+
+
+def _timed(fn, *args):
+    # time.monotonic e comparavel entre processos no Linux, entao serve tambem para o ProcessPool
+    inicio = time.monotonic()
+    result = fn(*args)
+    return result, inicio, time.monotonic()
+
+
+class PasswordHashPool:
+    def __init__(self, workers: int, max_queue: int, kind: str = "thread"):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.kind = kind
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self._pendentes = 0
+        self._stats = {
+            "jobs": 0,
+            "rejected": 0,
+            "queue_wait_seconds_total": 0.0,
+            "queue_wait_seconds_max": 0.0,
+            "hash_seconds_total": 0.0,
+            "hash_seconds_max": 0.0,
+        }
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self._pendentes >= self.workers + self.max_queue:
+                self._stats["rejected"] += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Servidor ocupado, tente novamente em instantes",
+                    headers={"Retry-After": "1"},
+                )
+            self._pendentes += 1
+
+        enviado = time.monotonic()
+        try:
+            future = self._get_executor().submit(_timed, fn, *args)
+            result, inicio, fim = await asyncio.wrap_future(future)
+        finally:
+            with self._lock:
+                self._pendentes -= 1
+
+        espera, duracao = max(inicio - enviado, 0.0), fim - inicio
+        with self._lock:
+            self._stats["jobs"] += 1
+            self._stats["queue_wait_seconds_total"] += espera
+            self._stats["queue_wait_seconds_max"] = max(self._stats["queue_wait_seconds_max"], espera)
+            self._stats["hash_seconds_total"] += duracao
+            self._stats["hash_seconds_max"] = max(self._stats["hash_seconds_max"], duracao)
+        return result
+
+    async def aquecer(self) -> None:
+        """Sobe os workers e tira o custo frio do bcrypt antes do primeiro login (fora das stats)."""
+        executor = self._get_executor()
+        await asyncio.gather(*(asyncio.wrap_future(executor.submit(_aquecer)) for _ in range(self.workers)))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "in_flight": self._pendentes,
+                **self._stats,
+            }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+password_pool = PasswordHashPool(
+    workers=settings.password_hash_workers,
+    max_queue=settings.password_hash_max_queue,
+    kind=settings.password_hash_pool,
+)
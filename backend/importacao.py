@@ -0,0 +1,224 @@
+"""Importacao em massa de pacientes (POST /pacientes/bulk).
+
+O corpo (CSV com cabecalho ou NDJSON) e lido em pedacos e cada lote de linhas
+validas vai para uma tabela temporaria via COPY (Postgres) ou executemany
+(SQLite). No fim, uma unica consulta marca os CPFs repetidos no arquivo ou ja
+cadastrados e um INSERT ... SELECT copia o restante para `pacientes`, tudo na
+mesma transacao.
+"""
+import codecs
+import csv
+import io
+import json
+import re
+from typing import AsyncIterator, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Paciente, utcnow
+
+STAGING = "pacientes_import"
+COLUNAS = ["linha", "nome", "telefone", "email", "cpf"]
+DEFINICAO_STAGING = "(linha integer, nome text, telefone text, email text, cpf text, erro text)"
+LOTE = 5_000
+# O relatorio lista no maximo este numero de erros; `rejeitadas` traz o total
+MAX_ERROS = 1_000
+
+FORMATOS = {
+    "text/csv": "csv",
+    "application/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/x-jsonlines": "ndjson",
+}
+
+_limites = {
+    "nome": Paciente.__table__.c.nome.type.length,
+    "telefone": Paciente.__table__.c.telefone.type.length,
+    "email": Paciente.__table__.c.email.type.length,
+}
+
+
+def formato_do_content_type(content_type: Optional[str]) -> str:
+    formato = FORMATOS.get((content_type or "").split(";")[0].strip().lower())
+    if formato is None:
+        raise HTTPException(status_code=415, detail="Envie text/csv ou application/x-ndjson")
+    return formato
+
+
+async def _linhas(chunks: AsyncIterator[bytes]) -> AsyncIterator[tuple[int, str]]:
+    """Quebra o stream em linhas numeradas a partir de 1, sem carregar o corpo inteiro."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    resto, numero = "", 0
+    async for chunk in chunks:
+        try:
+            resto += decoder.decode(chunk)
+        except UnicodeDecodeError:
+            raise HTTPException(status_code=400, detail="Arquivo deve estar em UTF-8")
+        *completas, resto = resto.split("\n")
+        for linha in completas:
+            numero += 1
+            yield numero, linha.rstrip("\r")
+    resto += decoder.decode(b"", final=True)
+    if resto.strip():
+        yield numero + 1, resto.rstrip("\r")
+
+
+def _validar(campos: dict) -> tuple[Optional[tuple], Optional[str]]:
+    """Normaliza uma linha; devolve (valores, None) ou (None, mensagem de erro)."""
+    valores = {}
+    for campo in ("nome", "telefone", "email", "cpf"):
+        valor = campos.get(campo)
+        if valor is not None and not isinstance(valor, str):
+            valor = str(valor)
+        valor = (valor or "").strip() or None
+        valores[campo] = valor
+
+    for campo in ("nome", "telefone"):
+        if valores[campo] is None:
+            return None, f"Campo obrigatorio ausente: {campo}"
+    for campo, limite in _limites.items():
+        if valores[campo] is not None and len(valores[campo]) > limite:
+            return None, f"Campo {campo} excede {limite} caracteres"
+    if valores["cpf"] is not None:
+        # Aceita CPF formatado (123.456.789-00); grava apenas os digitos
+        digitos = re.sub(r"\D", "", valores["cpf"])
+        if len(digitos) != 11:
+            return None, "CPF deve ter 11 digitos"
+        valores["cpf"] = digitos
+    return (valores["nome"], valores["telefone"], valores["email"], valores["cpf"]), None
+
+
+async def ler_linhas(chunks: AsyncIterator[bytes], formato: str) -> AsyncIterator[tuple[int, Optional[tuple], Optional[str]]]:
+    """Gera (numero_da_linha, valores, erro) para cada registro do arquivo."""
+    cabecalho = None
+    async for numero, linha in _linhas(chunks):
+        if not linha.strip():
+            continue
+        if formato == "ndjson":
+            try:
+                campos = json.loads(linha)
+            except ValueError:
+                yield numero, None, "JSON invalido"
+                continue
+            if not isinstance(campos, dict):
+                yield numero, None, "Cada linha deve ser um objeto JSON"
+                continue
+        else:
+            celulas = next(csv.reader([linha]))
+            if cabecalho is None:
+                cabecalho = [c.strip().lower() for c in celulas]
+                if not {"nome", "telefone"} <= set(cabecalho):
+                    raise HTTPException(status_code=400, detail="Cabecalho CSV deve conter nome e telefone")
+                continue
+            if len(celulas) != len(cabecalho):
+                yield numero, None, f"Esperadas {len(cabecalho)} colunas, recebidas {len(celulas)}"
+                continue
+            campos = dict(zip(cabecalho, celulas))
+        valores, erro = _validar(campos)
+        yield numero, valores, erro
+
+
+# --- Tabela de staging -----------------------------------------------------
+
+
+async def criar_staging(db) -> None:
+    if db.get_bind().dialect.name == "postgresql":
+        # Temporaria e descartada no commit/rollback: nada sobra na conexao do pool
+        await db.execute(text(f"CREATE TEMP TABLE {STAGING} {DEFINICAO_STAGING} ON COMMIT DROP"))
+    else:
+        await db.execute(text(f"DROP TABLE IF EXISTS temp.{STAGING}"))
+        await db.execute(text(f"CREATE TEMP TABLE {STAGING} {DEFINICAO_STAGING}"))
+
+
+def _copy_psycopg2(session, registros: list[tuple]) -> None:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(registros)
+    buffer.seek(0)
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {STAGING} ({', '.join(COLUNAS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+
+async def copiar_lote(db, registros: list[tuple]) -> None:
+    """Carrega (linha, nome, telefone, email, cpf) na staging pelo caminho mais rapido do driver."""
+    if not registros:
+        return
+    if db.get_bind().dialect.name != "postgresql":
+        await db.execute(
+            text(f"INSERT INTO {STAGING} ({', '.join(COLUNAS)}) VALUES (:linha, :nome, :telefone, :email, :cpf)"),
+            [dict(zip(COLUNAS, r)) for r in registros],
+        )
+    elif isinstance(db, AsyncSession):
+        conn = await db.connection()
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(STAGING, records=registros, columns=COLUNAS)
+    else:
+        # SyncSessionAdapter (psycopg2): COPY FROM STDIN no threadpool
+        await db.run_sync(_copy_psycopg2, registros)
+
+
+async def consolidar(db, responsavel_id: int) -> tuple[int, list[tuple[int, str]]]:
+    """Deduplica e insere o conteudo da staging; devolve (importadas, erros de CPF)."""
+    if db.get_bind().dialect.name == "postgresql":
+        await db.execute(text(f"CREATE INDEX ON {STAGING} (cpf, linha)"))
+        await db.execute(text(f"ANALYZE {STAGING}"))
+    else:
+        await db.execute(text(f"CREATE INDEX temp.ix_{STAGING}_cpf ON {STAGING} (cpf, linha)"))
+
+    # Uma unica consulta marca repetidos no arquivo (mantem a primeira ocorrencia) e ja cadastrados
+    await db.execute(text(
+        f"UPDATE {STAGING} SET erro = CASE "
+        f"  WHEN EXISTS (SELECT 1 FROM pacientes p WHERE p.cpf = {STAGING}.cpf) THEN 'CPF ja cadastrado' "
+        f"  ELSE 'CPF duplicado no arquivo' END "
+        f"WHERE cpf IS NOT NULL AND ("
+        f"  EXISTS (SELECT 1 FROM pacientes p WHERE p.cpf = {STAGING}.cpf) "
+        f"  OR EXISTS (SELECT 1 FROM {STAGING} d WHERE d.cpf = {STAGING}.cpf AND d.linha < {STAGING}.linha))"
+    ))
+    # ON CONFLICT cobre um CPF gravado por outra requisicao entre o UPDATE e o INSERT. O RETURNING
+    # diz quais CPFs entraram; as linhas com CPF que ficaram de fora ganham o erro no relatorio
+    valores = {"responsavel_id": responsavel_id, "agora": utcnow()}
+    insercao = (
+        "INSERT INTO pacientes (nome, telefone, email, cpf, data_cadastro, updated_at, responsavel_id) "
+        f"SELECT nome, telefone, email, cpf, :agora, :agora, :responsavel_id FROM {STAGING} "
+        "WHERE erro IS NULL ORDER BY linha "
+        "ON CONFLICT (cpf) DO NOTHING RETURNING cpf"
+    )
+    if db.get_bind().dialect.name == "postgresql":
+        # Um statement: o UPDATE num CTE roda mesmo sem ser referenciado no SELECT
+        importadas = await db.scalar(
+            text(
+                f"WITH novos AS ({insercao}), "
+                f"pulados AS (UPDATE {STAGING} s SET erro = 'CPF ja cadastrado' "
+                "  WHERE s.erro IS NULL AND s.cpf IS NOT NULL "
+                "  AND NOT EXISTS (SELECT 1 FROM novos n WHERE n.cpf = s.cpf)) "
+                "SELECT count(*) FROM novos"
+            ),
+            valores,
+        )
+    else:
+        # SQLite nao aceita INSERT/UPDATE dentro de WITH
+        gravados = (await db.execute(text(insercao), valores)).scalars().all()
+        importadas, gravados = len(gravados), set(gravados)
+        candidatas = await db.execute(
+            text(f"SELECT linha, cpf FROM {STAGING} WHERE erro IS NULL AND cpf IS NOT NULL")
+        )
+        pulados = [{"linha": linha} for linha, cpf in candidatas.all() if cpf not in gravados]
+        if pulados:
+            await db.execute(
+                text(f"UPDATE {STAGING} SET erro = 'CPF ja cadastrado' WHERE linha = :linha"), pulados
+            )
+    erros = await db.execute(
+        text(f"SELECT linha, erro FROM {STAGING} WHERE erro IS NOT NULL ORDER BY linha LIMIT :limite"),
+        {"limite": MAX_ERROS},
+    )
+    erros = [(linha, erro) for linha, erro in erros.all()]
+
+    if db.get_bind().dialect.name != "postgresql":
+        await db.execute(text(f"DROP TABLE temp.{STAGING}"))
+    return importadas, erros
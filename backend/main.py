@@ -1,14 +1,40 @@
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
-from fastapi import FastAPI, Request
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 
+from cache_respostas import cache_respostas
 from config import settings
-from routers import agendamentos, auth, financeiro, pacientes
+from database import pool_snapshot
+from hashing import password_pool
+from metricas import MetricasMiddleware, gauges_pool, metricas_rotas
+from particoes import manutencao_particoes
+from replicas import ConsistenciaMiddleware, roteador
+from routers import agendamentos, auth, dashboard, financeiro, internal, pacientes, sync
+from saude import aquecer, prontidao
+from write_behind import write_behind
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await aquecer()
+    write_behind.iniciar()
+    roteador.iniciar()
+    manutencao_particoes.iniciar()
+    yield
+    await manutencao_particoes.parar()
+    await roteador.parar()
+    await write_behind.parar()
+    await cache_respostas.fechar()
+    password_pool.shutdown()
+
 
 app = FastAPI(
     title=settings.app_name,
     description="API de gestao inteligente para clinicas medicas",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -17,21 +43,46 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Watermark"],
 )
+app.add_middleware(MetricasMiddleware)
+app.add_middleware(ConsistenciaMiddleware)
 
 @app.get("/")
-def health_check(request: Request):
-    db_status = "conectado" if hasattr(request.app.state, "db") else "desconectado"
-    
+async def health_check():
+    verificacao = await prontidao.verificar()
     return {
         "status": "online",
         "system": "AURA",
-        "database": db_status,
+        "database": verificacao["database"],
         "environment": settings.environment,
         "timestamp": datetime.now(timezone.utc).isoformat(),
     }
 
+
+@app.get("/health/live", include_in_schema=False)
+def liveness():
+    # Nao toca no banco: uma queda do Postgres nao deve fazer o orquestrador reiniciar a API
+    return {"status": "online"}
+
+
+@app.get("/health/ready", include_in_schema=False)
+async def readiness():
+    verificacao = await prontidao.verificar()
+    return JSONResponse(verificacao, status_code=200 if verificacao["ready"] else 503)
+
+
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(internal.require_internal_access)])
+def metrics():
+    return PlainTextResponse(
+        metricas_rotas.prometheus() + gauges_pool(pool_snapshot()), media_type="text/plain; version=0.0.4"
+    )
+
+
 app.include_router(auth.router)
 app.include_router(pacientes.router)
 app.include_router(agendamentos.router)
 app.include_router(financeiro.router)
+app.include_router(dashboard.router)
+app.include_router(sync.router)
+app.include_router(internal.router)
@@ -0,0 +1,327 @@
+"""Metricas por rota (formato Prometheus), contagem de SQL por requisicao e profiler.
+
+`MetricasMiddleware` mede cada requisicao e abre um acumulador (ContextVar) que os
+eventos do SQLAlchemy registrados por `instrumentar_engine` preenchem: numero de
+instrucoes, tempo no banco e linhas devolvidas. As linhas vem do `rowcount` do
+driver; asyncpg e psycopg2 o informam para SELECT, o SQLite nao (conta zero).
+
+Opcionais (ver config.py):
+- N_PLUS_ONE_THRESHOLD: loga as requisicoes que passam desse numero de consultas,
+  com a instrucao mais repetida (a assinatura tipica de um N+1).
+- PROFILER_SLOW_MS: amostra as pilhas das threads enquanto ha requisicoes em voo
+  e loga as mais frequentes das que passarem desse tempo. As amostras sao do
+  processo inteiro, entao com requisicoes concorrentes podem se misturar.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import lru_cache
+from itertools import count
+from typing import Optional
+
+from sqlalchemy import event
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CONSULTAS = (1, 2, 5, 10, 20, 50, 100)
+ROTA_DESCONHECIDA = "unmatched"
+
+
+@dataclass
+class ContagemSql:
+    consultas: int = 0
+    segundos: float = 0.0
+    linhas: int = 0
+    # So preenchido com a deteccao de N+1 ligada
+    instrucoes: Optional[Counter] = None
+
+
+_contagem: ContextVar[Optional[ContagemSql]] = ContextVar("contagem_sql", default=None)
+
+
+def _antes_do_cursor(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _contagem.get() is not None:
+        context._metricas_inicio = time.perf_counter()
+
+
+def _depois_do_cursor(conn, cursor, statement, parameters, context, executemany):
+    contagem = _contagem.get()
+    inicio = getattr(context, "_metricas_inicio", None)
+    if contagem is None or inicio is None:
+        return
+    contagem.consultas += 1
+    contagem.segundos += time.perf_counter() - inicio
+    if cursor.description is not None and cursor.rowcount > 0:
+        contagem.linhas += cursor.rowcount
+    if contagem.instrucoes is not None:
+        contagem.instrucoes[statement] += 1
+
+
+def instrumentar_engine(engine) -> None:
+    """Registra os eventos de contagem numa engine sincrona (ou `async_engine.sync_engine`)."""
+    event.listen(engine, "before_cursor_execute", _antes_do_cursor)
+    event.listen(engine, "after_cursor_execute", _depois_do_cursor)
+
+
+class Histograma:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.contagens = [0] * len(buckets)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor: float) -> None:
+        for i, limite in enumerate(self.buckets):
+            if valor <= limite:
+                self.contagens[i] += 1
+                break
+        self.soma += valor
+        self.total += 1
+
+    def linhas(self, nome: str, labels: str) -> list[str]:
+        saida, acumulado = [], 0
+        for limite, quantidade in zip(self.buckets, self.contagens):
+            acumulado += quantidade
+            saida.append(f'{nome}_bucket{{{labels},le="{limite}"}} {acumulado}')
+        saida.append(f'{nome}_bucket{{{labels},le="+Inf"}} {self.total}')
+        saida.append(f"{nome}_sum{{{labels}}} {self.soma}")
+        saida.append(f"{nome}_count{{{labels}}} {self.total}")
+        return saida
+
+
+@dataclass
+class _Rota:
+    latencia: Histograma = field(default_factory=lambda: Histograma(BUCKETS_LATENCIA))
+    consultas: Histograma = field(default_factory=lambda: Histograma(BUCKETS_CONSULTAS))
+    db_segundos: float = 0.0
+    linhas: int = 0
+    n_mais_um: int = 0
+    status: Counter = field(default_factory=Counter)
+
+
+def _label(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricasRotas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rotas: dict[tuple[str, str], _Rota] = {}
+
+    def registrar(self, metodo: str, rota: str, status: int, segundos: float, sql: ContagemSql, n_mais_um: bool):
+        with self._lock:
+            dados = self._rotas.get((metodo, rota))
+            if dados is None:
+                dados = self._rotas[(metodo, rota)] = _Rota()
+            dados.latencia.observar(segundos)
+            dados.consultas.observar(sql.consultas)
+            dados.db_segundos += sql.segundos
+            dados.linhas += sql.linhas
+            dados.n_mais_um += n_mais_um
+            dados.status[status] += 1
+
+    def consultas(self, metodo: str, rota: str) -> tuple[float, int]:
+        """Instrucoes SQL somadas e requisicoes registradas de uma rota (para benchmarks)."""
+        with self._lock:
+            dados = self._rotas.get((metodo, rota))
+            return (dados.consultas.soma, dados.consultas.total) if dados is not None else (0.0, 0)
+
+    def prometheus(self) -> str:
+        familias = {
+            "aura_http_requests_total": ("counter", "Requisicoes por rota e status", []),
+            "aura_http_request_duration_seconds": ("histogram", "Latencia das requisicoes por rota", []),
+            "aura_db_queries_per_request": ("histogram", "Instrucoes SQL por requisicao", []),
+            "aura_db_query_seconds_total": ("counter", "Tempo gasto no banco por rota", []),
+            "aura_db_rows_total": ("counter", "Linhas devolvidas pelo banco por rota", []),
+            "aura_db_n_plus_one_total": ("counter", "Requisicoes acima de N_PLUS_ONE_THRESHOLD", []),
+        }
+        with self._lock:
+            for (metodo, rota), dados in sorted(self._rotas.items()):
+                labels = f'method="{_label(metodo)}",route="{_label(rota)}"'
+                for status, quantidade in sorted(dados.status.items()):
+                    familias["aura_http_requests_total"][2].append(
+                        f'aura_http_requests_total{{{labels},status="{status}"}} {quantidade}'
+                    )
+                familias["aura_http_request_duration_seconds"][2].extend(
+                    dados.latencia.linhas("aura_http_request_duration_seconds", labels)
+                )
+                familias["aura_db_queries_per_request"][2].extend(
+                    dados.consultas.linhas("aura_db_queries_per_request", labels)
+                )
+                familias["aura_db_query_seconds_total"][2].append(
+                    f"aura_db_query_seconds_total{{{labels}}} {dados.db_segundos}"
+                )
+                familias["aura_db_rows_total"][2].append(f"aura_db_rows_total{{{labels}}} {dados.linhas}")
+                familias["aura_db_n_plus_one_total"][2].append(
+                    f"aura_db_n_plus_one_total{{{labels}}} {dados.n_mais_um}"
+                )
+
+        saida = []
+        for nome, (tipo, ajuda, linhas) in familias.items():
+            saida += [f"# HELP {nome} {ajuda}", f"# TYPE {nome} {tipo}", *linhas]
+        return "\n".join(saida) + "\n"
+
+
+def gauges_pool(snapshot: dict) -> str:
+    """Gauges de database.pool_snapshot() no formato Prometheus."""
+    metricas = {
+        "checked_out": ("gauge", "Conexoes em uso"),
+        "checked_in": ("gauge", "Conexoes ociosas no pool"),
+        "overflow": ("gauge", "Conexoes alem de pool_size"),
+        "checkouts": ("counter", "Checkouts concluidos"),
+        "timeouts": ("counter", "Checkouts que estouraram pool_timeout"),
+        "checkout_wait_seconds_total": ("counter", "Tempo total de espera por conexao"),
+    }
+    saida = []
+    for chave, (tipo, ajuda) in metricas.items():
+        nome = f"aura_db_pool_{chave}" + ("_total" if tipo == "counter" and not chave.endswith("_total") else "")
+        saida += [f"# HELP {nome} {ajuda}", f"# TYPE {nome} {tipo}"]
+        for engine, valores in snapshot.items():
+            if chave in valores:
+                saida.append(f'{nome}{{engine="{engine}"}} {valores[chave]}')
+    return "\n".join(saida) + "\n"
+
+
+_RAIZ = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+
+@lru_cache(maxsize=4096)
+def _arquivo(caminho: str) -> tuple[str, bool]:
+    """Nome curto do arquivo e se ele e codigo da aplicacao."""
+    _, pacote, resto = caminho.partition("site-packages" + os.sep)
+    if pacote:
+        return resto, False
+    if caminho.startswith(_RAIZ):
+        return caminho[len(_RAIZ):], True
+    return os.path.basename(caminho), False
+
+
+class AmostradorPilhas:
+    """Profiler por amostragem: uma thread le sys._current_frames() a cada intervalo."""
+
+    def __init__(self, intervalo_segundos: float, max_perfis: int = 20, max_frames: int = 25):
+        self.intervalo = intervalo_segundos
+        self.max_frames = max_frames
+        self._lock = threading.Lock()
+        self._ativas: dict[int, Counter] = {}
+        self._ids = count()
+        self._thread: Optional[threading.Thread] = None
+        self.perfis: deque = deque(maxlen=max_perfis)
+
+    def _pilha(self, frame) -> Optional[tuple]:
+        frames, da_aplicacao = [], False
+        while frame is not None and len(frames) < self.max_frames:
+            codigo = frame.f_code
+            arquivo, proprio = _arquivo(codigo.co_filename)
+            da_aplicacao = da_aplicacao or proprio
+            frames.append(f"{arquivo}:{frame.f_lineno} {codigo.co_name}")
+            frame = frame.f_back
+        # Threads ociosas (loop no select, workers na fila) nao passam por codigo da aplicacao
+        return tuple(reversed(frames)) if da_aplicacao else None
+
+    def _executar(self) -> None:
+        proprio = threading.get_ident()
+        while True:
+            time.sleep(self.intervalo)
+            with self._lock:
+                ativas = list(self._ativas.values())
+            if not ativas:
+                continue
+            pilhas = [
+                pilha
+                for ident, frame in sys._current_frames().items()
+                if ident != proprio and (pilha := self._pilha(frame)) is not None
+            ]
+            with self._lock:
+                for amostras in ativas:
+                    amostras.update(pilhas)
+
+    def iniciar(self) -> int:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._executar, name="amostrador-pilhas", daemon=True)
+                self._thread.start()
+            chave = next(self._ids)
+            self._ativas[chave] = Counter()
+            return chave
+
+    def finalizar(self, chave: int, descricao: str, segundos: float, limite_segundos: float) -> None:
+        with self._lock:
+            amostras = self._ativas.pop(chave, Counter())
+        if segundos < limite_segundos or not amostras:
+            return
+        mais_frequentes = amostras.most_common(5)
+        self.perfis.append(
+            {
+                "request": descricao,
+                "duration_ms": round(segundos * 1000, 1),
+                "samples": sum(amostras.values()),
+                "stacks": [{"samples": n, "frames": list(pilha)} for pilha, n in mais_frequentes],
+            }
+        )
+        logger.warning(
+            "Requisicao lenta %s (%.0f ms); pilhas mais amostradas:\n%s",
+            descricao,
+            segundos * 1000,
+            "\n".join(f"  {n}x {' > '.join(pilha[-6:])}" for pilha, n in mais_frequentes),
+        )
+
+
+metricas_rotas = MetricasRotas()
+amostrador = (
+    AmostradorPilhas(settings.profiler_interval_ms / 1000) if settings.profiler_slow_ms > 0 else None
+)
+
+
+class MetricasMiddleware:
+    """Middleware ASGI: latencia, status e contagem de SQL por rota."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        contagem = ContagemSql(instrucoes=Counter() if settings.n_plus_one_threshold > 0 else None)
+        token = _contagem.set(contagem)
+        amostra = amostrador.iniciar() if amostrador is not None else None
+        inicio = time.perf_counter()
+
+        async def send_com_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_com_status)
+        finally:
+            segundos = time.perf_counter() - inicio
+            _contagem.reset(token)
+            rota = getattr(scope.get("route"), "path", None) or ROTA_DESCONHECIDA
+            descricao = f"{scope['method']} {rota}"
+
+            n_mais_um = 0 < settings.n_plus_one_threshold < contagem.consultas
+            if n_mais_um:
+                instrucao, repeticoes = contagem.instrucoes.most_common(1)[0]
+                logger.warning(
+                    "Possivel N+1 em %s: %d consultas; mais repetida (%dx): %s",
+                    descricao,
+                    contagem.consultas,
+                    repeticoes,
+                    " ".join(instrucao.split())[:300],
+                )
+            metricas_rotas.registrar(scope["method"], rota, status, segundos, contagem, n_mais_um)
+            if amostra is not None:
+                amostrador.finalizar(amostra, descricao, segundos, settings.profiler_slow_ms / 1000)
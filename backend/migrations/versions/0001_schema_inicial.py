@@ -0,0 +1,96 @@
+"""schema inicial (users, pacientes, agendamentos, transacoes, password_reset_tokens)
+
+Bancos criados antes do Alembic ja possuem estas tabelas: marque-os com
+`alembic stamp 0001` antes de rodar `alembic upgrade head`.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("nome", sa.String(120), nullable=False),
+        sa.Column("email", sa.String(255), nullable=False),
+        sa.Column("hashed_password", sa.String(255), nullable=False),
+        sa.Column("role", sa.String(50), nullable=True),
+        sa.Column("telefone", sa.String(30), nullable=True),
+        sa.Column("crm", sa.String(50), nullable=True, unique=True),
+        sa.Column("is_active", sa.Boolean(), nullable=True),
+        sa.Column("last_login", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    op.create_table(
+        "pacientes",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("nome", sa.String(120), nullable=False),
+        sa.Column("telefone", sa.String(20), nullable=False),
+        sa.Column("email", sa.String(255), nullable=True),
+        sa.Column("cpf", sa.String(11), nullable=True, unique=True),
+        sa.Column("data_cadastro", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("responsavel_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=True),
+    )
+    op.create_index("ix_pacientes_id", "pacientes", ["id"])
+    op.create_index("ix_pacientes_nome", "pacientes", ["nome"])
+
+    op.create_table(
+        "agendamentos",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("paciente_id", sa.Integer(), sa.ForeignKey("pacientes.id"), nullable=False),
+        sa.Column("data_hora_inicio", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("data_hora_fim", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("tipo", sa.String(50), nullable=False),
+        sa.Column("status", sa.String(20), nullable=False),
+        sa.Column("valor_previsto", sa.Numeric(12, 2), nullable=True),
+        sa.Column("sala", sa.String(50), nullable=True),
+        sa.Column("observacoes", sa.Text(), nullable=True),
+        sa.Column("responsavel_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=True),
+    )
+    op.create_index("ix_agendamentos_id", "agendamentos", ["id"])
+    op.create_index("ix_agendamentos_data_hora_inicio", "agendamentos", ["data_hora_inicio"])
+
+    op.create_table(
+        "transacoes",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("descricao", sa.String(255), nullable=False),
+        sa.Column("valor", sa.Numeric(12, 2), nullable=False),
+        sa.Column("tipo", sa.String(20), nullable=False),
+        sa.Column("categoria", sa.String(50), nullable=False),
+        sa.Column("data_competencia", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("pago", sa.Boolean(), nullable=True),
+        sa.Column("responsavel_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=True),
+    )
+    op.create_index("ix_transacoes_id", "transacoes", ["id"])
+
+    op.create_table(
+        "password_reset_tokens",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("token_hash", sa.String(255), nullable=False),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("is_used", sa.Boolean(), nullable=True),
+    )
+    op.create_index("ix_password_reset_tokens_id", "password_reset_tokens", ["id"])
+
+
+def downgrade() -> None:
+    op.drop_table("password_reset_tokens")
+    op.drop_table("transacoes")
+    op.drop_table("agendamentos")
+    op.drop_table("pacientes")
+    op.drop_table("users")
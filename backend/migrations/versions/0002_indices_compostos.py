@@ -0,0 +1,40 @@
+"""indices compostos para os filtros das rotas de listagem
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_transacoes_responsavel_competencia",
+        "transacoes",
+        ["responsavel_id", sa.text("data_competencia DESC")],
+    )
+    op.create_index("ix_pacientes_responsavel_nome", "pacientes", ["responsavel_id", "nome"])
+    op.create_index(
+        "ix_agendamentos_responsavel_inicio", "agendamentos", ["responsavel_id", "data_hora_inicio"]
+    )
+    op.create_index("ix_agendamentos_paciente_id", "agendamentos", ["paciente_id"])
+    op.create_index(
+        "ix_password_reset_tokens_user_used_created",
+        "password_reset_tokens",
+        ["user_id", "is_used", "created_at"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_password_reset_tokens_user_used_created", table_name="password_reset_tokens")
+    op.drop_index("ix_agendamentos_paciente_id", table_name="agendamentos")
+    op.drop_index("ix_agendamentos_responsavel_inicio", table_name="agendamentos")
+    op.drop_index("ix_pacientes_responsavel_nome", table_name="pacientes")
+    op.drop_index("ix_transacoes_responsavel_competencia", table_name="transacoes")
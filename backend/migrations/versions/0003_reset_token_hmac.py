@@ -0,0 +1,32 @@
+"""tokens de recuperacao com digest HMAC indexado e contador de tentativas
+
+Os hashes bcrypt existentes nao podem ser convertidos; os tokens sao descartados
+e quem estava no meio de uma recuperacao precisa solicitar um novo codigo.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("DELETE FROM password_reset_tokens")
+    with op.batch_alter_table("password_reset_tokens") as batch:
+        batch.alter_column("token_hash", type_=sa.String(64), existing_nullable=False)
+        batch.add_column(sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"))
+    op.create_index("ix_password_reset_tokens_token_hash", "password_reset_tokens", ["token_hash"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_password_reset_tokens_token_hash", table_name="password_reset_tokens")
+    with op.batch_alter_table("password_reset_tokens") as batch:
+        batch.drop_column("attempts")
+        batch.alter_column("token_hash", type_=sa.String(255), existing_nullable=False)
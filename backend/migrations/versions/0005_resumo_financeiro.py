@@ -0,0 +1,42 @@
+"""tabela resumo_financeiro (totais incrementais de transacoes)
+
+Depois de aplicar, popule a tabela com `python -m scripts.rebuild_resumo_financeiro`.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "resumo_financeiro",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("responsavel_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=True),
+        sa.Column("mes", sa.Date(), nullable=False),
+        sa.Column("tipo", sa.String(20), nullable=False),
+        sa.Column("categoria", sa.String(50), nullable=False),
+        sa.Column("pago", sa.Boolean(), nullable=False),
+        sa.Column("total", sa.Numeric(14, 2), nullable=False),
+        sa.Column("quantidade", sa.Integer(), nullable=False),
+    )
+    op.create_index(
+        "ux_resumo_financeiro_bucket",
+        "resumo_financeiro",
+        ["responsavel_id", "mes", "tipo", "categoria", "pago"],
+        unique=True,
+        postgresql_nulls_not_distinct=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ux_resumo_financeiro_bucket", table_name="resumo_financeiro")
+    op.drop_table("resumo_financeiro")
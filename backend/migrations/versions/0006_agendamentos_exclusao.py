@@ -0,0 +1,43 @@
+"""constraints de exclusao contra sobreposicao de sala e de medico
+
+Usa btree_gist + tstzrange; so se aplica ao Postgres. A migracao falha se ja
+houver agendamentos sobrepostos: resolva-os (ou cancele) antes de aplicar.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+    op.execute(
+        """
+        ALTER TABLE agendamentos ADD CONSTRAINT ex_agendamentos_sala_horario
+        EXCLUDE USING gist (sala WITH =, tstzrange(data_hora_inicio, data_hora_fim, '[)') WITH &&)
+        WHERE (sala IS NOT NULL AND status <> 'cancelado')
+        """
+    )
+    op.execute(
+        """
+        ALTER TABLE agendamentos ADD CONSTRAINT ex_agendamentos_responsavel_horario
+        EXCLUDE USING gist (responsavel_id WITH =, tstzrange(data_hora_inicio, data_hora_fim, '[)') WITH &&)
+        WHERE (responsavel_id IS NOT NULL AND status <> 'cancelado')
+        """
+    )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute("ALTER TABLE agendamentos DROP CONSTRAINT IF EXISTS ex_agendamentos_responsavel_horario")
+    op.execute("ALTER TABLE agendamentos DROP CONSTRAINT IF EXISTS ex_agendamentos_sala_horario")
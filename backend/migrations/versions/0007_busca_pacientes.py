@@ -0,0 +1,54 @@
+"""indices de busca de pacientes (nome sem acento, telefone por prefixo)
+
+Cria pg_trgm/unaccent, as funcoes IMMUTABLE f_unaccent e f_digitos (a funcao
+unaccent do contrib e apenas STABLE e nao pode ser usada em indices) e os indices
+de expressao usados por GET /pacientes/search. So se aplica ao Postgres; no
+SQLite as mesmas funcoes sao registradas na conexao (database.py).
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+        AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$
+        """
+    )
+    op.execute(
+        r"""
+        CREATE OR REPLACE FUNCTION f_digitos(text) RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+        AS $$ SELECT regexp_replace($1, '\D', '', 'g') $$
+        """
+    )
+    # Substring (>= 3 caracteres) e similaridade no nome
+    op.execute("CREATE INDEX ix_pacientes_nome_trgm ON pacientes USING gin (lower(f_unaccent(nome)) gin_trgm_ops)")
+    # Prefixo curto do nome e do telefone (LIKE 'x%' independente da collation)
+    op.execute("CREATE INDEX ix_pacientes_nome_prefixo ON pacientes (lower(f_unaccent(nome)) text_pattern_ops)")
+    op.execute("CREATE INDEX ix_pacientes_telefone_digitos ON pacientes (f_digitos(telefone) text_pattern_ops)")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute("DROP INDEX IF EXISTS ix_pacientes_telefone_digitos")
+    op.execute("DROP INDEX IF EXISTS ix_pacientes_nome_prefixo")
+    op.execute("DROP INDEX IF EXISTS ix_pacientes_nome_trgm")
+    op.execute("DROP FUNCTION IF EXISTS f_digitos(text)")
+    op.execute("DROP FUNCTION IF EXISTS f_unaccent(text)")
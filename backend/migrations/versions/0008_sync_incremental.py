@@ -0,0 +1,64 @@
+"""updated_at/deleted_at em pacientes, agendamentos e transacoes
+
+Base do ?since= (sincronizacao incremental) e da exclusao logica. No Postgres as
+constraints de exclusao da 0006 passam a ignorar agendamentos excluidos.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+TABELAS = ("pacientes", "agendamentos", "transacoes")
+
+
+def _recriar_exclusoes(filtro_extra: str) -> None:
+    op.execute("ALTER TABLE agendamentos DROP CONSTRAINT IF EXISTS ex_agendamentos_sala_horario")
+    op.execute("ALTER TABLE agendamentos DROP CONSTRAINT IF EXISTS ex_agendamentos_responsavel_horario")
+    op.execute(
+        f"""
+        ALTER TABLE agendamentos ADD CONSTRAINT ex_agendamentos_sala_horario
+        EXCLUDE USING gist (sala WITH =, tstzrange(data_hora_inicio, data_hora_fim, '[)') WITH &&)
+        WHERE (sala IS NOT NULL AND status <> 'cancelado'{filtro_extra})
+        """
+    )
+    op.execute(
+        f"""
+        ALTER TABLE agendamentos ADD CONSTRAINT ex_agendamentos_responsavel_horario
+        EXCLUDE USING gist (responsavel_id WITH =, tstzrange(data_hora_inicio, data_hora_fim, '[)') WITH &&)
+        WHERE (responsavel_id IS NOT NULL AND status <> 'cancelado'{filtro_extra})
+        """
+    )
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    for tabela in TABELAS:
+        # SQLite nao aceita ADD COLUMN com default nao constante: recria a tabela
+        with op.batch_alter_table(tabela, recreate="always" if dialect == "sqlite" else "auto") as batch:
+            batch.add_column(
+                sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now())
+            )
+            batch.add_column(sa.Column("deleted_at", sa.DateTime(timezone=True), nullable=True))
+        op.create_index(f"ix_{tabela}_responsavel_updated", tabela, ["responsavel_id", "updated_at"])
+
+    if dialect == "postgresql":
+        _recriar_exclusoes(" AND deleted_at IS NULL")
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "postgresql":
+        _recriar_exclusoes("")
+    for tabela in reversed(TABELAS):
+        op.drop_index(f"ix_{tabela}_responsavel_updated", table_name=tabela)
+        with op.batch_alter_table(tabela) as batch:
+            batch.drop_column("deleted_at")
+            batch.drop_column("updated_at")
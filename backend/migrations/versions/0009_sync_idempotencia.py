@@ -0,0 +1,40 @@
+"""tabela sync_idempotencia (resultados de POST /sync por chave do cliente)
+
+Limpeza periodica: `python -m scripts.prune_sync_keys`.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "sync_idempotencia",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("responsavel_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("chave", sa.String(64), nullable=False),
+        sa.Column("tipo", sa.String(20), nullable=False),
+        sa.Column("temp_id", sa.String(64), nullable=True),
+        sa.Column("recurso_id", sa.Integer(), nullable=False),
+        sa.Column("resposta", sa.Text(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index("ux_sync_idempotencia_chave", "sync_idempotencia", ["responsavel_id", "chave"], unique=True)
+    op.create_index("ix_sync_idempotencia_temp_id", "sync_idempotencia", ["responsavel_id", "temp_id"])
+    op.create_index("ix_sync_idempotencia_created_at", "sync_idempotencia", ["created_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_sync_idempotencia_created_at", table_name="sync_idempotencia")
+    op.drop_index("ix_sync_idempotencia_temp_id", table_name="sync_idempotencia")
+    op.drop_index("ux_sync_idempotencia_chave", table_name="sync_idempotencia")
+    op.drop_table("sync_idempotencia")
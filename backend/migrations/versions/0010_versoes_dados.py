@@ -0,0 +1,27 @@
+"""tabela versoes_dados (versao por usuario para o cache de respostas)
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0010"
+down_revision = "0009"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Sem FK: responsavel_id 0 e a versao das linhas compartilhadas (sem responsavel)
+    op.create_table(
+        "versoes_dados",
+        sa.Column("responsavel_id", sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column("versao", sa.BigInteger(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("versoes_dados")
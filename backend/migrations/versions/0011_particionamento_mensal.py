@@ -0,0 +1,206 @@
+"""particionamento mensal de agendamentos e transacoes
+
+So o Postgres e particionado (no SQLite so data_competencia vira NOT NULL):
+
+- agendamentos por RANGE de data_hora_inicio e transacoes por RANGE de
+  data_competencia, uma particao por mes (UTC) chamada <tabela>_pAAAA_MM, mais
+  a particao padrao <tabela>_padrao para as linhas fora dos meses criados.
+- A chave primaria passa a ser (id, coluna da particao), exigencia do Postgres;
+  o indice em id continua atendendo as buscas por id.
+- A funcao criar_particao_mensal(tabela, mes) cria a particao de um mes (ver
+  particoes.py, que a chama no startup e periodicamente). Em agendamentos ela
+  tambem cria, na particao, as constraints de exclusao da 0006/0008: o Postgres
+  nao aceita exclusao por sobreposicao na tabela particionada.
+- agendamentos ganha a CHECK de duracao maxima (24 horas, agenda.DURACAO_MAXIMA),
+  que permite as consultas de sobreposicao limitarem data_hora_inicio.
+- Esquema `arquivo` e o catalogo arquivo.particoes_arquivadas, usados pelo
+  arquivamento (scripts/archive_partitions.py).
+
+A migracao reescreve as duas tabelas (as tabelas ficam bloqueadas durante a
+copia): rode numa janela de manutencao. Ela falha se houver agendamento com mais
+de 24 horas; corrija-os antes de aplicar. O downgrade volta para tabelas comuns
+com as linhas que ainda estao nas particoes; o que ja foi arquivado fica no
+esquema `arquivo`.
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0011"
+down_revision = "0010"
+branch_labels = None
+depends_on = None
+
+TABELAS = {"agendamentos": "data_hora_inicio", "transacoes": "data_competencia"}
+# Meses criados a frente do atual; depois disso o loop de particoes.py mantem a janela
+MESES_A_FRENTE = 3
+
+INDICES = {
+    "agendamentos": [
+        ("ix_agendamentos_id", ["id"]),
+        ("ix_agendamentos_data_hora_inicio", ["data_hora_inicio"]),
+        ("ix_agendamentos_responsavel_inicio", ["responsavel_id", "data_hora_inicio"]),
+        ("ix_agendamentos_paciente_id", ["paciente_id"]),
+        ("ix_agendamentos_responsavel_updated", ["responsavel_id", "updated_at"]),
+    ],
+    "transacoes": [
+        ("ix_transacoes_id", ["id"]),
+        ("ix_transacoes_responsavel_competencia", ["responsavel_id", sa.text("data_competencia DESC")]),
+        ("ix_transacoes_responsavel_updated", ["responsavel_id", "updated_at"]),
+    ],
+}
+CHAVES_ESTRANGEIRAS = {
+    "agendamentos": [("paciente_id", "pacientes"), ("responsavel_id", "users")],
+    "transacoes": [("responsavel_id", "users")],
+}
+
+EXCLUSOES = """
+    ALTER TABLE {tabela} ADD CONSTRAINT {prefixo}_sala_horario
+    EXCLUDE USING gist (sala WITH =, tstzrange(data_hora_inicio, data_hora_fim, '[)') WITH &&)
+    WHERE (sala IS NOT NULL AND status <> 'cancelado' AND deleted_at IS NULL);
+    ALTER TABLE {tabela} ADD CONSTRAINT {prefixo}_responsavel_horario
+    EXCLUDE USING gist (responsavel_id WITH =, tstzrange(data_hora_inicio, data_hora_fim, '[)') WITH &&)
+    WHERE (responsavel_id IS NOT NULL AND status <> 'cancelado' AND deleted_at IS NULL)
+"""
+
+CRIAR_PARTICAO_MENSAL = r"""
+CREATE OR REPLACE FUNCTION criar_particao_mensal(tabela text, mes date) RETURNS boolean
+LANGUAGE plpgsql AS $$
+DECLARE
+    inicio timestamptz := date_trunc('month', mes::timestamp) AT TIME ZONE 'UTC';
+    fim timestamptz := (date_trunc('month', mes::timestamp) + interval '1 month') AT TIME ZONE 'UTC';
+    coluna text := CASE tabela
+        WHEN 'agendamentos' THEN 'data_hora_inicio' WHEN 'transacoes' THEN 'data_competencia'
+    END;
+    particao text := format('%s_p%s', tabela, to_char(mes, 'YYYY_MM'));
+BEGIN
+    IF coluna IS NULL THEN
+        RAISE EXCEPTION 'tabela sem particionamento mensal: %', tabela;
+    END IF;
+    -- Varios workers no startup: o segundo espera o primeiro e encontra a particao pronta
+    PERFORM pg_advisory_xact_lock(hashtext('criar_particao_mensal'));
+    IF to_regclass(particao) IS NOT NULL THEN
+        RETURN false;
+    END IF;
+
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', particao, tabela);
+    IF tabela = 'agendamentos' THEN
+        EXECUTE format(
+            $f$ALTER TABLE %I ADD CONSTRAINT %I
+            EXCLUDE USING gist (sala WITH =, tstzrange(data_hora_inicio, data_hora_fim, '[)') WITH &&)
+            WHERE (sala IS NOT NULL AND status <> 'cancelado' AND deleted_at IS NULL)$f$,
+            particao, 'ex_' || particao || '_sala_horario'
+        );
+        EXECUTE format(
+            $f$ALTER TABLE %I ADD CONSTRAINT %I
+            EXCLUDE USING gist (responsavel_id WITH =, tstzrange(data_hora_inicio, data_hora_fim, '[)') WITH &&)
+            WHERE (responsavel_id IS NOT NULL AND status <> 'cancelado' AND deleted_at IS NULL)$f$,
+            particao, 'ex_' || particao || '_responsavel_horario'
+        );
+    END IF;
+
+    -- Linhas do mes que cairam na particao padrao enquanto a particao nao existia
+    EXECUTE format(
+        'WITH movidas AS (DELETE FROM %I WHERE %I >= $1 AND %I < $2 RETURNING *) INSERT INTO %I SELECT * FROM movidas',
+        tabela || '_padrao', coluna, coluna, particao
+    ) USING inicio, fim;
+    -- ATTACH (e nao CREATE ... PARTITION OF): na tabela mae pede so SHARE UPDATE EXCLUSIVE, mas trava
+    -- a particao padrao (ACCESS EXCLUSIVE) e a varre ate o commit; quem chama define o lock_timeout
+    EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', tabela, particao, inicio, fim);
+    RETURN true;
+END
+$$
+"""
+
+
+def _recriar_estrutura(tabela: str, coluna: str, chave_primaria: str) -> None:
+    """Chave primaria, FKs e indices da tabela nova (criados depois da copia, com a tabela antiga ja removida)."""
+    op.execute(f"ALTER TABLE {tabela} ADD CONSTRAINT {tabela}_pkey PRIMARY KEY ({chave_primaria})")
+    for origem, destino in CHAVES_ESTRANGEIRAS[tabela]:
+        op.execute(
+            f"ALTER TABLE {tabela} ADD CONSTRAINT {tabela}_{origem}_fkey "
+            f"FOREIGN KEY ({origem}) REFERENCES {destino}(id)"
+        )
+    for nome, colunas in INDICES[tabela]:
+        op.create_index(nome, tabela, colunas)
+
+
+def _particionar(tabela: str, coluna: str) -> None:
+    op.execute(f"ALTER TABLE {tabela} RENAME TO {tabela}_legado")
+    op.execute(f"CREATE TABLE {tabela} (LIKE {tabela}_legado INCLUDING DEFAULTS) PARTITION BY RANGE ({coluna})")
+    op.execute(f"ALTER SEQUENCE {tabela}_id_seq OWNED BY {tabela}.id")
+    if tabela == "agendamentos":
+        # Antes das particoes: o LIKE ... INCLUDING CONSTRAINTS da funcao copia a CHECK para cada uma
+        op.execute(
+            "ALTER TABLE agendamentos ADD CONSTRAINT ck_agendamentos_duracao "
+            "CHECK (data_hora_fim - data_hora_inicio <= interval '24 hours')"
+        )
+    op.execute(f"CREATE TABLE {tabela}_padrao PARTITION OF {tabela} DEFAULT")
+    if tabela == "agendamentos":
+        op.execute(EXCLUSOES.format(tabela="agendamentos_padrao", prefixo="ex_agendamentos_padrao"))
+    op.execute(
+        f"""
+        SELECT criar_particao_mensal('{tabela}', mes::date)
+        FROM generate_series(
+            date_trunc('month', (SELECT coalesce(min({coluna}), now()) FROM {tabela}_legado) AT TIME ZONE 'UTC'),
+            date_trunc('month', now() AT TIME ZONE 'UTC') + interval '{MESES_A_FRENTE} months',
+            interval '1 month'
+        ) AS mes
+        """
+    )
+    op.execute(f"INSERT INTO {tabela} SELECT * FROM {tabela}_legado")
+    op.execute(f"DROP TABLE {tabela}_legado")
+    _recriar_estrutura(tabela, coluna, f"id, {coluna}")
+    op.execute(f"ANALYZE {tabela}")
+
+
+def _desparticionar(tabela: str) -> None:
+    op.execute(f"ALTER TABLE {tabela} RENAME TO {tabela}_particionada")
+    op.execute(f"CREATE TABLE {tabela} (LIKE {tabela}_particionada INCLUDING DEFAULTS)")
+    op.execute(f"ALTER SEQUENCE {tabela}_id_seq OWNED BY {tabela}.id")
+    op.execute(f"INSERT INTO {tabela} SELECT * FROM {tabela}_particionada")
+    op.execute(f"DROP TABLE {tabela}_particionada")
+    _recriar_estrutura(tabela, TABELAS[tabela], "id")
+    if tabela == "agendamentos":
+        op.execute(EXCLUSOES.format(tabela="agendamentos", prefixo="ex_agendamentos"))
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    # A coluna da particao nao pode ficar nula (a rota e o POST /sync sempre preenchem)
+    op.execute("UPDATE transacoes SET data_competencia = updated_at WHERE data_competencia IS NULL")
+    with op.batch_alter_table("transacoes") as batch:
+        batch.alter_column("data_competencia", existing_type=sa.DateTime(timezone=True), nullable=False)
+    if dialect != "postgresql":
+        return
+
+    op.execute("CREATE SCHEMA IF NOT EXISTS arquivo")
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS arquivo.particoes_arquivadas (
+            tabela text NOT NULL,
+            mes date NOT NULL,
+            linhas bigint NOT NULL,
+            bytes_antes bigint NOT NULL,
+            bytes_depois bigint NOT NULL,
+            arquivado_em timestamptz NOT NULL DEFAULT now(),
+            PRIMARY KEY (tabela, mes)
+        )
+        """
+    )
+    op.execute(CRIAR_PARTICAO_MENSAL)
+    for tabela, coluna in TABELAS.items():
+        _particionar(tabela, coluna)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        for tabela in reversed(list(TABELAS)):
+            _desparticionar(tabela)
+        op.execute("DROP FUNCTION IF EXISTS criar_particao_mensal(text, date)")
+    with op.batch_alter_table("transacoes") as batch:
+        batch.alter_column("data_competencia", existing_type=sa.DateTime(timezone=True), nullable=True)
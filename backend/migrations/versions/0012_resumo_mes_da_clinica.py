@@ -0,0 +1,72 @@
+"""resumo_financeiro por mes da clinica (clinic_timezone) em vez do mes UTC
+
+Sem mudanca de esquema: os buckets passam a ser chaveados pelo mes local de
+data_competencia (rollups.mes_da_clinica) e a migracao os recalcula a partir de
+`transacoes`, como scripts/rebuild_resumo_financeiro.py. Os meses ja arquivados
+(particoes.py) ficam como estavam, em UTC; as transacoes das primeiras horas
+(UTC) do primeiro mes online pertencem ao mes local anterior, ja arquivado, e
+nao entram em bucket algum. O downgrade recalcula os buckets por mes UTC.
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-18
+"""
+from datetime import date, datetime, time, timezone
+from typing import Optional
+
+from alembic import op
+import sqlalchemy as sa
+
+from rollups import reconstruir
+
+
+revision = "0012"
+down_revision = "0011"
+branch_labels = None
+depends_on = None
+
+
+def _primeiro_mes_online(conn) -> Optional[date]:
+    if conn.dialect.name != "postgresql":
+        return None
+    if conn.scalar(sa.text("SELECT to_regclass('arquivo.particoes_arquivadas')")) is None:
+        return None
+    ultimo = conn.scalar(sa.text("SELECT max(mes) FROM arquivo.particoes_arquivadas WHERE tabela = 'transacoes'"))
+    if ultimo is None:
+        return None
+    return date(ultimo.year + ultimo.month // 12, ultimo.month % 12 + 1, 1)
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    reconstruir(conn, _primeiro_mes_online(conn))
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    desde = _primeiro_mes_online(conn)
+    filtro = "deleted_at IS NULL"
+    parametros = {}
+    if desde is not None:
+        conn.execute(sa.text("DELETE FROM resumo_financeiro WHERE mes >= :desde"), {"desde": desde})
+        filtro += " AND data_competencia >= :inicio"
+        parametros["inicio"] = datetime.combine(desde, time.min, timezone.utc)
+    else:
+        conn.execute(sa.text("DELETE FROM resumo_financeiro"))
+    mes = (
+        "date_trunc('month', data_competencia AT TIME ZONE 'UTC')::date"
+        if conn.dialect.name == "postgresql"
+        else "date(data_competencia, 'start of month')"
+    )
+    conn.execute(
+        sa.text(
+            f"""
+            INSERT INTO resumo_financeiro (responsavel_id, mes, tipo, categoria, pago, total, quantidade)
+            SELECT responsavel_id, {mes}, tipo, categoria, coalesce(pago, false), sum(valor), count(*)
+            FROM transacoes
+            WHERE {filtro}
+            GROUP BY 1, 2, 3, 4, 5
+            """
+        ),
+        parametros,
+    )
@@ -1,6 +1,8 @@
 from datetime import datetime, timezone
 
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, Numeric, String, Text
+from sqlalchemy import (
+    BigInteger, Boolean, Column, Date, DateTime, ForeignKey, Index, Integer, Numeric, String, Text, func
+)
 from sqlalchemy.orm import relationship
 
 from database import Base
@@ -21,6 +23,8 @@ class User(Base):
     telefone = Column(String(30), nullable=True)
     crm = Column(String(50), unique=True, nullable=True)
     is_active = Column(Boolean, default=True)
+    # Incrementado ao trocar/redefinir a senha ou desativar o usuario: invalida JWTs antigos
+    token_version = Column(Integer, default=0, nullable=False)
     last_login = Column(DateTime(timezone=True), nullable=True)
     created_at = Column(DateTime(timezone=True), default=utcnow)
 
@@ -42,14 +46,26 @@ class Paciente(Base):
     cpf = Column(String(11), unique=True, nullable=True)
     data_cadastro = Column(DateTime(timezone=True), default=utcnow)
     responsavel_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    # Sincronizacao incremental (?since=): toda escrita avanca updated_at; exclusao e logica
+    updated_at = Column(
+        DateTime(timezone=True), default=utcnow, onupdate=utcnow, server_default=func.now(), nullable=False
+    )
+    deleted_at = Column(DateTime(timezone=True), nullable=True)
 
     responsavel = relationship("User", back_populates="pacientes")
     agendamentos = relationship("Agendamento", back_populates="paciente", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_pacientes_responsavel_nome", "responsavel_id", "nome"),
+        Index("ix_pacientes_responsavel_updated", "responsavel_id", "updated_at"),
+    )
+
 
 class Agendamento(Base):
     __tablename__ = "agendamentos"
 
+    # No Postgres a tabela e particionada por mes de data_hora_inicio (migracao 0011, particoes.py),
+    # com chave primaria (id, data_hora_inicio)
     id = Column(Integer, primary_key=True, index=True)
     paciente_id = Column(Integer, ForeignKey("pacientes.id"), nullable=False)
     data_hora_inicio = Column(DateTime(timezone=True), index=True, nullable=False)
@@ -60,34 +76,125 @@ class Agendamento(Base):
     sala = Column(String(50), nullable=True)
     observacoes = Column(Text, nullable=True)
     responsavel_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    updated_at = Column(
+        DateTime(timezone=True), default=utcnow, onupdate=utcnow, server_default=func.now(), nullable=False
+    )
+    deleted_at = Column(DateTime(timezone=True), nullable=True)
 
     paciente = relationship("Paciente", back_populates="agendamentos")
     responsavel = relationship("User", back_populates="agendamentos")
 
+    __table_args__ = (
+        Index("ix_agendamentos_responsavel_inicio", "responsavel_id", "data_hora_inicio"),
+        Index("ix_agendamentos_paciente_id", "paciente_id"),
+        Index("ix_agendamentos_responsavel_updated", "responsavel_id", "updated_at"),
+    )
+
 
 class Transacao(Base):
     __tablename__ = "transacoes"
 
+    # No Postgres a tabela e particionada por mes de data_competencia (migracao 0011, particoes.py),
+    # com chave primaria (id, data_competencia)
     id = Column(Integer, primary_key=True, index=True)
     descricao = Column(String(255), nullable=False)
     valor = Column(Numeric(12, 2), nullable=False)
     tipo = Column(String(20), nullable=False)
     categoria = Column(String(50), nullable=False)
-    data_competencia = Column(DateTime(timezone=True), default=utcnow)
+    data_competencia = Column(DateTime(timezone=True), default=utcnow, nullable=False)
     pago = Column(Boolean, default=False)
     responsavel_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    updated_at = Column(
+        DateTime(timezone=True), default=utcnow, onupdate=utcnow, server_default=func.now(), nullable=False
+    )
+    deleted_at = Column(DateTime(timezone=True), nullable=True)
 
     responsavel = relationship("User", back_populates="transacoes")
 
+    __table_args__ = (
+        Index("ix_transacoes_responsavel_competencia", responsavel_id, data_competencia.desc()),
+        Index("ix_transacoes_responsavel_updated", responsavel_id, updated_at),
+    )
+
+
+class ResumoFinanceiro(Base):
+    """Totais de transacoes por (responsavel, mes, tipo, categoria, pago).
+
+    Mantido na mesma transacao das escritas em `transacoes` (ver rollups.py).
+    """
+
+    __tablename__ = "resumo_financeiro"
+
+    id = Column(Integer, primary_key=True)
+    responsavel_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    mes = Column(Date, nullable=False)
+    tipo = Column(String(20), nullable=False)
+    categoria = Column(String(50), nullable=False)
+    pago = Column(Boolean, nullable=False)
+    total = Column(Numeric(14, 2), nullable=False, default=0)
+    quantidade = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index(
+            "ux_resumo_financeiro_bucket",
+            "responsavel_id",
+            "mes",
+            "tipo",
+            "categoria",
+            "pago",
+            unique=True,
+            postgresql_nulls_not_distinct=True,
+        ),
+    )
+
+
+class SyncIdempotencia(Base):
+    """Resultado de cada mutacao aplicada por POST /sync, pela chave do cliente (ver mutacoes.py)."""
+
+    __tablename__ = "sync_idempotencia"
+
+    id = Column(Integer, primary_key=True)
+    responsavel_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    chave = Column(String(64), nullable=False)
+    tipo = Column(String(20), nullable=False)
+    temp_id = Column(String(64), nullable=True)
+    recurso_id = Column(Integer, nullable=False)
+    # Corpo devolvido na primeira aplicacao (JSON), repetido nos reenvios
+    resposta = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), default=utcnow, nullable=False)
+
+    __table_args__ = (
+        Index("ux_sync_idempotencia_chave", "responsavel_id", "chave", unique=True),
+        Index("ix_sync_idempotencia_temp_id", "responsavel_id", "temp_id"),
+        Index("ix_sync_idempotencia_created_at", "created_at"),
+    )
+
+
+class VersaoDados(Base):
+    """Versao dos dados de cada usuario, incrementada na transacao de cada escrita (ver cache_respostas.py).
+
+    responsavel_id 0 versiona as linhas compartilhadas (sem responsavel), que aparecem para todos.
+    """
+
+    __tablename__ = "versoes_dados"
+
+    responsavel_id = Column(Integer, primary_key=True, autoincrement=False)
+    versao = Column(BigInteger, nullable=False, default=0)
+
 
 class PasswordResetToken(Base):
     __tablename__ = "password_reset_tokens"
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    token_hash = Column(String(255), nullable=False)
+    token_hash = Column(String(64), nullable=False, index=True)  # HMAC-SHA256 (hex)
     expires_at = Column(DateTime(timezone=True), nullable=False)
     created_at = Column(DateTime(timezone=True), default=utcnow)
     is_used = Column(Boolean, default=False)
+    attempts = Column(Integer, default=0, nullable=False)
 
     user = relationship("User", back_populates="reset_tokens")
+
+    __table_args__ = (
+        Index("ix_password_reset_tokens_user_used_created", "user_id", "is_used", "created_at"),
+    )
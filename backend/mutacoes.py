@@ -0,0 +1,357 @@
+"""Lote de mutacoes offline do app (POST /sync).
+
+Sem rede, o app acumula as criacoes (pacientes, agendamentos, transacoes) e as
+envia depois num lote ordenado. Cada mutacao traz uma `chave` de idempotencia
+gerada no cliente e, opcionalmente, um `temp_id`: o `paciente_id` de um
+agendamento pode ser o temp_id de um paciente criado antes no mesmo lote (ou
+num lote anterior), e a resposta devolve o mapa temp_id -> id.
+
+- O lote roda numa transacao so: um INSERT ... RETURNING por tipo (pacientes
+  primeiro, ja que so agendamentos dependem de outra mutacao), um upsert do
+  resumo financeiro, a versao do cache de respostas e o registro das chaves.
+  Qualquer erro desfaz o lote inteiro e a resposta aponta a mutacao (`indice`,
+  `chave`) com o status que a rota individual daria (400, 404, 409).
+- O resultado de cada mutacao fica em `sync_idempotencia`. Reenviar um lote
+  (timeout, Wi-Fi que caiu antes da resposta) custa um SELECT: mutacoes ja
+  aplicadas voltam com o resultado gravado e `repetida: true`, sem escrita.
+- Dois envios simultaneos do mesmo lote: o segundo esbarra na unicidade de
+  (responsavel_id, chave) e responde com o que o primeiro gravou.
+
+O resultado repetido e o do momento da primeira aplicacao. As chaves valem por
+SYNC_IDEMPOTENCY_TTL_DAYS (`python -m scripts.prune_sync_keys` remove as antigas);
+um reenvio depois disso aplica a mutacao de novo.
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import orjson
+from fastapi import HTTPException
+from sqlalchemy import delete, insert, select
+from sqlalchemy.exc import IntegrityError
+
+from agenda import (
+    STATUS_CANCELADO,
+    buscar_conflitos,
+    conferir_sobreposicao,
+    conflito_exception,
+    erro_de_horario,
+    ocupacao_cache,
+)
+from cache_respostas import incrementar_versao
+from config import settings
+from models import Agendamento, Paciente, SyncIdempotencia, Transacao, utcnow
+from rollups import aplicar_transacoes
+from schemas import AgendamentoOut, PacienteOut, TransacaoOut
+from serializacao import colunas, dumps, montar
+
+_lock = threading.Lock()
+_stats = {
+    "batches": 0,
+    "mutations": 0,
+    "applied": 0,
+    "replayed": 0,
+    "rejected_batches": 0,
+    "concurrent_replays": 0,
+    "seconds_total": 0.0,
+    "seconds_max": 0.0,
+}
+
+
+def _contar(**deltas) -> None:
+    with _lock:
+        for nome, valor in deltas.items():
+            _stats[nome] += valor
+
+
+def stats_snapshot() -> dict:
+    with _lock:
+        return {"max_mutations": settings.sync_max_mutations, **_stats}
+
+
+def _erro(status: int, indice: int, mutacao, detalhe) -> HTTPException:
+    if isinstance(detalhe, str):
+        detalhe = {"message": detalhe}
+    return HTTPException(status_code=status, detail={"indice": indice, "chave": mutacao.chave, **detalhe})
+
+
+def _validar(mutacoes: list) -> None:
+    """Erros que dispensam o banco: chaves/temp_ids/CPFs repetidos no lote e horarios invalidos."""
+    chaves, temp_ids, cpfs = set(), set(), set()
+    for indice, mutacao in enumerate(mutacoes):
+        if mutacao.chave in chaves:
+            raise _erro(400, indice, mutacao, "Chave repetida no lote")
+        chaves.add(mutacao.chave)
+        if mutacao.temp_id is not None:
+            if mutacao.temp_id in temp_ids:
+                raise _erro(400, indice, mutacao, "temp_id repetido no lote")
+            temp_ids.add(mutacao.temp_id)
+        if mutacao.tipo == "paciente" and mutacao.dados.cpf:
+            if mutacao.dados.cpf in cpfs:
+                raise _erro(400, indice, mutacao, "CPF ja cadastrado")
+            cpfs.add(mutacao.dados.cpf)
+        if mutacao.tipo == "agendamento":
+            erro = erro_de_horario(mutacao.dados.data_hora_inicio, mutacao.dados.data_hora_fim)
+            if erro:
+                raise _erro(400, indice, mutacao, erro)
+
+    # Todos os agendamentos do lote sao do mesmo medico: dois ativos sobrepostos ja conflitam
+    ativos = sorted(
+        (m.dados.data_hora_inicio, m.dados.data_hora_fim, i)
+        for i, m in enumerate(mutacoes)
+        if m.tipo == "agendamento" and m.dados.status != STATUS_CANCELADO
+    )
+    for (_, fim_anterior, anterior), (inicio, _, indice) in zip(ativos, ativos[1:]):
+        if inicio < fim_anterior:
+            primeiro, segundo = sorted((anterior, indice))
+            raise _erro(409, segundo, mutacoes[segundo], f"Conflito de horario com a mutacao {primeiro} do lote")
+
+
+async def _gravadas(db, responsavel_id: int, chaves: list[str]) -> dict[str, SyncIdempotencia]:
+    result = await db.scalars(
+        select(SyncIdempotencia).where(
+            SyncIdempotencia.responsavel_id == responsavel_id, SyncIdempotencia.chave.in_(chaves)
+        )
+    )
+    return {linha.chave: linha for linha in result.all()}
+
+
+async def _temp_ids_anteriores(db, responsavel_id: int, temp_ids: set[str]) -> dict[str, int]:
+    """Pacientes criados por lotes anteriores, pelo temp_id que o cliente deu a eles."""
+    result = await db.execute(
+        select(SyncIdempotencia.temp_id, SyncIdempotencia.recurso_id)
+        .where(
+            SyncIdempotencia.responsavel_id == responsavel_id,
+            SyncIdempotencia.tipo == "paciente",
+            SyncIdempotencia.temp_id.in_(temp_ids),
+        )
+        .order_by(SyncIdempotencia.id)
+    )
+    return dict(result.all())
+
+
+async def _resolver_pacientes(db, pendentes: list, temp_ids: dict[str, int], responsavel_id: int) -> dict[int, int]:
+    """indice -> paciente_id dos agendamentos, trocando temp_ids por ids."""
+    externos = {
+        m.dados.paciente_id
+        for _, m in pendentes
+        if isinstance(m.dados.paciente_id, str) and m.dados.paciente_id not in temp_ids
+    }
+    if externos:
+        temp_ids.update(await _temp_ids_anteriores(db, responsavel_id, externos))
+
+    resolvidos = {}
+    for indice, mutacao in pendentes:
+        referencia = mutacao.dados.paciente_id
+        if isinstance(referencia, str):
+            if referencia not in temp_ids:
+                raise _erro(400, indice, mutacao, f"temp_id desconhecido: {referencia}")
+            referencia = temp_ids[referencia]
+        resolvidos[indice] = referencia
+    return resolvidos
+
+
+async def _inserir_pacientes(db, pendentes: list, responsavel_id: int) -> dict[int, dict]:
+    # Tabela (Core) em vez do model nos tres inserts: com varias linhas no Postgres, o ORM se confunde com
+    # a coluna sentinela (id) que o RETURNING ordenado acrescenta
+    result = await db.execute(
+        insert(Paciente.__table__).returning(*colunas(Paciente, PacienteOut), sort_by_parameter_order=True),
+        [{**m.dados.model_dump(), "responsavel_id": responsavel_id} for _, m in pendentes],
+    )
+    return dict(zip((i for i, _ in pendentes), montar(result.mappings(), PacienteOut)))
+
+
+async def _inserir_agendamentos(
+    db, pendentes: list, paciente_ids: dict[int, int], responsavel_id: int
+) -> dict[int, dict]:
+    # Uma consulta traz os pacientes da resposta e confirma que existem; FOR SHARE (Postgres) impede que
+    # sejam excluidos antes do commit
+    result = await db.execute(
+        select(*colunas(Paciente, PacienteOut, prefixo="paciente__"))
+        .where(Paciente.id.in_(set(paciente_ids.values())), Paciente.deleted_at.is_(None))
+        .with_for_update(read=True)
+    )
+    pacientes = {linha["paciente__id"]: linha for linha in result.mappings()}
+    for indice, mutacao in pendentes:
+        if paciente_ids[indice] not in pacientes:
+            raise _erro(404, indice, mutacao, "Paciente nao encontrado")
+
+    result = await db.execute(
+        insert(Agendamento.__table__).returning(*colunas(Agendamento, AgendamentoOut), sort_by_parameter_order=True),
+        [
+            {**m.dados.model_dump(exclude={"paciente_id"}), "paciente_id": paciente_ids[i],
+             "responsavel_id": responsavel_id}
+            for i, m in pendentes
+        ],
+    )
+    linhas = [{**linha, **pacientes[linha["paciente_id"]]} for linha in result.mappings()]
+    criados = dict(zip((i for i, _ in pendentes), montar(linhas, AgendamentoOut)))
+
+    # Onde as constraints de exclusao nao cobrem o caso (SQLite; virada de mes nas particoes do Postgres)
+    # a sobreposicao com a agenda e conferida aqui
+    for indice, mutacao in pendentes:
+        dados = mutacao.dados
+        if dados.status != STATUS_CANCELADO and await conferir_sobreposicao(
+            db, dados.data_hora_inicio, dados.data_hora_fim
+        ):
+            conflitos = await buscar_conflitos(
+                db, dados.data_hora_inicio, dados.data_hora_fim, dados.sala, responsavel_id,
+                ignorar_id=criados[indice]["id"],
+            )
+            if conflitos:
+                raise _erro(409, indice, mutacao, conflito_exception(conflitos).detail)
+    return criados
+
+
+async def _inserir_transacoes(db, pendentes: list, responsavel_id: int) -> dict[int, dict]:
+    agora = utcnow()
+    valores = [
+        {**m.dados.model_dump(), "data_competencia": agora, "responsavel_id": responsavel_id} for _, m in pendentes
+    ]
+    result = await db.execute(
+        insert(Transacao.__table__).returning(*colunas(Transacao, TransacaoOut), sort_by_parameter_order=True), valores
+    )
+    await aplicar_transacoes(db, [Transacao(**v) for v in valores])
+    return dict(zip((i for i, _ in pendentes), montar(result.mappings(), TransacaoOut)))
+
+
+async def _aplicar_pendentes(db, pendentes: list, temp_ids: dict[str, int], responsavel_id: int) -> dict[int, dict]:
+    por_tipo: dict[str, list] = {"paciente": [], "agendamento": [], "transacao": []}
+    for indice, mutacao in pendentes:
+        por_tipo[mutacao.tipo].append((indice, mutacao))
+
+    criados: dict[int, dict] = {}
+    if por_tipo["paciente"]:
+        criados.update(await _inserir_pacientes(db, por_tipo["paciente"], responsavel_id))
+        temp_ids.update(
+            (m.temp_id, criados[i]["id"]) for i, m in por_tipo["paciente"] if m.temp_id is not None
+        )
+    if por_tipo["agendamento"]:
+        paciente_ids = await _resolver_pacientes(db, por_tipo["agendamento"], temp_ids, responsavel_id)
+        criados.update(await _inserir_agendamentos(db, por_tipo["agendamento"], paciente_ids, responsavel_id))
+    if por_tipo["transacao"]:
+        criados.update(await _inserir_transacoes(db, por_tipo["transacao"], responsavel_id))
+
+    await incrementar_versao(db, responsavel_id)
+    agora = utcnow()
+    # Tabela (Core) em vez do model: sem RETURNING, o insert em massa do ORM nao devolve um CursorResult
+    await db.execute(
+        insert(SyncIdempotencia.__table__),
+        [
+            {
+                "responsavel_id": responsavel_id,
+                "chave": m.chave,
+                "tipo": m.tipo,
+                "temp_id": m.temp_id,
+                "recurso_id": criados[i]["id"],
+                "resposta": dumps(criados[i]).decode(),
+                "created_at": agora,
+            }
+            for i, m in pendentes
+        ],
+    )
+    return criados
+
+
+async def _diagnosticar(db, pendentes: list, responsavel_id: int) -> Optional[HTTPException]:
+    """Depois do rollback, descobre qual mutacao violou uma constraint (CPF, exclusao de horario)."""
+    cpfs = {m.dados.cpf for _, m in pendentes if m.tipo == "paciente" and m.dados.cpf}
+    if cpfs:
+        existentes = set((await db.scalars(select(Paciente.cpf).where(Paciente.cpf.in_(cpfs)))).all())
+        for indice, mutacao in pendentes:
+            if mutacao.tipo == "paciente" and mutacao.dados.cpf in existentes:
+                return _erro(400, indice, mutacao, "CPF ja cadastrado")
+    for indice, mutacao in pendentes:
+        if mutacao.tipo == "agendamento" and mutacao.dados.status != STATUS_CANCELADO:
+            conflitos = await buscar_conflitos(
+                db, mutacao.dados.data_hora_inicio, mutacao.dados.data_hora_fim, mutacao.dados.sala, responsavel_id
+            )
+            if conflitos:
+                return _erro(409, indice, mutacao, conflito_exception(conflitos).detail)
+    return None
+
+
+def _resultado(mutacao, dados: dict, repetida: bool) -> dict:
+    return {
+        "chave": mutacao.chave,
+        "tipo": mutacao.tipo,
+        "temp_id": mutacao.temp_id,
+        "id": dados["id"],
+        "repetida": repetida,
+        "dados": dados,
+    }
+
+
+async def aplicar(db, mutacoes: list, responsavel_id: int) -> dict:
+    """Aplica as mutacoes ainda nao vistas e devolve o corpo de SyncOut; o commit e feito aqui."""
+    inicio = time.perf_counter()
+    _contar(batches=1, mutations=len(mutacoes))
+    try:
+        resposta = await _aplicar(db, mutacoes, responsavel_id)
+    except HTTPException:
+        _contar(rejected_batches=1)
+        raise
+    duracao = time.perf_counter() - inicio
+    with _lock:
+        _stats["seconds_total"] += duracao
+        _stats["seconds_max"] = max(_stats["seconds_max"], duracao)
+    return resposta
+
+
+async def _aplicar(db, mutacoes: list, responsavel_id: int) -> dict:
+    _validar(mutacoes)
+    chaves = [m.chave for m in mutacoes]
+    gravadas = await _gravadas(db, responsavel_id, chaves)
+    for indice, mutacao in enumerate(mutacoes):
+        if mutacao.chave in gravadas and gravadas[mutacao.chave].tipo != mutacao.tipo:
+            raise _erro(400, indice, mutacao, "Chave ja usada por outra mutacao")
+
+    pendentes = [(i, m) for i, m in enumerate(mutacoes) if m.chave not in gravadas]
+    temp_ids = {linha.temp_id: linha.recurso_id for linha in gravadas.values() if linha.temp_id is not None}
+    criados: dict[int, dict] = {}
+    if pendentes:
+        try:
+            criados = await _aplicar_pendentes(db, pendentes, temp_ids, responsavel_id)
+            await db.commit()
+        except HTTPException:
+            await db.rollback()
+            raise
+        except IntegrityError:
+            await db.rollback()
+            agora_gravadas = await _gravadas(db, responsavel_id, chaves)
+            if len(agora_gravadas) == len(mutacoes):
+                # Outro envio do mesmo lote chegou primeiro: responde com o que ele gravou
+                _contar(concurrent_replays=1)
+                gravadas, pendentes, criados = agora_gravadas, [], {}
+            elif len(agora_gravadas) > len(gravadas):
+                raise HTTPException(status_code=409, detail="Lote aplicado em paralelo por outro envio; reenvie")
+            else:
+                erro = await _diagnosticar(db, pendentes, responsavel_id)
+                if erro is None:
+                    raise
+                raise erro
+
+        for _, mutacao in pendentes:
+            if mutacao.tipo == "agendamento":
+                ag = mutacao.dados
+                ocupacao_cache.invalidar(ag.data_hora_inicio, ag.data_hora_fim, ag.sala, responsavel_id)
+
+    resultados = []
+    for indice, mutacao in enumerate(mutacoes):
+        if indice in criados:
+            resultados.append(_resultado(mutacao, criados[indice], repetida=False))
+        else:
+            resultados.append(_resultado(mutacao, orjson.loads(gravadas[mutacao.chave].resposta), repetida=True))
+    _contar(applied=len(criados), replayed=len(mutacoes) - len(criados))
+    return {
+        "resultados": resultados,
+        "ids": {r["temp_id"]: r["id"] for r in resultados if r["temp_id"] is not None},
+    }
+
+
+def chaves_expiradas(agora: Optional[datetime] = None):
+    """DELETE das chaves mais velhas que SYNC_IDEMPOTENCY_TTL_DAYS (scripts.prune_sync_keys)."""
+    agora = agora or datetime.now(timezone.utc)
+    limite = agora - timedelta(days=settings.sync_idempotency_ttl_days)
+    return delete(SyncIdempotencia).where(SyncIdempotencia.created_at < limite)
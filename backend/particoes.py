@@ -0,0 +1,300 @@
+"""Particionamento mensal de agendamentos e transacoes (so Postgres).
+
+As duas tabelas so crescem, mas quase toda leitura e da agenda e do caixa
+recentes. Desde a migracao 0011 elas sao particionadas por mes (UTC) de
+data_hora_inicio e data_competencia: `<tabela>_pAAAA_MM`, mais a particao
+padrao `<tabela>_padrao` para linhas fora dos meses criados.
+
+- Criacao: a funcao SQL criar_particao_mensal(tabela, mes), da migracao, cria
+  a particao do mes, move para ela as linhas que estavam na padrao e a anexa
+  (ATTACH). O ATTACH so pede SHARE UPDATE EXCLUSIVE na tabela mae, mas trava a
+  particao padrao (ACCESS EXCLUSIVE) e a varre para confirmar que nenhuma linha
+  dela cai no mes novo: ate o commit, consultas e escritas que passem pela
+  padrao esperam. Por isso `ManutencaoParticoes` (loop no lifespan) roda cada
+  criacao com lock_timeout e, se a padrao estiver em uso, desiste e tenta na
+  verificacao seguinte. A cada PARTITION_CHECK_INTERVAL_SECONDS ela garante o
+  mes corrente, os PARTITION_MONTHS_AHEAD seguintes e os meses que tenham
+  linhas na particao padrao.
+- Leitura: consultas com filtro em data_hora_inicio/data_competencia so leem as
+  particoes do periodo (partition pruning), entao os indices consultados sao os
+  do mes, do mesmo tamanho qualquer que seja o historico. A agenda limita
+  data_hora_inicio tambem nas buscas de sobreposicao (agenda.DURACAO_MAXIMA).
+  Buscas so por id consultam o indice de id de cada particao.
+- Arquivamento (`arquivar`, via scripts/archive_partitions.py): particoes mais
+  velhas que PARTITION_ARCHIVE_AFTER_MONTHS saem da tabela e viram
+  arquivo.<particao>, com as linhas agrupadas em lotes jsonb que o TOAST
+  comprime (PARTITION_ARCHIVE_COMPRESSION) e sem indices. O catalogo
+  arquivo.particoes_arquivadas registra cada mes. Linhas arquivadas somem das
+  rotas (listagens, exportacoes, ?since=); os totais de resumo_financeiro dos
+  meses arquivados sao mantidos, inclusive por rebuild_resumo_financeiro.
+
+Para consultar um mes arquivado:
+
+    SELECT r.* FROM arquivo.transacoes_p2024_01 a, jsonb_populate_recordset(NULL::transacoes, a.dados) r;
+"""
+import asyncio
+import logging
+import re
+import threading
+import time
+from datetime import date, datetime, timezone
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import DBAPIError
+
+from config import settings
+from database import engine, open_session
+from rollups import mes_de
+
+logger = logging.getLogger(__name__)
+
+TABELAS = {"agendamentos": "data_hora_inicio", "transacoes": "data_competencia"}
+ESQUEMA_ARQUIVO = "arquivo"
+# Linhas por registro do arquivo: lotes grandes comprimem melhor e ainda cabem folgados num jsonb
+LINHAS_POR_LOTE = 1000
+# SQLSTATE lock_not_available: o lock_timeout estourou
+LOCK_NAO_DISPONIVEL = "55P03"
+_NOME_PARTICAO = re.compile(r"^(?P<tabela>[a-z_]+)_p(?P<ano>\d{4})_(?P<mes>\d{2})$")
+
+_SQL_PARTICOES = text(
+    """
+    SELECT c.relname, pg_total_relation_size(c.oid), pg_indexes_size(c.oid)
+    FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = to_regclass(:tabela)
+    ORDER BY c.relname
+    """
+)
+
+
+def somar_meses(mes: date, meses: int) -> date:
+    indice = mes.year * 12 + mes.month - 1 + meses
+    return date(indice // 12, indice % 12 + 1, 1)
+
+
+def nome_particao(tabela: str, mes: date) -> str:
+    return f"{tabela}_p{mes:%Y_%m}"
+
+
+def mes_da_particao(nome: str) -> Optional[date]:
+    """Mes de `<tabela>_pAAAA_MM`; None para a particao padrao."""
+    encontrado = _NOME_PARTICAO.match(nome)
+    if encontrado is None:
+        return None
+    return date(int(encontrado["ano"]), int(encontrado["mes"]), 1)
+
+
+def _mes_atual() -> date:
+    return mes_de(datetime.now(timezone.utc))
+
+
+async def _particionada(db, tabela: str) -> bool:
+    # Comparado no SQL: o tipo "char" de relkind chega diferente em cada driver
+    return bool(
+        await db.scalar(text("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(:tabela)"), {"tabela": tabela})
+    )
+
+
+class ManutencaoParticoes:
+    """Cria as particoes dos proximos meses antes de elas serem necessarias."""
+
+    def __init__(self, meses_a_frente: int, intervalo: float):
+        self.meses_a_frente = meses_a_frente
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._tarefa: Optional[asyncio.Task] = None
+        self._parar: Optional[asyncio.Event] = None
+        self._tabelas: dict[str, dict] = {}
+        self._stats = {
+            "checks": 0,
+            "check_failures": 0,
+            "partitions_created": 0,
+            "lock_timeouts": 0,
+            "seconds_max": 0.0,
+            "last_check_at": None,
+        }
+
+    async def garantir(self) -> list[str]:
+        """Cria as particoes que faltarem e devolve os nomes delas.
+
+        Garante o mes corrente, os `meses_a_frente` seguintes e os meses que
+        tenham linhas na particao padrao, que assim so guarda linhas por pouco tempo.
+        """
+        comeco = time.perf_counter()
+        criadas, tabelas, adiadas = [], {}, 0
+        atual = _mes_atual()
+        async with open_session() as db:
+            for tabela, coluna in TABELAS.items():
+                if not await _particionada(db, tabela):
+                    continue
+                meses = {somar_meses(atual, n) for n in range(self.meses_a_frente + 1)}
+                # Meses com linhas na particao padrao: agendamentos marcados alem da janela, cargas de historico
+                padrao = await db.execute(
+                    text(f"SELECT DISTINCT date_trunc('month', {coluna} AT TIME ZONE 'UTC')::date FROM {tabela}_padrao")
+                )
+                meses.update(mes for (mes,) in padrao.all())
+                for mes in sorted(meses):
+                    # O ATTACH espera (e depois bloqueia) quem esta usando a particao padrao: desiste e
+                    # tenta na proxima verificacao em vez de enfileirar as rotas atras dele
+                    await db.execute(text("SET LOCAL lock_timeout = '5s'"))
+                    try:
+                        criada = await db.scalar(
+                            text("SELECT criar_particao_mensal(:tabela, :mes)"), {"tabela": tabela, "mes": mes}
+                        )
+                    except DBAPIError as exc:
+                        if getattr(exc.orig, "pgcode", None) != LOCK_NAO_DISPONIVEL:
+                            raise
+                        await db.rollback()
+                        adiadas += 1
+                        logger.warning("particoes: %s adiada, lock_timeout", nome_particao(tabela, mes))
+                        continue
+                    # Um commit por particao: o advisory lock e os locks do ATTACH duram so a criacao dela
+                    await db.commit()
+                    if criada:
+                        criadas.append(nome_particao(tabela, mes))
+                        logger.info("particoes: %s criada", nome_particao(tabela, mes))
+                tabelas[tabela] = await self._situacao(db, tabela, atual)
+        duracao = time.perf_counter() - comeco
+        with self._lock:
+            self._tabelas = tabelas
+            self._stats["checks"] += 1
+            self._stats["partitions_created"] += len(criadas)
+            self._stats["lock_timeouts"] += adiadas
+            self._stats["seconds_max"] = max(self._stats["seconds_max"], duracao)
+            self._stats["last_check_at"] = datetime.now(timezone.utc).isoformat()
+        return criadas
+
+    @staticmethod
+    async def _situacao(db, tabela: str, atual: date) -> dict:
+        linhas = (await db.execute(_SQL_PARTICOES, {"tabela": tabela})).all()
+        meses = sorted(mes for mes in (mes_da_particao(nome) for nome, _, _ in linhas) if mes is not None)
+        corrente = next((linha for linha in linhas if linha[0] == nome_particao(tabela, atual)), None)
+        padrao = await db.scalar(text(f"SELECT count(*) FROM {tabela}_padrao"))
+        return {
+            "partitions": len(meses),
+            "oldest": meses[0].isoformat() if meses else None,
+            "newest": meses[-1].isoformat() if meses else None,
+            "total_bytes": sum(total for _, total, _ in linhas),
+            "current_month_bytes": corrente[1] if corrente else None,
+            "current_month_index_bytes": corrente[2] if corrente else None,
+            # Linhas que ainda nao tem particao do mes (vao para ela na proxima verificacao)
+            "default_rows": padrao,
+        }
+
+    async def _loop(self, parar: asyncio.Event) -> None:
+        while not parar.is_set():
+            try:
+                await self.garantir()
+            except Exception:
+                logger.exception("particoes: falha ao criar as particoes dos proximos meses")
+                with self._lock:
+                    self._stats["check_failures"] += 1
+            try:
+                await asyncio.wait_for(parar.wait(), self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+
+    def iniciar(self) -> None:
+        if engine.dialect.name == "postgresql" and self._tarefa is None:
+            self._parar = asyncio.Event()
+            self._tarefa = asyncio.get_running_loop().create_task(self._loop(self._parar))
+
+    async def parar(self) -> None:
+        if self._tarefa is not None:
+            self._parar.set()
+            await self._tarefa
+            self._tarefa = None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "months_ahead": self.meses_a_frente,
+                "archive_after_months": settings.partition_archive_after_months,
+                **self._stats,
+                "tables": dict(self._tabelas),
+            }
+
+
+# --- Arquivamento (scripts/archive_partitions.py) ------------------------------
+
+def para_arquivar(conn: Connection, meses: int) -> list[tuple[str, date]]:
+    """(tabela, mes) das particoes anteriores aos `meses` meses que antecedem o mes corrente."""
+    limite = somar_meses(_mes_atual(), -meses)
+    candidatas = []
+    for tabela in TABELAS:
+        for nome, _, _ in conn.execute(_SQL_PARTICOES, {"tabela": tabela}):
+            mes = mes_da_particao(nome)
+            if mes is not None and mes < limite:
+                candidatas.append((tabela, mes))
+    return candidatas
+
+
+def arquivar(conn: Connection, tabela: str, mes: date) -> dict:
+    """Troca a particao do mes por arquivo.<particao>, comprimida. Rode numa transacao (engine.begin())."""
+    particao = nome_particao(tabela, mes)
+    destino = f"{ESQUEMA_ARQUIVO}.{particao}"
+    bytes_antes = conn.scalar(text("SELECT pg_total_relation_size(to_regclass(:p))"), {"p": particao})
+
+    # Escritas na particao esperam (leituras seguem) ate o commit; o mes arquivado nao deve mais mudar
+    conn.exec_driver_sql(f"LOCK TABLE {particao} IN SHARE MODE")
+    conn.exec_driver_sql(
+        f"CREATE TABLE {destino} (lote integer PRIMARY KEY, linhas integer NOT NULL, dados jsonb NOT NULL)"
+    )
+    conn.exec_driver_sql(
+        f"ALTER TABLE {destino} ALTER COLUMN dados SET COMPRESSION {settings.partition_archive_compression}"
+    )
+    conn.execute(
+        text(
+            f"""
+            INSERT INTO {destino} (lote, linhas, dados)
+            SELECT lote, count(*), jsonb_agg(linha ORDER BY id)
+            FROM (
+                SELECT (row_number() OVER (ORDER BY p.id) - 1) / :por_lote AS lote, p.id, to_jsonb(p) AS linha
+                FROM {particao} p
+            ) AS s
+            GROUP BY lote
+            """
+        ),
+        {"por_lote": LINHAS_POR_LOTE},
+    )
+    linhas = conn.scalar(text(f"SELECT count(*) FROM {particao}"))
+    arquivadas = conn.scalar(text(f"SELECT coalesce(sum(linhas), 0) FROM {destino}"))
+    if arquivadas != linhas:
+        raise RuntimeError(f"{particao}: {linhas} linhas na particao, {arquivadas} no arquivo")
+
+    # O DETACH espera as consultas em andamento na tabela mae: desiste (e tenta na proxima execucao)
+    # em vez de enfileirar as rotas atras dele
+    conn.exec_driver_sql("SET LOCAL lock_timeout = '5s'")
+    conn.exec_driver_sql(f"ALTER TABLE {tabela} DETACH PARTITION {particao}")
+    conn.exec_driver_sql(f"DROP TABLE {particao}")
+    bytes_depois = conn.scalar(text("SELECT pg_total_relation_size(to_regclass(:d))"), {"d": destino})
+    conn.execute(
+        text(
+            f"""
+            INSERT INTO {ESQUEMA_ARQUIVO}.particoes_arquivadas (tabela, mes, linhas, bytes_antes, bytes_depois)
+            VALUES (:tabela, :mes, :linhas, :antes, :depois)
+            """
+        ),
+        {"tabela": tabela, "mes": mes, "linhas": linhas, "antes": bytes_antes, "depois": bytes_depois},
+    )
+    return {"partition": particao, "rows": linhas, "bytes_before": bytes_antes, "bytes_after": bytes_depois}
+
+
+def primeiro_mes_online(conn: Connection, tabela: str) -> Optional[date]:
+    """Mes seguinte ao ultimo arquivado de `tabela`; None se nada foi arquivado (ou fora do Postgres)."""
+    if conn.dialect.name != "postgresql":
+        return None
+    if conn.scalar(text(f"SELECT to_regclass('{ESQUEMA_ARQUIVO}.particoes_arquivadas')")) is None:
+        return None
+    ultimo = conn.scalar(
+        text(f"SELECT max(mes) FROM {ESQUEMA_ARQUIVO}.particoes_arquivadas WHERE tabela = :tabela"),
+        {"tabela": tabela},
+    )
+    return somar_meses(ultimo, 1) if ultimo is not None else None
+
+
+manutencao_particoes = ManutencaoParticoes(
+    meses_a_frente=settings.partition_months_ahead,
+    intervalo=settings.partition_check_interval_seconds,
+)
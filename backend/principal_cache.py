@@ -0,0 +1,108 @@
+"""Cache em processo dos usuarios autenticados (principals).
+
+Evita a consulta de `users` em toda requisicao autenticada. Cada entrada guarda
+a `token_version` do usuario: tokens emitidos com outra versao nao casam com a
+entrada e caem no banco, onde sao rejeitados. Trocas de senha e
+`security.set_user_active` (rotas /internal/users/{id}/activate|deactivate)
+incrementam a versao e chamam `invalidate`.
+
+O cache e local ao processo: com varios workers, os demais so deixam de aceitar
+um token revogado quando a entrada expira (PRINCIPAL_CACHE_TTL_SECONDS). O mesmo
+vale para edicoes feitas direto no banco (UPDATE em `users` fora da aplicacao):
+nenhum processo e avisado e a entrada antiga vale ate o TTL.
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from config import settings
+
+
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    nome: str
+    email: str
+    role: str
+    telefone: Optional[str]
+    crm: Optional[str]
+    is_active: bool
+    last_login: Optional[datetime]
+    created_at: datetime
+    token_version: int
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(
+            id=user.id,
+            nome=user.nome,
+            email=user.email,
+            role=user.role,
+            telefone=user.telefone,
+            crm=user.crm,
+            is_active=bool(user.is_active),
+            last_login=user.last_login,
+            created_at=user.created_at,
+            token_version=user.token_version or 0,
+        )
+
+
+class PrincipalCache:
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, tuple[float, Principal]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int, token_version: int) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                expires_at, principal = entry
+                if principal.token_version == token_version and expires_at > time.monotonic():
+                    self._entries.move_to_end(user_id)
+                    self.hits += 1
+                    return principal
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+
+    def put(self, principal: Principal) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[principal.id] = (time.monotonic() + self.ttl_seconds, principal)
+            self._entries.move_to_end(principal.id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+principal_cache = PrincipalCache(
+    maxsize=settings.principal_cache_size,
+    ttl_seconds=settings.principal_cache_ttl_seconds,
+)
@@ -0,0 +1,194 @@
+"""Resumo financeiro incremental (tabela resumo_financeiro).
+
+Cada escrita em `transacoes` aplica seu delta no bucket correspondente com um
+upsert atomico, na mesma transacao da escrita. Assim o dashboard le uma linha por
+(mes, tipo, categoria, pago) em vez de somar todas as transacoes.
+
+O mes dos buckets e o da clinica (clinic_timezone), o mesmo do dashboard e da
+agenda: uma transacao das 22h do ultimo dia do mes fica nesse mes, e nao no
+seguinte como ficaria em UTC. As particoes mensais (particoes.py) seguem em UTC.
+"""
+from collections import defaultdict
+from datetime import date, datetime, time, timezone
+from decimal import Decimal
+from typing import Iterable, Optional
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Connection
+
+from config import settings
+from models import ResumoFinanceiro, Transacao
+
+BUCKET = ["responsavel_id", "mes", "tipo", "categoria", "pago"]
+CHUNK = 5_000
+
+
+def mes_de(data: date) -> date:
+    """Mes (dia 1) de `data` em UTC, o das particoes mensais."""
+    if isinstance(data, datetime) and data.tzinfo is not None:
+        data = data.astimezone(timezone.utc)
+    return date(data.year, data.month, 1)
+
+
+def mes_da_clinica(data: date) -> date:
+    """Mes (dia 1) de `data` no fuso da clinica: a chave `mes` de resumo_financeiro."""
+    if isinstance(data, datetime):
+        # SQLite devolve datetimes sem fuso; todos os horarios sao gravados em UTC
+        if data.tzinfo is None:
+            data = data.replace(tzinfo=timezone.utc)
+        data = data.astimezone(ZoneInfo(settings.clinic_timezone))
+    return date(data.year, data.month, 1)
+
+
+def _chave(responsavel_id, data_competencia, tipo, categoria, pago) -> tuple:
+    return (responsavel_id, mes_da_clinica(data_competencia), tipo, categoria, bool(pago))
+
+
+def _agrupar(transacoes: Iterable[Transacao], sinal: int) -> list[dict]:
+    buckets: dict[tuple, list] = defaultdict(lambda: [Decimal("0"), 0])
+    for t in transacoes:
+        bucket = buckets[_chave(t.responsavel_id, t.data_competencia, t.tipo, t.categoria, t.pago)]
+        bucket[0] += Decimal(str(t.valor)) * sinal
+        bucket[1] += sinal
+    return [
+        dict(zip(BUCKET, chave), total=total, quantidade=quantidade)
+        for chave, (total, quantidade) in buckets.items()
+    ]
+
+
+def upsert_buckets(dialect_name: str, valores: list[dict]):
+    """INSERT ... ON CONFLICT que soma os deltas aos buckets existentes."""
+    insert_fn = pg_insert if dialect_name == "postgresql" else sqlite_insert
+    stmt = insert_fn(ResumoFinanceiro).values(valores)
+    return stmt.on_conflict_do_update(
+        index_elements=BUCKET,
+        set_={
+            "total": ResumoFinanceiro.total + stmt.excluded.total,
+            "quantidade": ResumoFinanceiro.quantidade + stmt.excluded.quantidade,
+        },
+    )
+
+
+async def aplicar_transacoes(db, transacoes: Iterable[Transacao], sinal: int = 1) -> None:
+    """Soma (sinal=1) ou estorna (sinal=-1) transacoes no resumo; o commit fica com o chamador.
+
+    Atualizacoes devem estornar a versao antiga e aplicar a nova.
+    """
+    valores = _agrupar(transacoes, sinal)
+    if valores:
+        await db.execute(upsert_buckets(db.get_bind().dialect.name, valores))
+
+
+async def resumo(db, responsavel_id: int, inicio: Optional[date] = None, fim: Optional[date] = None) -> dict:
+    """Totais de receitas/despesas lidos dos buckets, no formato de ResumoFinanceiroOut."""
+    query = select(ResumoFinanceiro).where(
+        (ResumoFinanceiro.responsavel_id == responsavel_id) | (ResumoFinanceiro.responsavel_id.is_(None))
+    )
+    if inicio is not None:
+        query = query.where(ResumoFinanceiro.mes >= mes_da_clinica(inicio))
+    if fim is not None:
+        query = query.where(ResumoFinanceiro.mes <= mes_da_clinica(fim))
+    buckets = (await db.scalars(query)).all()
+
+    por_tipo: dict[str, list] = defaultdict(lambda: [0.0, 0])
+    # Categorias podem se repetir entre receitas e despesas; somar as duas nao faz sentido
+    por_categoria: dict[tuple[str, str], list] = defaultdict(lambda: [0.0, 0])
+    por_mes: dict[date, list] = defaultdict(lambda: [0.0, 0.0])
+    pago: dict[tuple[str, bool], float] = defaultdict(float)
+    quantidade = 0
+    for b in buckets:
+        total = float(b.total)
+        quantidade += b.quantidade
+        por_tipo[b.tipo][0] += total
+        por_tipo[b.tipo][1] += b.quantidade
+        por_categoria[(b.tipo, b.categoria)][0] += total
+        por_categoria[(b.tipo, b.categoria)][1] += b.quantidade
+        if b.tipo == "receita":
+            por_mes[b.mes][0] += total
+        elif b.tipo == "despesa":
+            por_mes[b.mes][1] += total
+        pago[(b.tipo, b.pago)] += total
+
+    receitas = por_tipo["receita"][0] if "receita" in por_tipo else 0.0
+    despesas = por_tipo["despesa"][0] if "despesa" in por_tipo else 0.0
+    return {
+        "receitas": receitas,
+        "despesas": despesas,
+        "saldo": receitas - despesas,
+        "receitas_pagas": pago[("receita", True)],
+        "receitas_pendentes": pago[("receita", False)],
+        "despesas_pagas": pago[("despesa", True)],
+        "despesas_pendentes": pago[("despesa", False)],
+        "quantidade": quantidade,
+        "por_tipo": [{"chave": k, "total": v[0], "quantidade": v[1]} for k, v in sorted(por_tipo.items())],
+        "por_categoria": [
+            {"tipo": tipo, "chave": categoria, "total": v[0], "quantidade": v[1]}
+            for (tipo, categoria), v in sorted(por_categoria.items())
+        ],
+        "por_mes": [
+            {"mes": mes, "receitas": v[0], "despesas": v[1], "saldo": v[0] - v[1]}
+            for mes, v in sorted(por_mes.items())
+        ],
+    }
+
+
+def calcular_buckets(conn: Connection, desde: Optional[date] = None) -> dict[tuple, tuple[Decimal, int]]:
+    """Recalcula os buckets a partir de `transacoes`, lendo em lotes (memoria O(buckets)).
+
+    `desde` limita aos meses a partir dele (os anteriores ja arquivados, ver particoes.py).
+    """
+    buckets: dict[tuple, list] = defaultdict(lambda: [Decimal("0"), 0])
+    query = select(
+        Transacao.responsavel_id,
+        Transacao.data_competencia,
+        Transacao.tipo,
+        Transacao.categoria,
+        Transacao.pago,
+        Transacao.valor,
+    ).where(Transacao.deleted_at.is_(None))
+    if desde is not None:
+        inicio = datetime.combine(desde, time.min, ZoneInfo(settings.clinic_timezone))
+        query = query.where(Transacao.data_competencia >= inicio)
+    # yield_per so neste statement (Connection.execution_options valeria para os seguintes da conexao)
+    result = conn.execute(query, execution_options={"yield_per": CHUNK})
+    for responsavel_id, data_competencia, tipo, categoria, pago, valor in result:
+        bucket = buckets[_chave(responsavel_id, data_competencia, tipo, categoria, pago)]
+        bucket[0] += Decimal(str(valor))
+        bucket[1] += 1
+    return {chave: (total, quantidade) for chave, (total, quantidade) in buckets.items()}
+
+
+def reconstruir(conn: Connection, desde: Optional[date] = None) -> int:
+    """Apaga e recria o resumo (dos meses a partir de `desde`). Rode dentro de uma transacao (engine.begin())."""
+    buckets = calcular_buckets(conn, desde)
+    apagar = delete(ResumoFinanceiro)
+    if desde is not None:
+        apagar = apagar.where(ResumoFinanceiro.mes >= desde)
+    conn.execute(apagar)
+    valores = [dict(zip(BUCKET, chave), total=total, quantidade=qtd) for chave, (total, qtd) in buckets.items()]
+    for i in range(0, len(valores), CHUNK):
+        conn.execute(insert(ResumoFinanceiro), valores[i : i + CHUNK])
+    return len(valores)
+
+
+def verificar(conn: Connection, desde: Optional[date] = None) -> list[dict]:
+    """Compara o resumo (dos meses a partir de `desde`) com `transacoes` e devolve os buckets divergentes."""
+    esperado = calcular_buckets(conn, desde)
+    query = select(ResumoFinanceiro)
+    if desde is not None:
+        query = query.where(ResumoFinanceiro.mes >= desde)
+    atual = {
+        (r.responsavel_id, r.mes, r.tipo, r.categoria, bool(r.pago)): (Decimal(str(r.total)), r.quantidade)
+        for r in conn.execute(query)
+        if r.quantidade != 0
+    }
+    divergencias = []
+    for chave in esperado.keys() | atual.keys():
+        if esperado.get(chave) != atual.get(chave):
+            divergencias.append(
+                {"bucket": dict(zip(BUCKET, chave)), "esperado": esperado.get(chave), "atual": atual.get(chave)}
+            )
+    return divergencias
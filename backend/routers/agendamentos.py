@@ -1,66 +1,297 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session, joinedload
+from datetime import date, datetime, time, timedelta
+from typing import Literal, Optional
 
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import insert, literal, select, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import exportacao
+import sincronizacao
+from agenda import (
+    STATUS_CANCELADO,
+    buscar_conflitos,
+    calcular_disponibilidade,
+    conferir_sobreposicao,
+    conflito_exception,
+    erro_de_horario,
+    ocupacao_cache,
+)
+from cache_respostas import cache_respostas, incrementar_versao, versao_dos_dados
 from database import get_db
-from models import Agendamento, Paciente, User
-from schemas import AgendamentoCreate, AgendamentoOut
+from models import Agendamento, Paciente, utcnow
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, encode_cursor
+from principal_cache import Principal
+from replicas import get_db_leitura, replica_de_leitura
+from serializacao import colunas, montar
+from schemas import AgendamentoCreate, AgendamentoOut, AgendamentoPage, DisponibilidadeOut, PacienteOut
 from security import get_current_user
 
 router = APIRouter(prefix="/agendamentos", tags=["Agenda"])
+MAX_DIAS_DISPONIBILIDADE = 62
 
 
 @router.post("/", response_model=AgendamentoOut, status_code=201)
-def criar_agendamento(
+async def criar_agendamento(
     agendamento: AgendamentoCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    paciente = db.query(Paciente).filter(Paciente.id == agendamento.paciente_id).first()
-    if not paciente:
-        raise HTTPException(status_code=404, detail="Paciente nao encontrado")
-
-    if agendamento.data_hora_fim <= agendamento.data_hora_inicio:
-        raise HTTPException(status_code=400, detail="Horario final deve ser maior que o inicial")
-
-    novo_agendamento = Agendamento(
-        paciente_id=agendamento.paciente_id,
-        data_hora_inicio=agendamento.data_hora_inicio,
-        data_hora_fim=agendamento.data_hora_fim,
-        tipo=agendamento.tipo,
-        status=agendamento.status,
-        valor_previsto=agendamento.valor_previsto,
-        sala=agendamento.sala,
-        observacoes=agendamento.observacoes,
-        responsavel_id=current_user.id,
+    erro = erro_de_horario(agendamento.data_hora_inicio, agendamento.data_hora_fim)
+    if erro:
+        raise HTTPException(status_code=400, detail=erro)
+
+    verificar_conflitos = agendamento.status != STATUS_CANCELADO
+    postgres = db.get_bind().dialect.name == "postgresql"
+    valores = {
+        "paciente_id": agendamento.paciente_id,
+        "data_hora_inicio": agendamento.data_hora_inicio,
+        "data_hora_fim": agendamento.data_hora_fim,
+        "tipo": agendamento.tipo,
+        "status": agendamento.status,
+        "valor_previsto": agendamento.valor_previsto,
+        "sala": agendamento.sala,
+        "observacoes": agendamento.observacoes,
+        "responsavel_id": current_user.id,
+    }
+    try:
+        novo_agendamento = await _inserir(db, valores, postgres)
+        if novo_agendamento is None:
+            raise HTTPException(status_code=404, detail="Paciente nao encontrado")
+        if verificar_conflitos and await conferir_sobreposicao(
+            db, agendamento.data_hora_inicio, agendamento.data_hora_fim
+        ):
+            # Onde as constraints de exclusao nao cobrem o caso (SQLite; virada de mes nas particoes do
+            # Postgres) a sobreposicao e conferida na mesma transacao, antes do commit
+            conflitos = await buscar_conflitos(
+                db,
+                agendamento.data_hora_inicio,
+                agendamento.data_hora_fim,
+                agendamento.sala,
+                current_user.id,
+                ignorar_id=novo_agendamento["id"],
+            )
+            if conflitos:
+                await db.rollback()
+                raise conflito_exception(conflitos)
+        await incrementar_versao(db, current_user.id)
+        await db.commit()
+    except IntegrityError:
+        # Sobreposicao barrada pelas constraints de exclusao (Postgres): busca os conflitos para o 409
+        await db.rollback()
+        if verificar_conflitos:
+            conflitos = await buscar_conflitos(
+                db, agendamento.data_hora_inicio, agendamento.data_hora_fim, agendamento.sala, current_user.id
+            )
+            if conflitos:
+                raise conflito_exception(conflitos)
+        raise
+    ocupacao_cache.invalidar(
+        agendamento.data_hora_inicio, agendamento.data_hora_fim, agendamento.sala, current_user.id
     )
-    db.add(novo_agendamento)
-    db.commit()
-
-    return (
-        db.query(Agendamento)
-        .options(joinedload(Agendamento.paciente))
-        .filter(Agendamento.id == novo_agendamento.id)
-        .first()
+    return novo_agendamento
+
+
+async def _inserir(db, valores: dict, postgres: bool) -> Optional[dict]:
+    """INSERT do agendamento devolvendo o AgendamentoOut completo; None se o paciente nao existe.
+
+    O INSERT ... SELECT so gera linha se o paciente existe e nao foi excluido. No
+    Postgres o INSERT vai num WITH e o mesmo statement ja devolve o paciente junto.
+    """
+    origem = select(
+        *(literal(valor, Agendamento.__table__.c[nome].type).label(nome) for nome, valor in valores.items())
+    ).where(Paciente.id == valores["paciente_id"], Paciente.deleted_at.is_(None))
+    insercao = insert(Agendamento).from_select(list(valores), origem).returning(*colunas(Agendamento, AgendamentoOut))
+    colunas_paciente = colunas(Paciente, PacienteOut, prefixo="paciente__")
+
+    if postgres:
+        novo = insercao.cte("novo")
+        result = await db.execute(
+            select(*novo.c, *colunas_paciente).join_from(novo, Paciente, Paciente.id == novo.c.paciente_id)
+        )
+        linha = result.mappings().first()
+    else:
+        # SQLite nao aceita INSERT dentro de WITH: o paciente vem numa segunda consulta
+        linha = (await db.execute(insercao)).mappings().first()
+        if linha is not None:
+            paciente = await db.execute(select(*colunas_paciente).where(Paciente.id == valores["paciente_id"]))
+            linha = {**linha, **paciente.mappings().one()}
+    return montar([linha], AgendamentoOut)[0] if linha is not None else None
+
+
+@router.get("/", response_model=AgendamentoPage)
+async def listar_agendamentos(
+    request: Request,
+    inicio: Optional[datetime] = Query(None, description="Inicio da janela (inclusivo)"),
+    fim: Optional[datetime] = Query(None, description="Fim da janela (exclusivo)"),
+    cursor: Optional[str] = Query(None, description="Cursor retornado em next_cursor"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    since: Optional[str] = Query(None, description="Watermark (X-Watermark) da ultima sincronizacao"),
+    db: AsyncSession = Depends(get_db_leitura),
+    current_user: Principal = Depends(get_current_user),
+):
+    desde = sincronizacao.decode_watermark(since)
+    versoes = await versao_dos_dados(db, current_user.id)
+    em_cache = await cache_respostas.obter(request, current_user.id, versoes)
+    if em_cache is not None:
+        return em_cache
+
+    watermark = sincronizacao.proximo_watermark(desde)
+    query = (
+        select(*colunas(Agendamento, AgendamentoOut), *colunas(Paciente, PacienteOut, prefixo="paciente__"))
+        .join(Paciente, Agendamento.paciente_id == Paciente.id)
+        .where((Agendamento.responsavel_id == current_user.id) | (Agendamento.responsavel_id.is_(None)))
+        .where(sincronizacao.filtro(Agendamento, desde))
     )
+    if inicio is not None:
+        query = query.where(Agendamento.data_hora_inicio >= inicio)
+    if fim is not None:
+        query = query.where(Agendamento.data_hora_inicio < fim)
 
+    # Paginacao por chave (keyset): continua a partir do ultimo (data_hora_inicio, id) entregue,
+    # sem OFFSET, para que o custo de cada pagina nao dependa da profundidade na agenda.
+    posicao = decode_cursor(cursor)
+    if posicao is not None:
+        # A comparacao so da coluna, redundante com a da tupla, permite descartar as particoes anteriores
+        query = query.where(
+            tuple_(Agendamento.data_hora_inicio, Agendamento.id) > posicao,
+            Agendamento.data_hora_inicio >= posicao[0],
+        )
+
+    result = await db.execute(query.order_by(Agendamento.data_hora_inicio, Agendamento.id).limit(limit + 1))
+    itens = montar(result.mappings(), AgendamentoOut)
+
+    next_cursor = None
+    if len(itens) > limit:
+        itens = itens[:limit]
+        ultimo = itens[-1]
+        next_cursor = encode_cursor(ultimo["data_hora_inicio"], ultimo["id"])
+    return await cache_respostas.responder(
+        request, current_user.id, versoes, {"items": itens, "next_cursor": next_cursor},
+        {sincronizacao.WATERMARK_HEADER: watermark},
+    )
 
-@router.get("/", response_model=list[AgendamentoOut])
-def listar_agendamentos(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+
+@router.get("/export")
+async def exportar_agendamentos(
+    request: Request,
+    formato: Literal["csv", "ndjson"] = Query("csv"),
+    inicio: Optional[date] = Query(None, description="Primeiro dia (inclusivo)"),
+    fim: Optional[date] = Query(None, description="Ultimo dia (inclusivo)"),
+    tipo: list[str] = Query([], description="Tipos exportados (repita o parametro para varios)"),
+    status: list[str] = Query([], description="Status exportados (repita o parametro para varios)"),
+    sala: Optional[str] = Query(None),
+    current_user: Principal = Depends(get_current_user),
 ):
-    return (
-        db.query(Agendamento)
-        .options(joinedload(Agendamento.paciente))
-        .order_by(Agendamento.data_hora_inicio)
-        .all()
+    query = (
+        select(
+            Agendamento.id,
+            Agendamento.data_hora_inicio,
+            Agendamento.data_hora_fim,
+            Agendamento.tipo,
+            Agendamento.status,
+            Agendamento.sala,
+            Agendamento.valor_previsto,
+            Agendamento.observacoes,
+            Paciente.id.label("paciente_id"),
+            Paciente.nome.label("paciente_nome"),
+            Paciente.telefone.label("paciente_telefone"),
+            Paciente.email.label("paciente_email"),
+            Paciente.cpf.label("paciente_cpf"),
+        )
+        .join(Paciente, Agendamento.paciente_id == Paciente.id)
+        .where(
+            (Agendamento.responsavel_id == current_user.id) | (Agendamento.responsavel_id.is_(None)),
+            Agendamento.deleted_at.is_(None),
+        )
+    )
+    if inicio is not None:
+        query = query.where(Agendamento.data_hora_inicio >= exportacao.inicio_do_dia(inicio))
+    if fim is not None:
+        query = query.where(Agendamento.data_hora_inicio < exportacao.fim_do_dia(fim))
+    if tipo:
+        query = query.where(Agendamento.tipo.in_(tipo))
+    if status:
+        query = query.where(Agendamento.status.in_(status))
+    if sala is not None:
+        query = query.where(Agendamento.sala == sala)
+    return exportacao.exportar(
+        query.order_by(Agendamento.data_hora_inicio, Agendamento.id),
+        formato,
+        "agendamentos",
+        replica=replica_de_leitura(request),
     )
 
 
-@router.get("/agenda", response_model=list[AgendamentoOut])
-def alias_agenda(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+@router.get("/agenda", response_model=AgendamentoPage)
+async def alias_agenda(
+    request: Request,
+    inicio: Optional[datetime] = Query(None),
+    fim: Optional[datetime] = Query(None),
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    since: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_db_leitura),
+    current_user: Principal = Depends(get_current_user),
 ):
     # Alias para compatibilidade com o app mobile atual
-    return listar_agendamentos(db=db, current_user=current_user)
+    return await listar_agendamentos(
+        request=request, inicio=inicio, fim=fim, cursor=cursor, limit=limit, since=since, db=db,
+        current_user=current_user,
+    )
+
+
+@router.delete("/{agendamento_id}", status_code=204)
+async def excluir_agendamento(
+    agendamento_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    agendamento = await db.get(Agendamento, agendamento_id)
+    if not agendamento or agendamento.deleted_at is not None:
+        raise HTTPException(status_code=404, detail="Agendamento nao encontrado")
+    if agendamento.responsavel_id not in (None, current_user.id):
+        raise HTTPException(status_code=403, detail="Sem acesso a este agendamento")
+    # Exclusao logica: libera o horario (constraints e conflitos ignoram excluidos) e deixa o tombstone
+    agendamento.deleted_at = utcnow()
+    await incrementar_versao(db, agendamento.responsavel_id)
+    await db.commit()
+    ocupacao_cache.invalidar(
+        agendamento.data_hora_inicio, agendamento.data_hora_fim, agendamento.sala, agendamento.responsavel_id
+    )
+    return Response(status_code=204)
+
+
+@router.get("/disponibilidade", response_model=list[DisponibilidadeOut])
+async def disponibilidade(
+    inicio: date = Query(..., description="Primeiro dia (inclusivo)"),
+    fim: date = Query(..., description="Ultimo dia (inclusivo)"),
+    duracao: int = Query(30, ge=5, le=480, description="Duracao minima do horario livre, em minutos"),
+    sala: list[str] = Query([], description="Salas consultadas (repita o parametro para varias)"),
+    responsavel_id: Optional[int] = Query(None, description="Medico; padrao: usuario atual quando nao ha sala"),
+    hora_inicio: time = Query(time(8, 0), description="Inicio do expediente (fuso da clinica)"),
+    hora_fim: time = Query(time(18, 0), description="Fim do expediente (fuso da clinica)"),
+    dias_semana: list[int] = Query([0, 1, 2, 3, 4], description="Dias de atendimento (0 = segunda)"),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    if fim < inicio or (fim - inicio).days >= MAX_DIAS_DISPONIBILIDADE:
+        raise HTTPException(
+            status_code=400, detail=f"Periodo invalido (maximo de {MAX_DIAS_DISPONIBILIDADE} dias)"
+        )
+    if hora_fim <= hora_inicio:
+        raise HTTPException(status_code=400, detail="Fim do expediente deve ser maior que o inicio")
+    if responsavel_id is None and not sala:
+        responsavel_id = current_user.id
+
+    return await calcular_disponibilidade(
+        db,
+        inicio,
+        fim,
+        timedelta(minutes=duracao),
+        salas=sala,
+        responsavel_id=responsavel_id,
+        hora_inicio=hora_inicio,
+        hora_fim=hora_fim,
+        dias_semana=set(dias_semana),
+    )
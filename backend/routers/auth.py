@@ -1,12 +1,17 @@
 from datetime import datetime, timedelta, timezone
+import hmac
 import secrets
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import func, insert, inspect, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
 
 from config import settings
-from database import get_db
+from database import get_db, violou_unicidade
 from models import PasswordResetToken, User
+from principal_cache import Principal, principal_cache
 from schemas import (
     LoginRequest,
     PasswordChange,
@@ -17,13 +22,17 @@ from schemas import (
     UserCreate,
     UserOut,
 )
+from serializacao import colunas, montar
 from security import (
     authenticate_user,
     create_access_token,
     get_current_user,
-    get_password_hash,
-    verify_password,
+    get_password_hash_async,
+    reset_token_digest,
+    stale_reset_tokens,
+    verify_password_async,
 )
+from write_behind import LAST_LOGIN, write_behind
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
 RESET_TOKEN_TTL_MINUTES = 30
@@ -35,32 +44,37 @@ def _generate_numeric_token(length: int = 6) -> str:
 
 
 @router.post("/register", response_model=UserOut, status_code=status.HTTP_201_CREATED)
-def register(user_in: UserCreate, db: Session = Depends(get_db)):
-    exists = db.query(User).filter(User.email == user_in.email).first()
-    if exists:
-        raise HTTPException(status_code=400, detail="E-mail ja cadastrado")
-    if user_in.crm:
-        crm_exists = db.query(User).filter(User.crm == user_in.crm).first()
-        if crm_exists:
+async def register(user_in: UserCreate, db: AsyncSession = Depends(get_db)):
+    # E-mail e CRM unicos ficam com as constraints: um INSERT ... RETURNING, sem SELECTs antes nem refresh depois
+    hashed_password = await get_password_hash_async(user_in.password)
+    try:
+        result = await db.execute(
+            insert(User)
+            .values(
+                nome=user_in.nome,
+                email=user_in.email,
+                hashed_password=hashed_password,
+                role="doctor",
+                telefone=user_in.telefone,
+                crm=user_in.crm,
+            )
+            .returning(*colunas(User, UserOut))
+        )
+        user = montar(result.mappings(), UserOut)[0]
+        await db.commit()
+    except IntegrityError as exc:
+        await db.rollback()
+        if violou_unicidade(exc, "users", "email"):
+            raise HTTPException(status_code=400, detail="E-mail ja cadastrado")
+        if violou_unicidade(exc, "users", "crm"):
             raise HTTPException(status_code=400, detail="CRM ja cadastrado")
-
-    user = User(
-        nome=user_in.nome,
-        email=user_in.email,
-        hashed_password=get_password_hash(user_in.password),
-        role="doctor",
-        telefone=user_in.telefone,
-        crm=user_in.crm,
-    )
-    db.add(user)
-    db.commit()
-    db.refresh(user)
+        raise
     return user
 
 
 @router.post("/login", response_model=Token)
-def login(payload: LoginRequest, db: Session = Depends(get_db)):
-    user = authenticate_user(db, payload.email, payload.password)
+async def login(payload: LoginRequest, db: AsyncSession = Depends(get_db)):
+    user = await authenticate_user(db, payload.email, payload.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -70,33 +84,60 @@ def login(payload: LoginRequest, db: Session = Depends(get_db)):
     if not user.is_active:
         raise HTTPException(status_code=403, detail="Usuario inativo")
 
-    user.last_login = datetime.now(timezone.utc)
-    db.commit()
-    db.refresh(user)
+    if inspect(user).modified:
+        # authenticate_user regravou o hash com os parametros atuais do bcrypt
+        await db.commit()
+    agora = datetime.now(timezone.utc)
+    write_behind.registrar(LAST_LOGIN, {"id": user.id, "last_login": agora}, chave=user.id)
+    # So na resposta: a gravacao fica com a fila, sem marcar o objeto como alterado
+    set_committed_value(user, "last_login", agora)
 
     access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
-    access_token = create_access_token(subject=str(user.id), expires_delta=access_token_expires)
+    access_token = create_access_token(
+        subject=str(user.id), expires_delta=access_token_expires, token_version=user.token_version
+    )
+    principal_cache.invalidate(user.id)
     return Token(access_token=access_token, user=user, token_type="bearer")
 
 
 @router.get("/me", response_model=UserOut)
-def read_me(current_user: User = Depends(get_current_user)):
+async def read_me(current_user: Principal = Depends(get_current_user)):
     return current_user
 
 
 @router.post("/forgot-password", response_model=PasswordResetOut)
-def forgot_password(payload: PasswordResetRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == payload.email).first()
+async def forgot_password(payload: PasswordResetRequest, db: AsyncSession = Depends(get_db)):
+    user = await db.scalar(select(User).where(User.email == payload.email))
     if not user:
         raise HTTPException(status_code=404, detail="Usuario nao encontrado")
 
+    now = datetime.now(timezone.utc)
+    await db.execute(stale_reset_tokens(now, user_id=user.id))
+
+    emitidos = await db.scalar(
+        select(func.count())
+        .select_from(PasswordResetToken)
+        .where(PasswordResetToken.user_id == user.id, PasswordResetToken.created_at >= now - timedelta(hours=1))
+    )
+    if emitidos >= settings.reset_token_max_requests_per_hour:
+        await db.commit()
+        raise HTTPException(status_code=429, detail="Muitas solicitacoes de recuperacao. Tente mais tarde")
+
+    # Apenas o token mais recente fica ativo
+    await db.execute(
+        update(PasswordResetToken)
+        .where(PasswordResetToken.user_id == user.id, PasswordResetToken.is_used.is_(False))
+        .values(is_used=True)
+        .execution_options(synchronize_session=False)
+    )
+
     token_plain = _generate_numeric_token()
-    token_hash = get_password_hash(token_plain)
-    expires_at = datetime.now(timezone.utc) + timedelta(minutes=RESET_TOKEN_TTL_MINUTES)
-    reset = PasswordResetToken(user_id=user.id, token_hash=token_hash, expires_at=expires_at)
+    expires_at = now + timedelta(minutes=RESET_TOKEN_TTL_MINUTES)
+    reset = PasswordResetToken(
+        user_id=user.id, token_hash=reset_token_digest(user.id, token_plain), expires_at=expires_at
+    )
     db.add(reset)
-    db.commit()
-    db.refresh(reset)
+    await db.commit()
 
     return PasswordResetOut(
         message="Token de recuperacao gerado. Envie ao usuario.",
@@ -106,54 +147,94 @@ def forgot_password(payload: PasswordResetRequest, db: Session = Depends(get_db)
 
 
 @router.post("/reset-password")
-def reset_password(payload: PasswordResetConfirm, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == payload.email).first()
+async def reset_password(payload: PasswordResetConfirm, db: AsyncSession = Depends(get_db)):
+    user = await db.scalar(select(User).where(User.email == payload.email))
     if not user:
         raise HTTPException(status_code=404, detail="Usuario nao encontrado")
 
-    token_entries = (
-        db.query(PasswordResetToken)
-        .filter(PasswordResetToken.user_id == user.id, PasswordResetToken.is_used.is_(False))
-        .order_by(PasswordResetToken.created_at.desc())
-        .all()
-    )
-    if not token_entries:
-        raise HTTPException(status_code=400, detail="Nenhum token ativo encontrado")
-
     now = datetime.now(timezone.utc)
-    valid_token = next(
-        (
-            t
-            for t in token_entries
-            if t.expires_at >= now and verify_password(payload.token, t.token_hash)
-        ),
-        None,
+    # Cada palpite gasta uma tentativa antes da comparacao, num UPDATE atomico: palpites
+    # concorrentes esperam o lock da linha e param em reset_token_max_attempts
+    result = await db.execute(
+        update(PasswordResetToken)
+        .where(
+            PasswordResetToken.user_id == user.id,
+            PasswordResetToken.is_used.is_(False),
+            PasswordResetToken.expires_at >= now,
+            PasswordResetToken.attempts < settings.reset_token_max_attempts,
+        )
+        .values(attempts=PasswordResetToken.attempts + 1)
+        .returning(PasswordResetToken.id, PasswordResetToken.token_hash, PasswordResetToken.attempts)
+        .execution_options(synchronize_session=False)
     )
+    tentativas = result.all()
+    digest = reset_token_digest(user.id, payload.token)
+    valid_token = next((t for t in tentativas if hmac.compare_digest(t.token_hash, digest)), None)
     if not valid_token:
+        esgotados = [t.id for t in tentativas if t.attempts >= settings.reset_token_max_attempts]
+        if esgotados:
+            await db.execute(
+                update(PasswordResetToken)
+                .where(PasswordResetToken.id.in_(esgotados))
+                .values(is_used=True)
+                .execution_options(synchronize_session=False)
+            )
+        await db.commit()
+        if not tentativas:
+            raise HTTPException(status_code=400, detail="Nenhum token ativo encontrado")
+        raise HTTPException(status_code=400, detail="Token invalido ou expirado")
+    # A tentativa fica gravada antes do bcrypt, que nao deve rodar segurando o lock da linha
+    await db.commit()
+
+    hashed_password = await get_password_hash_async(payload.new_password)
+    # So um pedido consome o token: um segundo com o mesmo codigo nao acha mais a linha livre
+    result = await db.execute(
+        update(PasswordResetToken)
+        .where(PasswordResetToken.id == valid_token.id, PasswordResetToken.is_used.is_(False))
+        .values(is_used=True)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        await db.rollback()
         raise HTTPException(status_code=400, detail="Token invalido ou expirado")
 
-    user.hashed_password = get_password_hash(payload.new_password)
-    for token in token_entries:
-        token.is_used = True
-    db.commit()
+    user.hashed_password = hashed_password
+    user.token_version = (user.token_version or 0) + 1
+    await db.execute(
+        update(PasswordResetToken)
+        .where(PasswordResetToken.user_id == user.id, PasswordResetToken.is_used.is_(False))
+        .values(is_used=True)
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(stale_reset_tokens(now, user_id=user.id))
+    await db.commit()
+    principal_cache.invalidate(user.id)
 
     return {"message": "Senha redefinida com sucesso"}
 
 
 @router.post("/change-password")
-def change_password(
+async def change_password(
     payload: PasswordChange,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    if not verify_password(payload.current_password, current_user.hashed_password):
+    user = await db.get(User, current_user.id)
+    if not await verify_password_async(payload.current_password, user.hashed_password):
         raise HTTPException(status_code=400, detail="Senha atual incorreta")
 
-    current_user.hashed_password = get_password_hash(payload.new_password)
+    user.hashed_password = await get_password_hash_async(payload.new_password)
+    # Tokens emitidos antes da troca deixam de valer; devolve um novo para esta sessao
+    user.token_version = (user.token_version or 0) + 1
     # Invalida tokens de reset ativos ao trocar a senha
-    db.query(PasswordResetToken).filter(
-        PasswordResetToken.user_id == current_user.id, PasswordResetToken.is_used.is_(False)
-    ).update({"is_used": True})
-    db.commit()
+    await db.execute(
+        update(PasswordResetToken)
+        .where(PasswordResetToken.user_id == current_user.id, PasswordResetToken.is_used.is_(False))
+        .values(is_used=True)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    principal_cache.invalidate(user.id)
 
-    return {"message": "Senha alterada com sucesso"}
+    access_token = create_access_token(subject=str(user.id), token_version=user.token_version)
+    return {"message": "Senha alterada com sucesso", "access_token": access_token, "token_type": "bearer"}
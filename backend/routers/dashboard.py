@@ -0,0 +1,120 @@
+"""Tela inicial do app em uma unica requisicao.
+
+O app abria a home com /auth/me, /agendamentos/ e /financeiro/ em sequencia, cada
+chamada autenticando de novo e abrindo sua propria sessao. Aqui a autenticacao
+acontece uma vez e as consultas, independentes entre si, rodam em paralelo, cada
+uma na sua sessao (uma conexao do pool por consulta enquanto durar a requisicao).
+
+Cada tela pega ate CONSULTAS conexoes, uma de cada vez. Sem limite, uma rajada de
+telas poderia ocupar o pool inteiro com telas que tem parte das conexoes e esperam
+o resto (ate DB_POOL_TIMEOUT_SECONDS, e entao 500). `_telas` deixa entrar so as
+que cabem juntas no pool; as demais esperam sem segurar conexao nenhuma.
+"""
+import asyncio
+from zoneinfo import ZoneInfo
+
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy import func, select
+
+import exportacao
+from agenda import STATUS_CANCELADO
+from config import settings
+from database import open_session
+from models import Agendamento, Paciente, utcnow
+from principal_cache import Principal
+from replicas import replica_de_leitura
+from rollups import mes_da_clinica, resumo
+from schemas import AgendamentoOut, DashboardOut, PacienteOut, UserOut
+from security import get_current_user
+from serializacao import colunas, montar, resposta_condicional
+
+router = APIRouter(prefix="/dashboard", tags=["Dashboard"])
+MAX_HOJE = 200
+MAX_PROXIMOS = 10
+STATUS_FINALIZADO = "finalizado"
+# Sessoes abertas em paralelo por tela: hoje, proximos, financeiro e contagens
+CONSULTAS = 4
+_telas = asyncio.Semaphore(max(1, (settings.db_pool_size + settings.db_max_overflow) // CONSULTAS))
+
+
+def _visiveis(model, current_user: Principal):
+    return ((model.responsavel_id == current_user.id) | (model.responsavel_id.is_(None))) & (
+        model.deleted_at.is_(None)
+    )
+
+
+def _agendamentos(current_user: Principal):
+    return (
+        select(*colunas(Agendamento, AgendamentoOut), *colunas(Paciente, PacienteOut, prefixo="paciente__"))
+        .join(Paciente, Agendamento.paciente_id == Paciente.id)
+        .where(_visiveis(Agendamento, current_user))
+    )
+
+
+async def _listar(query, replica) -> list[dict]:
+    async with open_session(replica) as db:
+        result = await db.execute(query)
+        return montar(result.mappings(), AgendamentoOut)
+
+
+async def _contagens(current_user: Principal, inicio, fim, agora, replica) -> dict:
+    def contar(model, *filtros):
+        return select(func.count()).select_from(model).where(_visiveis(model, current_user), *filtros).scalar_subquery()
+
+    hoje = (Agendamento.data_hora_inicio >= inicio, Agendamento.data_hora_inicio < fim)
+    query = select(
+        contar(Paciente).label("pacientes"),
+        contar(Agendamento, *hoje).label("agendamentos_hoje"),
+        contar(Agendamento, *hoje, Agendamento.status == STATUS_FINALIZADO).label("atendidos_hoje"),
+        contar(
+            Agendamento, Agendamento.data_hora_inicio >= agora, Agendamento.status != STATUS_CANCELADO
+        ).label("agendamentos_futuros"),
+    )
+    async with open_session(replica) as db:
+        return dict((await db.execute(query)).mappings().one())
+
+
+async def _financeiro(current_user: Principal, dia, replica) -> dict:
+    # O mes da clinica, como os limites da agenda e os buckets do resumo: `dia` ja esta em clinic_timezone
+    async with open_session(replica) as db:
+        mes = mes_da_clinica(dia)
+        return await resumo(db, current_user.id, mes, mes)
+
+
+@router.get("/", response_model=DashboardOut)
+async def dashboard(request: Request, current_user: Principal = Depends(get_current_user)):
+    agora = utcnow()
+    dia = agora.astimezone(ZoneInfo(settings.clinic_timezone)).date()
+    inicio, fim = exportacao.inicio_do_dia(dia), exportacao.fim_do_dia(dia)
+    # Uma escolha para a tela toda: as quatro consultas veem o mesmo ponto da replicacao
+    replica = replica_de_leitura(request)
+
+    async with _telas:
+        hoje, proximos, financeiro, contagens = await asyncio.gather(
+            _listar(
+                _agendamentos(current_user)
+                .where(Agendamento.data_hora_inicio >= inicio, Agendamento.data_hora_inicio < fim)
+                .order_by(Agendamento.data_hora_inicio, Agendamento.id)
+                .limit(MAX_HOJE),
+                replica,
+            ),
+            _listar(
+                _agendamentos(current_user)
+                .where(Agendamento.data_hora_inicio >= agora, Agendamento.status != STATUS_CANCELADO)
+                .order_by(Agendamento.data_hora_inicio, Agendamento.id)
+                .limit(MAX_PROXIMOS),
+                replica,
+            ),
+            _financeiro(current_user, dia, replica),
+            _contagens(current_user, inicio, fim, agora, replica),
+        )
+    return resposta_condicional(
+        request,
+        {
+            "user": UserOut.model_validate(current_user).model_dump(),
+            "hoje": hoje,
+            "proximos": proximos,
+            "financeiro": financeiro,
+            "contagens": contagens,
+        },
+    )
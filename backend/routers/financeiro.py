@@ -1,51 +1,156 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from datetime import date
+from typing import Literal, Optional
 
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import exportacao
+import sincronizacao
+from cache_respostas import cache_respostas, incrementar_versao, versao_dos_dados
 from database import get_db
-from models import Transacao, User
-from schemas import TransacaoCreate, TransacaoOut
+from models import Transacao, utcnow
+from principal_cache import Principal
+from replicas import get_db_leitura, replica_de_leitura
+from rollups import aplicar_transacoes, resumo
+from schemas import ResumoFinanceiroOut, TransacaoCreate, TransacaoOut
 from security import get_current_user
+from serializacao import colunas, montar
 
 router = APIRouter(prefix="/financeiro", tags=["Financeiro"])
 
 
 @router.post("/transacoes/", response_model=TransacaoOut, status_code=201)
-def criar_transacao(
+async def criar_transacao(
     transacao: TransacaoCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    nova_transacao = Transacao(
-        descricao=transacao.descricao,
-        valor=transacao.valor,
-        tipo=transacao.tipo,
-        categoria=transacao.categoria,
-        pago=transacao.pago,
-        responsavel_id=current_user.id,
-    )
-    db.add(nova_transacao)
-    db.commit()
-    db.refresh(nova_transacao)
+    valores = {
+        "descricao": transacao.descricao,
+        "valor": transacao.valor,
+        "tipo": transacao.tipo,
+        "categoria": transacao.categoria,
+        "pago": transacao.pago,
+        "data_competencia": utcnow(),
+        "responsavel_id": current_user.id,
+    }
+    result = await db.execute(insert(Transacao).values(**valores).returning(*colunas(Transacao, TransacaoOut)))
+    nova_transacao = montar(result.mappings(), TransacaoOut)[0]
+    # O bucket do resumo e somado com os valores enviados, sem reler a transacao
+    await aplicar_transacoes(db, [Transacao(**valores)])
+    await incrementar_versao(db, current_user.id)
+    await db.commit()
     return nova_transacao
 
 
 @router.get("/transacoes/", response_model=list[TransacaoOut])
-def listar_transacoes(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+async def listar_transacoes(
+    request: Request,
+    since: Optional[str] = Query(None, description="Watermark (X-Watermark) da ultima sincronizacao"),
+    db: AsyncSession = Depends(get_db_leitura),
+    current_user: Principal = Depends(get_current_user),
 ):
-    return (
-        db.query(Transacao)
-        .filter((Transacao.responsavel_id == current_user.id) | (Transacao.responsavel_id.is_(None)))
+    desde = sincronizacao.decode_watermark(since)
+    versoes = await versao_dos_dados(db, current_user.id)
+    em_cache = await cache_respostas.obter(request, current_user.id, versoes)
+    if em_cache is not None:
+        return em_cache
+
+    watermark = sincronizacao.proximo_watermark(desde)
+    result = await db.execute(
+        select(*colunas(Transacao, TransacaoOut))
+        .where((Transacao.responsavel_id == current_user.id) | (Transacao.responsavel_id.is_(None)))
+        .where(sincronizacao.filtro(Transacao, desde))
         .order_by(Transacao.data_competencia.desc())
-        .all()
+    )
+    return await cache_respostas.responder(
+        request, current_user.id, versoes, montar(result.mappings(), TransacaoOut),
+        {sincronizacao.WATERMARK_HEADER: watermark},
+    )
+
+
+@router.delete("/transacoes/{transacao_id}", status_code=204)
+async def excluir_transacao(
+    transacao_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    transacao = await db.get(Transacao, transacao_id)
+    if not transacao or transacao.deleted_at is not None:
+        raise HTTPException(status_code=404, detail="Transacao nao encontrada")
+    if transacao.responsavel_id not in (None, current_user.id):
+        raise HTTPException(status_code=403, detail="Sem acesso a esta transacao")
+    # Exclusao logica: estorna o resumo e deixa o tombstone para o ?since=
+    await aplicar_transacoes(db, [transacao], sinal=-1)
+    transacao.deleted_at = utcnow()
+    await incrementar_versao(db, transacao.responsavel_id)
+    await db.commit()
+    return Response(status_code=204)
+
+
+@router.get("/transacoes/export")
+async def exportar_transacoes(
+    request: Request,
+    formato: Literal["csv", "ndjson"] = Query("csv"),
+    inicio: Optional[date] = Query(None, description="Primeiro dia de competencia (inclusivo)"),
+    fim: Optional[date] = Query(None, description="Ultimo dia de competencia (inclusivo)"),
+    categoria: list[str] = Query([], description="Categorias exportadas (repita o parametro para varias)"),
+    tipo: Optional[str] = Query(None, description="receita ou despesa"),
+    current_user: Principal = Depends(get_current_user),
+):
+    query = select(
+        Transacao.id,
+        Transacao.data_competencia,
+        Transacao.descricao,
+        Transacao.tipo,
+        Transacao.categoria,
+        Transacao.valor,
+        Transacao.pago,
+    ).where(
+        (Transacao.responsavel_id == current_user.id) | (Transacao.responsavel_id.is_(None)),
+        Transacao.deleted_at.is_(None),
+    )
+    if inicio is not None:
+        query = query.where(Transacao.data_competencia >= exportacao.inicio_do_dia(inicio))
+    if fim is not None:
+        query = query.where(Transacao.data_competencia < exportacao.fim_do_dia(fim))
+    if categoria:
+        query = query.where(Transacao.categoria.in_(categoria))
+    if tipo is not None:
+        query = query.where(Transacao.tipo == tipo)
+    return exportacao.exportar(
+        query.order_by(Transacao.data_competencia, Transacao.id),
+        formato,
+        "transacoes",
+        replica=replica_de_leitura(request),
     )
 
 
 @router.get("/", response_model=list[TransacaoOut])
-def alias_financeiro(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+async def alias_financeiro(
+    request: Request,
+    since: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_db_leitura),
+    current_user: Principal = Depends(get_current_user),
 ):
     # Alias para compatibilidade com o app mobile atual
-    return listar_transacoes(db=db, current_user=current_user)
+    return await listar_transacoes(request=request, since=since, db=db, current_user=current_user)
+
+
+@router.get("/resumo", response_model=ResumoFinanceiroOut)
+async def resumo_financeiro(
+    request: Request,
+    inicio: Optional[date] = Query(None, description="Primeiro mes considerado"),
+    fim: Optional[date] = Query(None, description="Ultimo mes considerado"),
+    db: AsyncSession = Depends(get_db_leitura),
+    current_user: Principal = Depends(get_current_user),
+):
+    versoes = await versao_dos_dados(db, current_user.id)
+    em_cache = await cache_respostas.obter(request, current_user.id, versoes)
+    if em_cache is not None:
+        return em_cache
+    # Le os buckets pre-agregados (O(buckets)), nao as transacoes
+    return await cache_respostas.responder(
+        request, current_user.id, versoes, await resumo(db, current_user.id, inicio, fim)
+    )
@@ -0,0 +1,99 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import mutacoes
+from agenda import ocupacao_cache
+from cache_respostas import cache_respostas
+from config import settings
+from database import get_db, pool_snapshot
+from hashing import password_pool
+from metricas import amostrador
+from particoes import manutencao_particoes
+from replicas import roteador
+from saude import prontidao
+from security import auth_cache_stats, set_user_active
+from write_behind import write_behind
+
+
+def require_internal_access(x_internal_token: Optional[str] = Header(None)) -> None:
+    if settings.internal_token:
+        if x_internal_token != settings.internal_token:
+            raise HTTPException(status_code=403, detail="Acesso restrito")
+    elif settings.environment == "prod":
+        raise HTTPException(status_code=403, detail="Acesso restrito")
+
+
+router = APIRouter(prefix="/internal", tags=["Interno"], dependencies=[Depends(require_internal_access)])
+
+
+@router.get("/password-pool")
+def password_pool_stats():
+    return password_pool.snapshot()
+
+
+@router.get("/auth-cache")
+def auth_cache():
+    return auth_cache_stats()
+
+
+@router.get("/availability-cache")
+def availability_cache():
+    return ocupacao_cache.snapshot()
+
+
+@router.get("/response-cache")
+async def response_cache():
+    return await cache_respostas.snapshot()
+
+
+@router.get("/db-pool")
+def db_pool():
+    return pool_snapshot()
+
+
+@router.get("/replicas")
+def replicas_stats():
+    return roteador.snapshot()
+
+
+@router.get("/readiness")
+def readiness():
+    return prontidao.snapshot()
+
+
+@router.get("/write-behind")
+def write_behind_stats():
+    return write_behind.snapshot()
+
+
+@router.get("/sync")
+def sync_stats():
+    return mutacoes.stats_snapshot()
+
+
+@router.get("/partitions")
+def partitions_stats():
+    # Vazio fora do Postgres; as tabelas aparecem depois da primeira verificacao do loop
+    return manutencao_particoes.snapshot()
+
+
+@router.get("/profiles")
+def slow_request_profiles():
+    # Vazio quando PROFILER_SLOW_MS=0
+    return list(amostrador.perfis) if amostrador is not None else []
+
+
+@router.post("/users/{user_id}/deactivate")
+async def deactivate_user(user_id: int, db: AsyncSession = Depends(get_db)):
+    if not await set_user_active(db, user_id, False):
+        raise HTTPException(status_code=404, detail="Usuario nao encontrado")
+    return {"message": "Usuario desativado"}
+
+
+@router.post("/users/{user_id}/activate")
+async def activate_user(user_id: int, db: AsyncSession = Depends(get_db)):
+    if not await set_user_active(db, user_id, True):
+        raise HTTPException(status_code=404, detail="Usuario nao encontrado")
+    return {"message": "Usuario ativado"}
@@ -1,59 +1,227 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+import re
+from typing import Optional
 
-from database import get_db
-from models import Paciente, User
-from schemas import PacienteCreate, PacienteOut
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import case, func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import importacao
+import sincronizacao
+from agenda import STATUS_CANCELADO, ocupacao_cache
+from cache_respostas import cache_respostas, incrementar_versao, versao_dos_dados
+from database import get_db, remover_acentos, violou_unicidade
+from models import Agendamento, Paciente, utcnow
+from principal_cache import Principal
+from replicas import get_db_leitura
+from serializacao import colunas, montar
+from schemas import ImportacaoPacientesOut, PacienteCreate, PacienteOut
 from security import get_current_user
 
 router = APIRouter(prefix="/pacientes", tags=["Pacientes"])
+MAX_RESULTADOS_BUSCA = 50
 
 
 @router.post("/", response_model=PacienteOut, status_code=201)
-def criar_paciente(
+async def criar_paciente(
     paciente: PacienteCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    if paciente.cpf:
-        existe = db.query(Paciente).filter(Paciente.cpf == paciente.cpf).first()
-        if existe:
+    # A unicidade do CPF fica com a constraint: um INSERT ... RETURNING, sem SELECT antes nem refresh depois
+    try:
+        result = await db.execute(
+            insert(Paciente)
+            .values(
+                nome=paciente.nome,
+                telefone=paciente.telefone,
+                email=paciente.email,
+                cpf=paciente.cpf,
+                responsavel_id=current_user.id,
+            )
+            .returning(*colunas(Paciente, PacienteOut))
+        )
+        novo_paciente = montar(result.mappings(), PacienteOut)[0]
+        await incrementar_versao(db, current_user.id)
+        await db.commit()
+    except IntegrityError as exc:
+        await db.rollback()
+        if violou_unicidade(exc, "pacientes", "cpf"):
             raise HTTPException(status_code=400, detail="CPF ja cadastrado")
-
-    novo_paciente = Paciente(
-        nome=paciente.nome,
-        telefone=paciente.telefone,
-        email=paciente.email,
-        cpf=paciente.cpf,
-        responsavel_id=current_user.id,
-    )
-    db.add(novo_paciente)
-    db.commit()
-    db.refresh(novo_paciente)
+        raise
     return novo_paciente
 
 
+@router.post("/bulk", response_model=ImportacaoPacientesOut)
+async def importar_pacientes(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    """Importa CSV (cabecalho nome,telefone,email,cpf) ou NDJSON numa unica transacao.
+
+    Linhas invalidas ou com CPF repetido sao rejeitadas individualmente e
+    listadas em `erros` pelo numero da linha no arquivo; as demais sao gravadas.
+    """
+    formato = importacao.formato_do_content_type(request.headers.get("content-type"))
+
+    await importacao.criar_staging(db)
+    recebidas, erros, lote = 0, [], []
+    async for linha, valores, erro in importacao.ler_linhas(request.stream(), formato):
+        recebidas += 1
+        if erro is not None:
+            # So os primeiros MAX_ERROS vao para o relatorio; `rejeitadas` traz o total
+            if len(erros) < importacao.MAX_ERROS:
+                erros.append((linha, erro))
+            continue
+        lote.append((linha, *valores))
+        if len(lote) >= importacao.LOTE:
+            await importacao.copiar_lote(db, lote)
+            lote = []
+    await importacao.copiar_lote(db, lote)
+
+    importadas, erros_cpf = await importacao.consolidar(db, current_user.id)
+    if importadas:
+        await incrementar_versao(db, current_user.id)
+    await db.commit()
+
+    erros = sorted(erros + erros_cpf)[: importacao.MAX_ERROS]
+    return {
+        "recebidas": recebidas,
+        "importadas": importadas,
+        "rejeitadas": recebidas - importadas,
+        "erros": [{"linha": linha, "erro": erro} for linha, erro in erros],
+    }
+
+
 @router.get("/", response_model=list[PacienteOut])
-def listar_pacientes(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+async def listar_pacientes(
+    request: Request,
+    since: Optional[str] = Query(None, description="Watermark (X-Watermark) da ultima sincronizacao"),
+    db: AsyncSession = Depends(get_db_leitura),
+    current_user: Principal = Depends(get_current_user),
 ):
-    return (
-        db.query(Paciente)
-        .filter((Paciente.responsavel_id == current_user.id) | (Paciente.responsavel_id.is_(None)))
+    desde = sincronizacao.decode_watermark(since)
+    versoes = await versao_dos_dados(db, current_user.id)
+    em_cache = await cache_respostas.obter(request, current_user.id, versoes)
+    if em_cache is not None:
+        return em_cache
+
+    watermark = sincronizacao.proximo_watermark(desde)
+    result = await db.execute(
+        select(*colunas(Paciente, PacienteOut))
+        .where((Paciente.responsavel_id == current_user.id) | (Paciente.responsavel_id.is_(None)))
+        .where(sincronizacao.filtro(Paciente, desde))
         .order_by(Paciente.nome)
-        .all()
     )
+    return await cache_respostas.responder(
+        request, current_user.id, versoes, montar(result.mappings(), PacienteOut),
+        {sincronizacao.WATERMARK_HEADER: watermark},
+    )
+
+
+def _like_escape(termo: str) -> str:
+    return termo.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+@router.get("/search", response_model=list[PacienteOut])
+async def buscar_pacientes(
+    q: str = Query(..., min_length=1, max_length=120, description="Trecho do nome, inicio do telefone ou CPF"),
+    limit: int = Query(20, ge=1, le=MAX_RESULTADOS_BUSCA),
+    db: AsyncSession = Depends(get_db_leitura),
+    current_user: Principal = Depends(get_current_user),
+):
+    """Busca para autocompletar: nome sem acento/caixa, prefixo do telefone e CPF exato.
+
+    As expressoes casam com os indices da migracao 0007 (trigrama e prefixo).
+    """
+    termo = " ".join(remover_acentos(q).lower().split())
+    digitos = re.sub(r"\D", "", q)
+    if not termo:
+        return []
+
+    dialect = db.get_bind().dialect.name
+    # O Postgres ja usa "\" como escape do LIKE; o SQLite precisa da clausula ESCAPE
+    escape = None if dialect == "postgresql" else "\\"
+    nome_busca = func.lower(func.f_unaccent(Paciente.nome))
+    telefone_busca = func.f_digitos(Paciente.telefone)
+    nome_prefixo = nome_busca.like(_like_escape(termo) + "%", escape=escape)
+
+    # Trigramas so ajudam a partir de 3 caracteres; abaixo disso, apenas prefixo
+    criterios = [nome_busca.like(f"%{_like_escape(termo)}%", escape=escape) if len(termo) >= 3 else nome_prefixo]
+    relevancia = [(nome_prefixo, 2)]
+    if len(digitos) >= 2:
+        telefone_prefixo = telefone_busca.like(digitos + "%", escape=escape)
+        criterios.append(telefone_prefixo)
+        relevancia.insert(0, (telefone_prefixo, 1))
+    if len(digitos) == 11:
+        criterios.append(Paciente.cpf == digitos)
+        relevancia.insert(0, (Paciente.cpf == digitos, 0))
+
+    ordem = [case(*relevancia, else_=3)]
+    if dialect == "postgresql":
+        ordem.append(func.similarity(nome_busca, termo).desc())
+    else:
+        ordem.append(func.length(Paciente.nome))
+    result = await db.scalars(
+        select(Paciente)
+        .where((Paciente.responsavel_id == current_user.id) | (Paciente.responsavel_id.is_(None)))
+        .where(Paciente.deleted_at.is_(None), or_(*criterios))
+        .order_by(*ordem, Paciente.nome, Paciente.id)
+        .limit(limit)
+    )
+    return result.all()
 
 
 @router.get("/{paciente_id}", response_model=PacienteOut)
-def obter_paciente(
+async def obter_paciente(
     paciente_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db_leitura),
+    current_user: Principal = Depends(get_current_user),
 ):
-    paciente = db.query(Paciente).filter(Paciente.id == paciente_id).first()
-    if not paciente:
+    return await _paciente_acessivel(db, paciente_id, current_user)
+
+
+@router.delete("/{paciente_id}", status_code=204)
+async def excluir_paciente(
+    paciente_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    # Exclusao logica: a linha vira tombstone para os clientes que sincronizam com ?since=
+    paciente = await _paciente_acessivel(db, paciente_id, current_user)
+    agora = utcnow()
+    paciente.deleted_at = agora
+    paciente.updated_at = agora
+    # Os agendamentos futuros do paciente sao cancelados na mesma transacao: saem da agenda,
+    # liberam o horario (constraints e conflitos ignoram cancelados) e chegam aos clientes pelo ?since=
+    cancelados = (
+        await db.execute(
+            update(Agendamento)
+            .where(
+                Agendamento.paciente_id == paciente_id,
+                Agendamento.data_hora_inicio >= agora,
+                Agendamento.status != STATUS_CANCELADO,
+                Agendamento.deleted_at.is_(None),
+            )
+            .values(status=STATUS_CANCELADO, updated_at=agora)
+            .returning(
+                Agendamento.data_hora_inicio, Agendamento.data_hora_fim, Agendamento.sala, Agendamento.responsavel_id
+            )
+            .execution_options(synchronize_session=False)
+        )
+    ).all()
+    # O paciente tambem aparece embutido nos agendamentos de outros medicos: invalida todos
+    await incrementar_versao(db, current_user.id, None, *(c.responsavel_id for c in cancelados))
+    await db.commit()
+    for cancelado in cancelados:
+        ocupacao_cache.invalidar(*cancelado)
+    return Response(status_code=204)
+
+
+async def _paciente_acessivel(db, paciente_id: int, current_user: Principal) -> Paciente:
+    paciente = await db.get(Paciente, paciente_id)
+    if not paciente or paciente.deleted_at is not None:
         raise HTTPException(status_code=404, detail="Paciente nao encontrado")
     if paciente.responsavel_id not in (None, current_user.id):
         raise HTTPException(status_code=403, detail="Sem acesso a este paciente")
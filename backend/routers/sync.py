@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import mutacoes
+from config import settings
+from database import get_db
+from principal_cache import Principal
+from schemas import SyncIn, SyncOut
+from security import get_current_user
+from serializacao import ORJSONResponse
+
+router = APIRouter(tags=["Sincronizacao"])
+
+
+@router.post("/sync", response_model=SyncOut)
+async def sincronizar(
+    lote: SyncIn,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    """Aplica um lote ordenado de criacoes feitas offline, numa unica transacao.
+
+    Mutacoes cuja `chave` ja foi aplicada voltam com o resultado gravado
+    (`repetida: true`); `ids` mapeia os temp_ids do cliente para os ids criados.
+    """
+    if len(lote.mutacoes) > settings.sync_max_mutations:
+        raise HTTPException(status_code=413, detail=f"Lote limitado a {settings.sync_max_mutations} mutacoes")
+    return ORJSONResponse(await mutacoes.aplicar(db, lote.mutacoes, current_user.id))
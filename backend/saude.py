@@ -0,0 +1,157 @@
+"""Aquecimento na subida e probes de vida/prontidao.
+
+Na subida o lifespan abre DB_POOL_WARMUP conexoes do pool ao mesmo tempo (e as
+devolve), carrega o backend do bcrypt em cada worker do pool de hashing e cria o
+usuario padrao se ele nao existir: as primeiras requisicoes depois de um deploy
+nao pagam mais o handshake com o banco nem o custo frio do bcrypt.
+
+- /health/live nao toca no banco: so diz que o processo responde.
+- /health/ready roda um SELECT 1 de verdade, mas o resultado fica em cache por
+  READINESS_TTL_SECONDS e probes simultaneos esperam a mesma verificacao, entao
+  varios orquestradores batendo no endpoint nao disputam o pool com as rotas.
+"""
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.pool import QueuePool
+from starlette.concurrency import run_in_threadpool
+
+from config import settings
+from database import async_engine, engine, open_session
+from hashing import password_pool
+from security import ensure_default_admin
+
+logger = logging.getLogger(__name__)
+
+
+def _conectar_sync():
+    conexao = engine.connect()
+    conexao.execute(text("SELECT 1"))
+    return conexao
+
+
+async def _conectar_async():
+    conexao = await async_engine.connect().start()
+    await conexao.execute(text("SELECT 1"))
+    return conexao
+
+
+async def aquecer_pool(total: int) -> int:
+    """Abre `total` conexoes em paralelo e as devolve ao pool; retorna quantas abriram."""
+    alvo = async_engine if async_engine is not None else engine
+    # NullPool (PgBouncer) e o pool do SQLite em memoria nao guardam conexoes para reuso
+    if total <= 0 or not isinstance(alvo.pool, QueuePool):
+        return 0
+    total = min(total, settings.db_pool_size)
+
+    if async_engine is not None:
+        resultados = await asyncio.gather(*(_conectar_async() for _ in range(total)), return_exceptions=True)
+    else:
+        resultados = await asyncio.gather(
+            *(run_in_threadpool(_conectar_sync) for _ in range(total)), return_exceptions=True
+        )
+
+    abertas = [r for r in resultados if not isinstance(r, BaseException)]
+    for conexao in abertas:
+        if async_engine is not None:
+            await conexao.close()
+        else:
+            conexao.close()
+    falhas = [r for r in resultados if isinstance(r, BaseException)]
+    if falhas:
+        logger.warning("aquecimento do pool: %d de %d conexoes falharam (%s)", len(falhas), total, falhas[0])
+    return len(abertas)
+
+
+def _criar_admin() -> None:
+    try:
+        ensure_default_admin()
+    except IntegrityError:
+        # Outro worker criou o usuario entre a consulta e o INSERT
+        pass
+
+
+async def aquecer() -> None:
+    """Roda no startup; falhas sao logadas, e o /health/ready e que tira a instancia do ar."""
+    inicio = time.perf_counter()
+    try:
+        conexoes = await aquecer_pool(settings.db_pool_warmup)
+    except Exception:
+        logger.exception("falha ao aquecer o pool de conexoes")
+        conexoes = 0
+    etapas = await asyncio.gather(run_in_threadpool(_criar_admin), password_pool.aquecer(), return_exceptions=True)
+    for nome, resultado in zip(("usuario padrao", "bcrypt"), etapas):
+        if isinstance(resultado, BaseException):
+            logger.error("falha no aquecimento (%s)", nome, exc_info=resultado)
+    logger.info("aquecimento: %d conexoes em %.0f ms", conexoes, (time.perf_counter() - inicio) * 1000)
+
+
+class Prontidao:
+    """Resultado do SELECT 1 em cache por `ttl` segundos (sucesso ou falha)."""
+
+    def __init__(self, ttl: float, timeout: float):
+        self.ttl = ttl
+        self.timeout = timeout
+        self._lock = asyncio.Lock()
+        self._stats_lock = threading.Lock()
+        self._resultado: Optional[dict] = None
+        self._verificado_em = 0.0
+        self._stats = {"checks": 0, "failures": 0, "cache_hits": 0}
+
+    def _em_cache(self) -> Optional[dict]:
+        if self._resultado is not None and time.monotonic() - self._verificado_em < self.ttl:
+            with self._stats_lock:
+                self._stats["cache_hits"] += 1
+            return self._resultado
+        return None
+
+    async def _select_1(self) -> None:
+        async with open_session() as db:
+            await db.execute(text("SELECT 1"))
+
+    async def verificar(self) -> dict:
+        resultado = self._em_cache()
+        if resultado is not None:
+            return resultado
+        async with self._lock:
+            # Quem esperou o lock reaproveita a verificacao de quem chegou primeiro
+            resultado = self._em_cache()
+            if resultado is not None:
+                return resultado
+
+            inicio = time.perf_counter()
+            erro = None
+            try:
+                await asyncio.wait_for(self._select_1(), self.timeout)
+            except asyncio.TimeoutError:
+                erro = f"sem resposta em {self.timeout:g} s"
+            except Exception as exc:
+                erro = type(exc).__name__
+            resultado = {
+                "ready": erro is None,
+                "database": "conectado" if erro is None else "desconectado",
+                "latency_ms": round((time.perf_counter() - inicio) * 1000, 1),
+                "checked_at": datetime.now(timezone.utc).isoformat(),
+            }
+            if erro is not None:
+                resultado["error"] = erro
+                logger.warning("readiness: banco indisponivel (%s)", erro)
+
+            with self._stats_lock:
+                self._stats["checks"] += 1
+                self._stats["failures"] += erro is not None
+            self._resultado, self._verificado_em = resultado, time.monotonic()
+            return resultado
+
+    def snapshot(self) -> dict:
+        with self._stats_lock:
+            return {"ttl_seconds": self.ttl, "last": self._resultado, **self._stats}
+
+
+prontidao = Prontidao(ttl=settings.readiness_ttl_seconds, timeout=settings.readiness_timeout_seconds)
@@ -1,7 +1,7 @@
-from datetime import datetime
-from typing import Optional
+from datetime import date, datetime
+from typing import Annotated, Literal, Optional, Union
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 
 
 # --- USUARIOS / AUTH ---
@@ -35,6 +35,8 @@ class Token(BaseModel):
 
 class TokenPayload(BaseModel):
     sub: Optional[str] = None
+    ver: int = 0
+    exp: Optional[int] = None
 
 
 class LoginRequest(BaseModel):
@@ -79,11 +81,25 @@ class PacienteOut(PacienteBase):
     id: int
     data_cadastro: datetime
     responsavel_id: Optional[int] = None
+    updated_at: datetime
+    deleted_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
 
 
+class ImportacaoErro(BaseModel):
+    linha: int
+    erro: str
+
+
+class ImportacaoPacientesOut(BaseModel):
+    recebidas: int
+    importadas: int
+    rejeitadas: int
+    erros: list[ImportacaoErro]
+
+
 # --- AGENDAMENTOS ---
 class AgendamentoBase(BaseModel):
     paciente_id: int
@@ -104,11 +120,29 @@ class AgendamentoOut(AgendamentoBase):
     id: int
     paciente: PacienteOut
     responsavel_id: Optional[int] = None
+    updated_at: datetime
+    deleted_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
 
 
+class AgendamentoPage(BaseModel):
+    items: list[AgendamentoOut]
+    next_cursor: Optional[str] = None
+
+
+class IntervaloLivre(BaseModel):
+    inicio: datetime
+    fim: datetime
+
+
+class DisponibilidadeOut(BaseModel):
+    sala: Optional[str] = None
+    responsavel_id: Optional[int] = None
+    livres: list[IntervaloLivre]
+
+
 # --- FINANCEIRO ---
 class TransacaoBase(BaseModel):
     descricao: str
@@ -126,6 +160,107 @@ class TransacaoOut(TransacaoBase):
     id: int
     data_competencia: datetime
     responsavel_id: Optional[int] = None
+    updated_at: datetime
+    deleted_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
+
+
+class ResumoItem(BaseModel):
+    chave: str
+    total: float
+    quantidade: int
+
+
+class ResumoCategoria(ResumoItem):
+    tipo: str
+
+
+class ResumoMes(BaseModel):
+    mes: date
+    receitas: float
+    despesas: float
+    saldo: float
+
+
+class ResumoFinanceiroOut(BaseModel):
+    receitas: float
+    despesas: float
+    saldo: float
+    receitas_pagas: float
+    receitas_pendentes: float
+    despesas_pagas: float
+    despesas_pendentes: float
+    quantidade: int
+    por_tipo: list[ResumoItem]
+    por_categoria: list[ResumoCategoria]
+    por_mes: list[ResumoMes]
+
+
+# --- DASHBOARD ---
+class DashboardContagens(BaseModel):
+    pacientes: int
+    agendamentos_hoje: int
+    atendidos_hoje: int
+    agendamentos_futuros: int
+
+
+class DashboardOut(BaseModel):
+    user: UserOut
+    hoje: list[AgendamentoOut]
+    proximos: list[AgendamentoOut]
+    financeiro: ResumoFinanceiroOut
+    contagens: DashboardContagens
+
+
+# --- SINCRONIZACAO OFFLINE (POST /sync) ---
+ChaveIdempotencia = Annotated[str, Field(min_length=1, max_length=64)]
+TempId = Annotated[str, Field(min_length=1, max_length=64)]
+
+
+class AgendamentoSync(AgendamentoBase):
+    # int: id do servidor; texto: temp_id de um paciente criado antes no mesmo lote ou num lote anterior
+    paciente_id: Union[int, TempId]
+
+
+class MutacaoBase(BaseModel):
+    chave: ChaveIdempotencia
+    temp_id: Optional[TempId] = None
+
+
+class MutacaoPaciente(MutacaoBase):
+    tipo: Literal["paciente"]
+    dados: PacienteCreate
+
+
+class MutacaoAgendamento(MutacaoBase):
+    tipo: Literal["agendamento"]
+    dados: AgendamentoSync
+
+
+class MutacaoTransacao(MutacaoBase):
+    tipo: Literal["transacao"]
+    dados: TransacaoCreate
+
+
+Mutacao = Annotated[Union[MutacaoPaciente, MutacaoAgendamento, MutacaoTransacao], Field(discriminator="tipo")]
+
+
+class SyncIn(BaseModel):
+    mutacoes: list[Mutacao] = Field(..., min_length=1)
+
+
+class ResultadoMutacao(BaseModel):
+    chave: str
+    tipo: str
+    temp_id: Optional[str] = None
+    id: int
+    # True: a chave ja tinha sido aplicada; `dados` e o resultado gravado naquela vez
+    repetida: bool
+    dados: Union[PacienteOut, AgendamentoOut, TransacaoOut]
+
+
+class SyncOut(BaseModel):
+    resultados: list[ResultadoMutacao]
+    ids: dict[str, int]
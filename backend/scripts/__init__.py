@@ -0,0 +1 @@
+"""Scripts operacionais do backend (executar com `python -m scripts.<nome>`)."""
@@ -0,0 +1,64 @@
+"""Arquiva as particoes de agendamentos/transacoes mais velhas que PARTITION_ARCHIVE_AFTER_MONTHS.
+
+Pensado para rodar periodicamente (cron), fora do horario de pico:
+
+    python -m scripts.archive_partitions            # arquiva
+    python -m scripts.archive_partitions --dry-run  # so lista as particoes
+    python -m scripts.archive_partitions --months 36
+
+Cada particao vai numa transacao propria (ver particoes.arquivar). Uma que nao
+consiga o lock a tempo fica para a proxima execucao.
+"""
+import argparse
+import sys
+
+from config import settings
+from database import engine
+from particoes import arquivar, nome_particao, para_arquivar
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="apenas lista as particoes que seriam arquivadas")
+    parser.add_argument(
+        "--months", type=int, default=settings.partition_archive_after_months,
+        help="meses mantidos online alem do atual (padrao: PARTITION_ARCHIVE_AFTER_MONTHS)",
+    )
+    args = parser.parse_args()
+
+    if engine.dialect.name != "postgresql":
+        print("particionamento so existe no Postgres")
+        return 2
+    if args.months <= 0:
+        print("arquivamento desligado (PARTITION_ARCHIVE_AFTER_MONTHS=0)")
+        return 0
+
+    with engine.connect() as conn:
+        candidatas = para_arquivar(conn, args.months)
+    falhas = 0
+    for tabela, mes in candidatas:
+        if args.dry_run:
+            print(nome_particao(tabela, mes))
+            continue
+        try:
+            with engine.begin() as conn:
+                resultado = arquivar(conn, tabela, mes)
+        except Exception as exc:
+            falhas += 1
+            print("%s: falhou (%s)" % (nome_particao(tabela, mes), exc))
+            continue
+        print(
+            "%s: %d linhas, %.1f MB -> %.1f MB"
+            % (
+                resultado["partition"],
+                resultado["rows"],
+                resultado["bytes_before"] / 1e6,
+                resultado["bytes_after"] / 1e6,
+            )
+        )
+    print("%d particoes %s" % (len(candidatas) - falhas, "a arquivar" if args.dry_run else "arquivadas"))
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
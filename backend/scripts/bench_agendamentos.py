@@ -0,0 +1,95 @@
+"""Latencia de POST /agendamentos/ conforme a agenda cresce.
+
+Popula o banco apontado por DATABASE_URL (use um banco descartavel, ja migrado)
+em degraus e, a cada degrau, mede a reserva de novos horarios, incluindo a
+deteccao de conflitos. Com os indices GiST a latencia deve ficar estavel:
+
+    python -m scripts.bench_agendamentos --steps 1000 10000 100000 --bookings 200
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+from fastapi.testclient import TestClient
+from sqlalchemy import func, insert, select, text
+
+from database import engine
+from models import Agendamento, Paciente, User
+from security import create_access_token, get_password_hash
+
+SALAS = [f"Sala {i}" for i in range(1, 11)]
+SLOT = timedelta(minutes=30)
+
+
+def _preparar() -> tuple[int, int]:
+    with engine.begin() as conn:
+        user_id = conn.execute(
+            insert(User).returning(User.id),
+            {"nome": "Bench", "email": f"bench{time.time_ns()}@aura.app",
+             "hashed_password": get_password_hash("bench"), "role": "doctor", "is_active": True},
+        ).scalar_one()
+        paciente_id = conn.execute(
+            insert(Paciente).returning(Paciente.id),
+            {"nome": "Paciente Bench", "telefone": "0", "responsavel_id": user_id},
+        ).scalar_one()
+    return user_id, paciente_id
+
+
+def _popular(ate: int, paciente_id: int, base: datetime) -> None:
+    with engine.begin() as conn:
+        atual = conn.execute(select(func.count()).select_from(Agendamento)).scalar_one()
+        linhas = []
+        # Agenda densa: slots consecutivos em cada sala, sem sobreposicao entre si
+        for i in range(atual, ate):
+            inicio = base + SLOT * (i // len(SALAS))
+            linhas.append({
+                "paciente_id": paciente_id, "data_hora_inicio": inicio, "data_hora_fim": inicio + SLOT,
+                "tipo": "consulta", "status": "agendado", "sala": SALAS[i % len(SALAS)], "responsavel_id": None,
+            })
+            if len(linhas) == 10_000:
+                conn.execute(insert(Agendamento), linhas)
+                linhas = []
+        if linhas:
+            conn.execute(insert(Agendamento), linhas)
+        if engine.dialect.name == "postgresql":
+            conn.execute(text("ANALYZE agendamentos"))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--bookings", type=int, default=200)
+    args = parser.parse_args()
+
+    from main import app
+
+    user_id, paciente_id = _preparar()
+    client = TestClient(app)
+    client.headers["Authorization"] = f"Bearer {create_access_token(str(user_id))}"
+    base = datetime(2020, 1, 1, 8, tzinfo=timezone.utc)
+    rng = random.Random(7)
+
+    print(f"{'agendamentos':>12} {'p50_ms':>8} {'p95_ms':>8} {'201':>5} {'409':>5}")
+    for total in args.steps:
+        _popular(total, paciente_id, base)
+        # Metade dos pedidos cai na agenda ja ocupada (409) e metade depois dela (201)
+        slots = 2 * (total // len(SALAS) + 1)
+        latencias, status = [], {201: 0, 409: 0}
+        for _ in range(args.bookings):
+            inicio = base + SLOT * rng.randint(0, slots)
+            payload = {
+                "paciente_id": paciente_id, "data_hora_inicio": inicio.isoformat(),
+                "data_hora_fim": (inicio + SLOT).isoformat(), "tipo": "consulta", "sala": rng.choice(SALAS),
+            }
+            t0 = time.perf_counter()
+            response = client.post("/agendamentos/", json=payload)
+            latencias.append((time.perf_counter() - t0) * 1000)
+            status[response.status_code] = status.get(response.status_code, 0) + 1
+        quantis = statistics.quantiles(latencias, n=100)
+        print(f"{total:>12} {quantis[49]:>8.2f} {quantis[94]:>8.2f} {status[201]:>5} {status[409]:>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Latencia de GET /pacientes/search com muitos pacientes.
+
+Popula o banco apontado por DATABASE_URL (descartavel, migrado ate a 0007) com
+nomes acentuados e telefones aleatorios e mede termos tipicos de autocompletar
+(prefixo curto, trecho do nome sem acento, inicio do telefone, CPF). Meta no
+Postgres: p95 abaixo de 15 ms com 200 mil pacientes.
+
+    python -m scripts.bench_busca_pacientes --pacientes 200000 --buscas 500
+"""
+import argparse
+import random
+import statistics
+import time
+
+from fastapi.testclient import TestClient
+from sqlalchemy import func, insert, select, text
+
+from database import engine
+from models import Paciente, User
+from security import create_access_token, get_password_hash
+
+PRIMEIROS = ["José", "João", "Maria", "Ana", "Antônio", "Francisco", "Luíza", "Lúcia", "Márcio", "Conceição",
+             "Sebastião", "Letícia", "Inês", "Otávio", "Cláudia", "Rafael", "Bruna", "Thiago", "Débora", "Caio"]
+SOBRENOMES = ["Silva", "Santos", "Oliveira", "Souza", "Conceição", "Araújo", "Gonçalves", "Lima", "Gomes",
+              "Ribeiro", "Carvalho", "Simões", "Brandão", "Magalhães", "Assunção", "Pereira", "Rocha", "Peçanha"]
+TERMOS = ["jo", "mar", "conceicao", "CONCEIÇÃO", "simoes", "luiza ara", "thi", "brandao", "ines g", "otavio"]
+CHUNK = 10_000
+
+
+def _preparar() -> int:
+    with engine.begin() as conn:
+        return conn.execute(
+            insert(User).returning(User.id),
+            {"nome": "Bench", "email": f"bench{time.time_ns()}@aura.app",
+             "hashed_password": get_password_hash("bench"), "role": "doctor", "is_active": True},
+        ).scalar_one()
+
+
+def _popular(total: int, user_id: int, rng: random.Random) -> list[tuple[str, str]]:
+    amostra = []
+    with engine.begin() as conn:
+        atual = conn.execute(select(func.count()).select_from(Paciente)).scalar_one()
+        base_cpf = time.time_ns() // 1000
+        for inicio in range(atual, total, CHUNK):
+            linhas = []
+            for i in range(inicio, min(inicio + CHUNK, total)):
+                nome = f"{rng.choice(PRIMEIROS)} {rng.choice(SOBRENOMES)} {rng.choice(SOBRENOMES)}"
+                telefone = f"({rng.randint(11, 99)}) 9{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}"
+                cpf = f"{(base_cpf + i) % 10**11:011d}"
+                linhas.append({"nome": nome, "telefone": telefone, "cpf": cpf, "responsavel_id": user_id})
+            conn.execute(insert(Paciente), linhas)
+            amostra.extend((l["telefone"], l["cpf"]) for l in rng.sample(linhas, min(50, len(linhas))))
+        if engine.dialect.name == "postgresql":
+            conn.execute(text("ANALYZE pacientes"))
+    return amostra
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pacientes", type=int, default=200_000)
+    parser.add_argument("--buscas", type=int, default=500)
+    args = parser.parse_args()
+
+    from main import app
+
+    rng = random.Random(7)
+    user_id = _preparar()
+    amostra = _popular(args.pacientes, user_id, rng)
+    client = TestClient(app)
+    client.headers["Authorization"] = f"Bearer {create_access_token(str(user_id))}"
+
+    latencias: dict[str, list[float]] = {"nome": [], "telefone": [], "cpf": []}
+    for _ in range(args.buscas):
+        telefone, cpf = rng.choice(amostra)
+        tipo, termo = rng.choice(
+            [("nome", rng.choice(TERMOS)), ("telefone", "".join(filter(str.isdigit, telefone))[:5]), ("cpf", cpf)]
+        )
+        t0 = time.perf_counter()
+        response = client.get("/pacientes/search", params={"q": termo})
+        latencias[tipo].append((time.perf_counter() - t0) * 1000)
+        response.raise_for_status()
+
+    print(f"{'tipo':>10} {'buscas':>7} {'p50_ms':>8} {'p95_ms':>8}")
+    todas = []
+    for tipo, valores in latencias.items():
+        todas.extend(valores)
+        if len(valores) >= 2:
+            quantis = statistics.quantiles(valores, n=100)
+            print(f"{tipo:>10} {len(valores):>7} {quantis[49]:>8.2f} {quantis[94]:>8.2f}")
+    quantis = statistics.quantiles(todas, n=100)
+    print(f"{'todas':>10} {len(todas):>7} {quantis[49]:>8.2f} {quantis[94]:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
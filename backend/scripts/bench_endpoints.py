@@ -0,0 +1,402 @@
+"""Benchmark de todas as rotas de routers/ com baseline em JSON.
+
+Roda contra o banco apontado por DATABASE_URL, populado antes com
+scripts.gerar_dados, chamando a aplicacao ASGI no proprio processo (httpx +
+ASGITransport, sem rede). Cada rota recebe --requests requisicoes em cada nivel
+de --concurrency, depois de --warmup requisicoes de aquecimento. O resultado
+(p50/p95/p99, vazao, instrucoes SQL por requisicao e erros por rota e nivel) vai
+para --output.
+
+Com um baseline, cada medida e comparada com a dele: p95 acima de
+baseline * (1 + --threshold) + --min-delta-ms, vazao abaixo de
+baseline * (1 - --threshold), mais instrucoes SQL por requisicao ou mais erros
+contam como regressao, e o script sai com codigo 1. --update-baseline grava o resultado como novo baseline.
+
+    python -m scripts.gerar_dados --medicos 20 --pacientes 200000 --transacoes 5000000
+    python -m scripts.bench_endpoints --update-baseline
+    python -m scripts.bench_endpoints --baseline bench_baseline.json --threshold 0.2
+
+Toda rota nova em routers/ precisa de um caso em CASOS (ou de um motivo em
+PULADAS); o script falha antes de medir se alguma ficar de fora.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from itertools import count
+from typing import Callable, Optional
+
+import httpx
+from sqlalchemy import func, select
+
+from config import settings
+from database import engine
+from metricas import metricas_rotas
+from models import Agendamento, Paciente, Transacao, User
+from scripts.gerar_dados import SENHA, email_medico
+from security import create_access_token
+
+TERMOS_BUSCA = ["jo", "mar", "conceicao", "simoes", "luiza ara", "thi", "brandao", "119", "(21) 9"]
+
+
+@dataclass
+class Contexto:
+    user_id: int
+    email: str
+    pacientes: list[int]
+    hoje: date
+    proximo_horario: datetime
+    execucao: int = field(default_factory=time.time_ns)
+    sequencia: count = field(default_factory=count)
+    para_excluir: dict[str, list[int]] = field(default_factory=dict)
+
+    def numero(self) -> int:
+        return next(self.sequencia)
+
+    def horario(self) -> datetime:
+        # Horarios livres depois de tudo o que ja existe: as reservas nunca conflitam
+        inicio = self.proximo_horario
+        self.proximo_horario += timedelta(minutes=30)
+        return inicio
+
+
+@dataclass
+class Caso:
+    requisicao: Callable[[Contexto, int], dict]
+    esperado: tuple = (200,)
+    # Cria, fora da medicao, o que as requisicoes vao consumir (ex.: ids para DELETE)
+    preparar: Optional[Callable] = None
+
+
+def _paciente(ctx: Contexto, i: int) -> int:
+    return ctx.pacientes[i % len(ctx.pacientes)]
+
+
+def _novo_agendamento(ctx: Contexto, i: int) -> dict:
+    inicio = ctx.horario()
+    return {"json": {"paciente_id": _paciente(ctx, i), "data_hora_inicio": inicio.isoformat(),
+                     "data_hora_fim": (inicio + timedelta(minutes=30)).isoformat(), "tipo": "consulta"}}
+
+
+def _nova_transacao(ctx: Contexto, i: int) -> dict:
+    return {"json": {"descricao": f"Bench {i}", "valor": 100 + i % 50, "tipo": "receita",
+                     "categoria": "consulta", "pago": bool(i % 2)}}
+
+
+def _novo_paciente(ctx: Contexto, i: int) -> dict:
+    return {"json": {"nome": f"Paciente Bench {ctx.numero()}", "telefone": "11999990000"}}
+
+
+def _lote_sync(ctx: Contexto, i: int) -> dict:
+    # Como o app depois de um periodo offline: paciente novo, a consulta dele e a cobranca
+    n = ctx.numero()
+    chave, temp_id = f"bench-{ctx.execucao}-{n}", f"tmp-{ctx.execucao}-{n}"
+    consulta = _novo_agendamento(ctx, i)["json"]
+    return {"json": {"mutacoes": [
+        {"tipo": "paciente", "chave": f"{chave}-p", "temp_id": temp_id,
+         "dados": {"nome": f"Paciente Sync {n}", "telefone": "11999990000"}},
+        {"tipo": "agendamento", "chave": f"{chave}-a", "dados": {**consulta, "paciente_id": temp_id}},
+        {"tipo": "transacao", "chave": f"{chave}-t", "dados": _nova_transacao(ctx, i)["json"]},
+    ]}}
+
+
+def _csv_pacientes(ctx: Contexto, i: int) -> dict:
+    linhas = ["nome,telefone,email,cpf"]
+    for _ in range(50):
+        n = ctx.numero()
+        # CPFs desta execucao: comecam com 9, longe dos gerados por scripts.gerar_dados
+        linhas.append(f"Importado {n},11988887777,,9{(ctx.execucao // 1000 + n) % 10**10:010d}")
+    return {"content": "\n".join(linhas).encode(), "headers": {"Content-Type": "text/csv"}}
+
+
+def _janela(ctx: Contexto, dias: int = 7) -> dict:
+    inicio = datetime.combine(ctx.hoje, datetime.min.time(), timezone.utc)
+    return {"inicio": inicio.isoformat(), "fim": (inicio + timedelta(days=dias)).isoformat()}
+
+
+def _excluir(tipo: str, caminho: str) -> Callable[[Contexto, int], dict]:
+    def requisicao(ctx: Contexto, i: int) -> dict:
+        return {"url": caminho.format(ctx.para_excluir[tipo].pop())}
+    return requisicao
+
+
+def _criar_para_excluir(tipo: str, caminho: str, corpo: Callable[[Contexto, int], dict]):
+    async def preparar(client: httpx.AsyncClient, ctx: Contexto, total: int) -> None:
+        ids = ctx.para_excluir.setdefault(tipo, [])
+        for i in range(total):
+            response = await client.post(caminho, **corpo(ctx, i))
+            response.raise_for_status()
+            ids.append(response.json()["id"])
+    return preparar
+
+
+INTERNO = {"headers": {"X-Internal-Token": settings.internal_token}}
+
+CASOS: dict[str, Caso] = {
+    # --- auth (login e cadastro pagam o bcrypt; 503 e a admissao do pool de hash) ---
+    "POST /auth/register": Caso(
+        lambda ctx, i: {"json": {"nome": "Bench", "email": f"bench{ctx.execucao}.{ctx.numero()}@bench.aura.app",
+                                 "password": SENHA}},
+        esperado=(201, 503),
+    ),
+    "POST /auth/login": Caso(lambda ctx, i: {"json": {"email": ctx.email, "password": SENHA}}, esperado=(200, 503)),
+    "GET /auth/me": Caso(lambda ctx, i: {}),
+    # --- pacientes ---
+    "POST /pacientes/": Caso(_novo_paciente, esperado=(201,)),
+    "POST /pacientes/bulk": Caso(_csv_pacientes),
+    "GET /pacientes/": Caso(lambda ctx, i: {}),
+    "GET /pacientes/search": Caso(lambda ctx, i: {"params": {"q": TERMOS_BUSCA[i % len(TERMOS_BUSCA)]}}),
+    "GET /pacientes/{paciente_id}": Caso(lambda ctx, i: {"url": f"/pacientes/{_paciente(ctx, i)}"}),
+    "DELETE /pacientes/{paciente_id}": Caso(
+        _excluir("pacientes", "/pacientes/{}"),
+        esperado=(204,),
+        preparar=_criar_para_excluir("pacientes", "/pacientes/", _novo_paciente),
+    ),
+    # --- agenda ---
+    "POST /agendamentos/": Caso(_novo_agendamento, esperado=(201,)),
+    "GET /agendamentos/": Caso(lambda ctx, i: {"params": _janela(ctx)}),
+    "GET /agendamentos/agenda": Caso(lambda ctx, i: {"params": _janela(ctx)}),
+    "GET /agendamentos/export": Caso(
+        lambda ctx, i: {"params": {"formato": "ndjson", "inicio": ctx.hoje.isoformat(), "fim": ctx.hoje.isoformat()}}
+    ),
+    "GET /agendamentos/disponibilidade": Caso(
+        lambda ctx, i: {"params": {"inicio": ctx.hoje.isoformat(), "fim": (ctx.hoje + timedelta(days=6)).isoformat()}}
+    ),
+    "DELETE /agendamentos/{agendamento_id}": Caso(
+        _excluir("agendamentos", "/agendamentos/{}"),
+        esperado=(204,),
+        preparar=_criar_para_excluir("agendamentos", "/agendamentos/", _novo_agendamento),
+    ),
+    # --- financeiro ---
+    "POST /financeiro/transacoes/": Caso(_nova_transacao, esperado=(201,)),
+    "GET /financeiro/transacoes/": Caso(lambda ctx, i: {}),
+    "GET /financeiro/": Caso(lambda ctx, i: {}),
+    "GET /financeiro/transacoes/export": Caso(
+        lambda ctx, i: {"params": {"inicio": ctx.hoje.isoformat(), "fim": ctx.hoje.isoformat()}}
+    ),
+    "GET /financeiro/resumo": Caso(lambda ctx, i: {}),
+    "DELETE /financeiro/transacoes/{transacao_id}": Caso(
+        _excluir("transacoes", "/financeiro/transacoes/{}"),
+        esperado=(204,),
+        preparar=_criar_para_excluir("transacoes", "/financeiro/transacoes/", _nova_transacao),
+    ),
+    # --- dashboard ---
+    "GET /dashboard/": Caso(lambda ctx, i: {}),
+    # --- sincronizacao offline ---
+    "POST /sync": Caso(_lote_sync),
+    # --- internos ---
+    "GET /internal/password-pool": Caso(lambda ctx, i: INTERNO),
+    "GET /internal/auth-cache": Caso(lambda ctx, i: INTERNO),
+    "GET /internal/availability-cache": Caso(lambda ctx, i: INTERNO),
+    "GET /internal/response-cache": Caso(lambda ctx, i: INTERNO),
+    "GET /internal/db-pool": Caso(lambda ctx, i: INTERNO),
+    "GET /internal/replicas": Caso(lambda ctx, i: INTERNO),
+    "GET /internal/readiness": Caso(lambda ctx, i: INTERNO),
+    "GET /internal/write-behind": Caso(lambda ctx, i: INTERNO),
+    "GET /internal/sync": Caso(lambda ctx, i: INTERNO),
+    "GET /internal/partitions": Caso(lambda ctx, i: INTERNO),
+    "GET /internal/profiles": Caso(lambda ctx, i: INTERNO),
+}
+
+PULADAS = {
+    "POST /auth/forgot-password": "limitado a RESET_TOKEN_MAX_REQUESTS_PER_HOUR pedidos por usuario",
+    "POST /auth/reset-password": "exige um token de recuperacao valido por requisicao",
+    "POST /auth/change-password": "troca a senha e invalida o token usado pelo benchmark",
+}
+
+
+def _rotas(app) -> list[str]:
+    rotas = []
+    for rota in app.routes:
+        modulo = getattr(getattr(rota, "endpoint", None), "__module__", "")
+        if modulo.startswith("routers."):
+            rotas.extend(f"{metodo} {rota.path}" for metodo in sorted(rota.methods - {"HEAD"}))
+    return rotas
+
+
+def _contexto(email: str) -> Contexto:
+    with engine.connect() as conn:
+        user_id = conn.execute(select(User.id).where(User.email == email)).scalar()
+        if user_id is None:
+            sys.exit(f"{email} nao encontrado: rode antes python -m scripts.gerar_dados")
+        pacientes = conn.execute(
+            select(Paciente.id)
+            .where(Paciente.responsavel_id == user_id, Paciente.deleted_at.is_(None))
+            .order_by(Paciente.id)
+            .limit(1_000)
+        ).scalars().all()
+        ultimo_fim = conn.execute(
+            select(func.max(Agendamento.data_hora_fim)).where(Agendamento.responsavel_id == user_id)
+        ).scalar()
+    proximo = datetime(2100, 1, 1, tzinfo=timezone.utc)
+    if ultimo_fim is not None:
+        ultimo_fim = ultimo_fim if ultimo_fim.tzinfo else ultimo_fim.replace(tzinfo=timezone.utc)
+        proximo = max(proximo, ultimo_fim + timedelta(hours=1))
+    return Contexto(user_id=user_id, email=email, pacientes=pacientes, hoje=date.today(), proximo_horario=proximo)
+
+
+async def _medir(client: httpx.AsyncClient, nome: str, caso: Caso, ctx: Contexto, concorrencia: int,
+                 total: int, aquecimento: int) -> dict:
+    metodo, caminho = nome.split(" ", 1)
+    if caso.preparar is not None:
+        await caso.preparar(client, ctx, total + aquecimento)
+
+    async def chamar(i: int) -> tuple[float, int]:
+        requisicao = {"method": metodo, "url": caminho, **caso.requisicao(ctx, i)}
+        inicio = time.perf_counter()
+        response = await client.request(**requisicao)
+        return time.perf_counter() - inicio, response.status_code
+
+    for i in range(aquecimento):
+        await chamar(i)
+    sql_antes, requisicoes_antes = metricas_rotas.consultas(metodo, caminho)
+
+    latencias: list[float] = []
+    erros: dict[int, int] = {}
+    proxima = iter(range(total))
+
+    async def trabalhador() -> None:
+        for i in proxima:
+            latencia, status = await chamar(i)
+            latencias.append(latencia)
+            if status not in caso.esperado:
+                erros[status] = erros.get(status, 0) + 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabalhador() for _ in range(concorrencia)))
+    duracao = time.perf_counter() - inicio
+
+    sql_depois, requisicoes_depois = metricas_rotas.consultas(metodo, caminho)
+    medidas_sql = requisicoes_depois - requisicoes_antes
+    quantis = statistics.quantiles(latencias, n=100, method="inclusive") if len(latencias) > 1 else latencias * 99
+    return {
+        "requisicoes": len(latencias),
+        "erros": sum(erros.values()),
+        "status_inesperados": {str(k): v for k, v in sorted(erros.items())},
+        "req_por_segundo": round(len(latencias) / duracao, 1),
+        "p50_ms": round(quantis[49] * 1000, 2),
+        "p95_ms": round(quantis[94] * 1000, 2),
+        "p99_ms": round(quantis[98] * 1000, 2),
+        # Instrucoes SQL por requisicao, contadas pelo MetricasMiddleware
+        "sql_por_requisicao": round((sql_depois - sql_antes) / medidas_sql, 2) if medidas_sql else None,
+    }
+
+
+async def executar(args) -> dict:
+    from main import app
+
+    faltando = [rota for rota in _rotas(app) if rota not in CASOS and rota not in PULADAS]
+    if faltando:
+        sys.exit("rotas sem caso no benchmark: " + ", ".join(faltando))
+
+    ctx = _contexto(args.email)
+    with engine.connect() as conn:
+        volumes = {
+            modelo.__tablename__: conn.execute(select(func.count()).select_from(modelo)).scalar_one()
+            for modelo in (Paciente, Agendamento, Transacao)
+        }
+    token = create_access_token(str(ctx.user_id))
+    resultados: dict[str, dict] = {}
+    # Excecoes da aplicacao viram 500 e entram como erro, sem interromper a medicao
+    transporte = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with app.router.lifespan_context(app), httpx.AsyncClient(
+        transport=transporte, base_url="http://bench", headers={"Authorization": f"Bearer {token}"}, timeout=120
+    ) as client:
+        for nome, caso in CASOS.items():
+            if args.only and not any(trecho in nome for trecho in args.only):
+                continue
+            for concorrencia in args.concurrency:
+                medida = await _medir(client, nome, caso, ctx, concorrencia, args.requests, args.warmup)
+                resultados.setdefault(nome, {})[f"c{concorrencia}"] = medida
+                print(f"{nome:<45} c={concorrencia:<4} p50={medida['p50_ms']:>8.2f} p95={medida['p95_ms']:>8.2f} "
+                      f"p99={medida['p99_ms']:>8.2f} ms  {medida['req_por_segundo']:>8.1f} req/s  "
+                      f"sql={medida['sql_por_requisicao']}  erros={medida['erros']}")
+
+    return {
+        "meta": {
+            "gerado_em": datetime.now(timezone.utc).isoformat(),
+            "banco": engine.dialect.name,
+            "database_async": settings.database_async,
+            "python": platform.python_version(),
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "volumes": volumes,
+        },
+        "resultados": resultados,
+    }
+
+
+def comparar(atual: dict, baseline: dict, limite: float, folga_ms: float) -> list[str]:
+    regressoes = []
+    for nome, niveis in atual["resultados"].items():
+        for nivel, medida in niveis.items():
+            base = baseline.get("resultados", {}).get(nome, {}).get(nivel)
+            if base is None:
+                continue
+            if medida["p95_ms"] > base["p95_ms"] * (1 + limite) + folga_ms:
+                regressoes.append(f"{nome} {nivel}: p95 {base['p95_ms']} -> {medida['p95_ms']} ms")
+            if medida["req_por_segundo"] < base["req_por_segundo"] * (1 - limite):
+                regressoes.append(
+                    f"{nome} {nivel}: vazao {base['req_por_segundo']} -> {medida['req_por_segundo']} req/s"
+                )
+            if (base.get("sql_por_requisicao") is not None and medida["sql_por_requisicao"] is not None
+                    and medida["sql_por_requisicao"] > base["sql_por_requisicao"]):
+                regressoes.append(
+                    f"{nome} {nivel}: SQL por requisicao {base['sql_por_requisicao']} -> {medida['sql_por_requisicao']}"
+                )
+            if medida["erros"] > base["erros"]:
+                regressoes.append(f"{nome} {nivel}: erros {base['erros']} -> {medida['erros']}")
+    return regressoes
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--email", default=email_medico(0), help="medico usado nas requisicoes")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--requests", type=int, default=200, help="requisicoes por rota e nivel")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--only", nargs="*", help="mede so as rotas que contem algum destes trechos")
+    parser.add_argument("--output", default="bench_resultado.json")
+    parser.add_argument("--baseline", default="bench_baseline.json")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.2, help="piora relativa tolerada (0.2 = 20%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="folga absoluta no p95")
+    args = parser.parse_args()
+
+    resultado = asyncio.run(executar(args))
+    with open(args.output, "w") as arquivo:
+        json.dump(resultado, arquivo, indent=2)
+    print(f"resultado gravado em {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as arquivo:
+            json.dump(resultado, arquivo, indent=2)
+        print(f"baseline atualizado em {args.baseline}")
+        return 0
+
+    try:
+        with open(args.baseline) as arquivo:
+            baseline = json.load(arquivo)
+    except FileNotFoundError:
+        print(f"sem baseline em {args.baseline}; use --update-baseline para criar um")
+        return 0
+
+    # As rotas de escrita acrescentam linhas a cada execucao; so avisa se o banco mudou de porte
+    for tabela, total in resultado["meta"]["volumes"].items():
+        anterior = baseline["meta"].get("volumes", {}).get(tabela, 0)
+        if abs(total - anterior) > 0.1 * max(anterior, 1):
+            print(f"aviso: {tabela} tem {total} linhas; o baseline foi medido com {anterior}")
+    regressoes = comparar(resultado, baseline, args.threshold, args.min_delta_ms)
+    for linha in regressoes:
+        print("REGRESSAO", linha)
+    print(f"{len(regressoes)} regressoes (limite {args.threshold:.0%}, folga {args.min_delta_ms} ms)")
+    return 1 if regressoes else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
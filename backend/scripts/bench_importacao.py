@@ -0,0 +1,76 @@
+"""Linhas/segundo da importacao em massa contra o cadastro um a um.
+
+Usa o banco apontado por DATABASE_URL (descartavel, ja migrado). O caminho um a
+um (POST /pacientes/) e medido numa amostra, pois custa duas idas ao banco por
+linha; o bulk recebe o arquivo inteiro em pedacos, como um upload real:
+
+    python -m scripts.bench_importacao --rows 50000 --sample 1000
+"""
+import argparse
+import time
+
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+
+from database import engine
+from models import User
+from security import create_access_token, get_password_hash
+
+CHUNK_BYTES = 64 * 1024
+
+
+def _preparar() -> int:
+    with engine.begin() as conn:
+        return conn.execute(
+            insert(User).returning(User.id),
+            {"nome": "Bench", "email": f"bench{time.time_ns()}@aura.app",
+             "hashed_password": get_password_hash("bench"), "role": "doctor", "is_active": True},
+        ).scalar_one()
+
+
+def _cpf(base: int, i: int) -> str:
+    return f"{(base + i) % 10**11:011d}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--sample", type=int, default=1_000)
+    args = parser.parse_args()
+
+    from main import app
+
+    client = TestClient(app)
+    client.headers["Authorization"] = f"Bearer {create_access_token(str(_preparar()))}"
+    # CPFs distintos a cada execucao para nao colidir com rodadas anteriores
+    base = time.time_ns() // 1000
+
+    t0 = time.perf_counter()
+    for i in range(args.sample):
+        response = client.post("/pacientes/", json={"nome": f"Um a um {i}", "telefone": "0", "cpf": _cpf(base, i)})
+        response.raise_for_status()
+    um_a_um = args.sample / (time.perf_counter() - t0)
+
+    linhas = ["nome,telefone,email,cpf\n"]
+    linhas += [f"Bulk {i},0,,{_cpf(base, args.sample + i)}\n" for i in range(args.rows)]
+    corpo = "".join(linhas).encode()
+
+    def chunks():
+        for i in range(0, len(corpo), CHUNK_BYTES):
+            yield corpo[i : i + CHUNK_BYTES]
+
+    t0 = time.perf_counter()
+    response = client.post("/pacientes/bulk", content=chunks(), headers={"Content-Type": "text/csv"})
+    response.raise_for_status()
+    segundos = time.perf_counter() - t0
+    resultado = response.json()
+    bulk = resultado["importadas"] / segundos
+
+    print(f"{'caminho':>10} {'linhas':>8} {'linhas/s':>10}")
+    print(f"{'um a um':>10} {args.sample:>8} {um_a_um:>10.0f}")
+    print(f"{'bulk':>10} {resultado['importadas']:>8} {bulk:>10.0f}")
+    print(f"ganho: {bulk / um_a_um:.1f}x (rejeitadas no bulk: {resultado['rejeitadas']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Pagina por chave (keyset) de GET /agendamentos/ contra OFFSET e a lista completa.
+
+Popula o banco apontado por DATABASE_URL (use um banco descartavel, ja migrado)
+em degraus, como bench_agendamentos, e a cada degrau mede a consulta da listagem
+em tres formas: a lista inteira (a rota antes da paginacao), uma pagina no fim
+da agenda via OFFSET e a mesma pagina via cursor. Mede tambem a rota com cursor.
+Com o keyset a pagina deve custar o mesmo em qualquer profundidade:
+
+    python -m scripts.bench_paginacao --steps 1000 10000 100000
+"""
+import argparse
+import os
+import statistics
+import time
+from datetime import datetime, timezone
+
+os.environ["RESPONSE_CACHE_BACKEND"] = "off"
+
+from fastapi.testclient import TestClient
+from sqlalchemy import select, tuple_
+
+from database import engine
+from models import Agendamento, Paciente
+from pagination import DEFAULT_PAGE_SIZE, encode_cursor
+from schemas import AgendamentoOut, PacienteOut
+from scripts.bench_agendamentos import _popular, _preparar
+from security import create_access_token
+from serializacao import colunas, montar
+
+
+def _listagem(user_id: int):
+    """Mesma consulta de listar_agendamentos, sem os filtros opcionais."""
+    return (
+        select(*colunas(Agendamento, AgendamentoOut), *colunas(Paciente, PacienteOut, prefixo="paciente__"))
+        .join(Paciente, Agendamento.paciente_id == Paciente.id)
+        .where((Agendamento.responsavel_id == user_id) | (Agendamento.responsavel_id.is_(None)))
+        .order_by(Agendamento.data_hora_inicio, Agendamento.id)
+    )
+
+
+def _p50(medir, repeticoes: int) -> float:
+    latencias = []
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        medir()
+        latencias.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(latencias)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    from main import app
+
+    user_id, paciente_id = _preparar()
+    base = datetime(2020, 1, 1, 8, tzinfo=timezone.utc)
+    consulta = _listagem(user_id)
+
+    def executar(query) -> list[dict]:
+        with engine.connect() as conn:
+            return montar(conn.execute(query).mappings(), AgendamentoOut)
+
+    print(f"{'agendamentos':>12} {'lista_ms':>10} {'offset_ms':>10} {'keyset_ms':>10} {'rota_ms':>10}")
+    with TestClient(app) as client:
+        client.headers["Authorization"] = f"Bearer {create_access_token(str(user_id))}"
+        for total in args.steps:
+            _popular(total, paciente_id, base)
+            # Ultima pagina da agenda: o pior caso do OFFSET
+            profundidade = max(total - DEFAULT_PAGE_SIZE, 0)
+            with engine.connect() as conn:
+                ancora = conn.execute(
+                    select(Agendamento.data_hora_inicio, Agendamento.id)
+                    .order_by(Agendamento.data_hora_inicio, Agendamento.id)
+                    .offset(max(profundidade - 1, 0))
+                    .limit(1)
+                ).one()
+            cursor = encode_cursor(ancora[0], ancora[1])
+            pagina = tuple_(Agendamento.data_hora_inicio, Agendamento.id) > tuple(ancora)
+
+            lista = _p50(lambda: executar(consulta), max(args.repeat // 5, 1))
+            offset = _p50(lambda: executar(consulta.offset(profundidade).limit(DEFAULT_PAGE_SIZE)), args.repeat)
+            keyset = _p50(lambda: executar(consulta.where(pagina).limit(DEFAULT_PAGE_SIZE)), args.repeat)
+            rota = _p50(lambda: client.get("/agendamentos/", params={"cursor": cursor}).raise_for_status(), args.repeat)
+            print(f"{total:>12} {lista:>10.2f} {offset:>10.2f} {keyset:>10.2f} {rota:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Indices e latencia das rotas de agenda/financeiro conforme o historico cresce.
+
+Popula o banco apontado por DATABASE_URL (Postgres descartavel, ja migrado) mes
+a mes, do mes atual para tras, com agendamentos e transacoes de MEDICOS medicos;
+a cada degrau mede o tamanho dos indices e o p50 das rotas que leem o periodo
+recente. Rode uma vez com o banco na 0010 (tabelas comuns) e outra na head
+(particionadas, ver particoes.py) para comparar:
+
+    alembic upgrade 0010 && python -m scripts.bench_particoes --steps 1000000 5000000 10000000
+    alembic upgrade head && python -m scripts.bench_particoes --steps 1000000 5000000 10000000
+
+Os degraus contam linhas de cada tabela. O cache de respostas fica desligado.
+"""
+import argparse
+import os
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+os.environ["RESPONSE_CACHE_BACKEND"] = "off"
+
+from fastapi.testclient import TestClient
+from sqlalchemy import insert, text
+
+from database import engine
+from models import Paciente, User
+from particoes import somar_meses
+from rollups import mes_de
+from security import create_access_token, get_password_hash
+
+MEDICOS = 200
+# Consultas de 30 minutos seguidas por medico (e sala) a partir do dia 1: ~26 dias de agenda cheia
+SLOTS_POR_MES = 1_250
+LINHAS_POR_MES = MEDICOS * SLOTS_POR_MES
+
+
+def _preparar() -> tuple[list[int], int]:
+    with engine.begin() as conn:
+        senha = get_password_hash("bench")
+        sufixo = time.time_ns()
+        medicos = conn.execute(
+            insert(User).returning(User.id),
+            [
+                {"nome": f"Medico {i}", "email": f"bench{sufixo}-{i}@aura.app", "hashed_password": senha,
+                 "role": "doctor", "is_active": True}
+                for i in range(MEDICOS)
+            ],
+        ).scalars().all()
+        paciente_id = conn.execute(
+            insert(Paciente).returning(Paciente.id),
+            {"nome": "Paciente Bench", "telefone": "0", "responsavel_id": medicos[0]},
+        ).scalar_one()
+    return list(medicos), paciente_id
+
+
+def _popular_mes(mes, medicos: list[int], paciente_id: int) -> None:
+    inicio = datetime(mes.year, mes.month, 1, tzinfo=timezone.utc)
+    parametros = {"inicio": inicio, "primeiro": medicos[0], "paciente": paciente_id, "slots": SLOTS_POR_MES - 1}
+    with engine.begin() as conn:
+        if conn.scalar(text("SELECT relkind = 'p' FROM pg_class WHERE oid = 'agendamentos'::regclass")):
+            # O que o loop de particoes.py faz em producao
+            conn.execute(text("SELECT criar_particao_mensal('agendamentos', :mes)"), {"mes": mes})
+            conn.execute(text("SELECT criar_particao_mensal('transacoes', :mes)"), {"mes": mes})
+        conn.execute(
+            text(
+                f"""
+                INSERT INTO agendamentos (paciente_id, data_hora_inicio, data_hora_fim, tipo, status, sala,
+                                          responsavel_id, updated_at)
+                SELECT :paciente, :inicio + k * interval '30 minutes', :inicio + (k + 1) * interval '30 minutes',
+                       'consulta', 'agendado', 'S' || m, :primeiro + m, :inicio
+                FROM generate_series(0, {MEDICOS - 1}) AS m, generate_series(0, :slots) AS k
+                """
+            ),
+            parametros,
+        )
+        conn.execute(
+            text(
+                f"""
+                INSERT INTO transacoes (descricao, valor, tipo, categoria, pago, data_competencia, responsavel_id,
+                                        updated_at)
+                SELECT 'Consulta', 150 + m, CASE WHEN k % 5 = 0 THEN 'despesa' ELSE 'receita' END, 'consulta',
+                       k % 3 <> 0, :inicio + k * interval '30 minutes', :primeiro + m, :inicio
+                FROM generate_series(0, {MEDICOS - 1}) AS m, generate_series(0, :slots) AS k
+                """
+            ),
+            parametros,
+        )
+
+
+def _indices(tabela: str, mes) -> tuple[float, float]:
+    """MB de indices da tabela toda e dos que uma consulta do mes atual le (a particao, quando ha)."""
+    with engine.connect() as conn:
+        particoes = conn.execute(
+            text("SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = to_regclass(:t)"), {"t": tabela}
+        ).scalars().all()
+        tabelas = particoes or [tabela]
+        total = sum(conn.scalar(text("SELECT pg_indexes_size(to_regclass(:t))"), {"t": t}) for t in tabelas)
+        atual = f"{tabela}_p{mes:%Y_%m}" if particoes else tabela
+        do_mes = conn.scalar(text("SELECT pg_indexes_size(to_regclass(:t))"), {"t": atual})
+    return total / 1e6, do_mes / 1e6
+
+
+def _p50(client: TestClient, requisicoes: int, pedido) -> float:
+    latencias = []
+    for _ in range(requisicoes):
+        metodo, url, kwargs, esperado = pedido()
+        t0 = time.perf_counter()
+        response = client.request(metodo, url, **kwargs)
+        latencias.append((time.perf_counter() - t0) * 1000)
+        assert response.status_code == esperado, (url, response.status_code, response.text[:200])
+    return statistics.median(latencias)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", type=int, nargs="+", default=[1_000_000, 5_000_000, 10_000_000])
+    parser.add_argument("--requests", type=int, default=30)
+    args = parser.parse_args()
+    if engine.dialect.name != "postgresql":
+        raise SystemExit("bench_particoes requer PostgreSQL")
+
+    from main import app
+
+    medicos, paciente_id = _preparar()
+    atual = mes_de(datetime.now(timezone.utc))
+    # A semana medida fica no meio da agenda do mes atual; as reservas, depois dela (do dia 27 em diante)
+    semana = datetime(atual.year, atual.month, 8, tzinfo=timezone.utc)
+    dias = {"inicio": semana.date().isoformat(), "fim": (semana + timedelta(days=6)).date().isoformat()}
+    semanal = {"inicio": semana.isoformat(), "fim": (semana + timedelta(days=7)).isoformat(), "limit": 50}
+    reservas = datetime(atual.year, atual.month, 1, tzinfo=timezone.utc) + timedelta(minutes=30 * SLOTS_POR_MES)
+    estado = {"cursor": None, "reservas": 0}
+
+    def reservar():
+        inicio = reservas + timedelta(minutes=10 * estado["reservas"])
+        estado["reservas"] += 1
+        payload = {
+            "paciente_id": paciente_id, "tipo": "consulta",
+            "data_hora_inicio": inicio.isoformat(), "data_hora_fim": (inicio + timedelta(minutes=10)).isoformat(),
+        }
+        return "POST", "/agendamentos/", {"json": payload}, 201
+
+    rotas = {
+        "semana": lambda: ("GET", "/agendamentos/", {"params": semanal}, 200),
+        "pagina2": lambda: ("GET", "/agendamentos/", {"params": {"cursor": estado["cursor"], "limit": 50}}, 200),
+        "dispon": lambda: ("GET", "/agendamentos/disponibilidade", {"params": dias}, 200),
+        "reserva": reservar,
+        "export": lambda: ("GET", "/financeiro/transacoes/export", {"params": dias}, 200),
+        "dashboard": lambda: ("GET", "/dashboard/", {}, 200),
+    }
+
+    with TestClient(app) as client:
+        client.headers["Authorization"] = f"Bearer {create_access_token(str(medicos[0]))}"
+        print(
+            f"{'linhas':>10} {'idx_MB':>8} {'idx_mes_MB':>10} " + " ".join(f"{nome + '_ms':>12}" for nome in rotas)
+        )
+        meses = 0
+        for total in args.steps:
+            while meses * LINHAS_POR_MES < total:
+                _popular_mes(somar_meses(atual, -meses), medicos, paciente_id)
+                meses += 1
+            with engine.begin() as conn:
+                conn.execute(text("ANALYZE agendamentos"))
+                conn.execute(text("ANALYZE transacoes"))
+            idx_total, idx_mes = (
+                a + t for a, t in zip(_indices("agendamentos", atual), _indices("transacoes", atual))
+            )
+            estado["cursor"] = client.get("/agendamentos/", params=semanal).json()["next_cursor"]
+            medidas = [_p50(client, args.requests, pedido) for pedido in rotas.values()]
+            print(
+                f"{meses * LINHAS_POR_MES:>10} {idx_total:>8.1f} {idx_mes:>10.1f} "
+                + " ".join(f"{valor:>12.2f}" for valor in medidas),
+                flush=True,
+            )
+
+
+if __name__ == "__main__":
+    main()
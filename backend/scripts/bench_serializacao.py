@@ -0,0 +1,128 @@
+"""Microbenchmark: listagem via ORM + Pydantic contra colunas + orjson.
+
+Popula o banco apontado por DATABASE_URL (descartavel, ja migrado) com --rows
+agendamentos (cada um com seu paciente) e transacoes. Em seguida mede, para cada
+listagem, o melhor de --repeat execucoes dos dois caminhos, separando consulta e
+serializacao:
+
+    atual   select(Model) [+ joinedload] -> model_validate (from_attributes) -> json.dumps
+    rapido  select(colunas) -> serializacao.montar -> orjson
+
+    python -m scripts.bench_serializacao --rows 10000 --repeat 5
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+from pydantic import TypeAdapter
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session, joinedload
+
+from database import engine
+from models import Agendamento, Paciente, Transacao, User
+from schemas import AgendamentoOut, PacienteOut, TransacaoOut
+from security import get_password_hash
+from serializacao import ORJSONResponse, colunas, montar
+
+
+def _popular(rows: int) -> int:
+    base = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    with engine.begin() as conn:
+        user_id = conn.execute(
+            insert(User).returning(User.id),
+            {"nome": "Bench", "email": f"bench{time.time_ns()}@aura.app",
+             "hashed_password": get_password_hash("bench"), "role": "doctor", "is_active": True},
+        ).scalar_one()
+        pacientes = conn.execute(
+            insert(Paciente).returning(Paciente.id),
+            [{"nome": f"Paciente {i}", "telefone": f"1199{i:07d}", "email": f"p{i}@aura.app",
+              "responsavel_id": user_id} for i in range(rows)],
+        ).scalars().all()
+        conn.execute(insert(Agendamento), [
+            {"paciente_id": paciente_id, "data_hora_inicio": base + timedelta(minutes=30 * i),
+             "data_hora_fim": base + timedelta(minutes=30 * i + 30), "tipo": "consulta", "status": "agendado",
+             "valor_previsto": 150, "sala": "Sala 1", "observacoes": "Retorno", "responsavel_id": user_id}
+            for i, paciente_id in enumerate(pacientes)
+        ])
+        conn.execute(insert(Transacao), [
+            {"descricao": f"Consulta {i}", "valor": 150, "tipo": "receita", "categoria": "consulta",
+             "pago": bool(i % 2), "data_competencia": base + timedelta(hours=i), "responsavel_id": user_id}
+            for i in range(rows)
+        ])
+    return user_id
+
+
+def _casos(user_id: int) -> dict:
+    pac_ag = colunas(Paciente, PacienteOut, prefixo="paciente__")
+    return {
+        "pacientes": (
+            PacienteOut,
+            select(Paciente).where(Paciente.responsavel_id == user_id).order_by(Paciente.nome),
+            select(*colunas(Paciente, PacienteOut)).where(Paciente.responsavel_id == user_id).order_by(Paciente.nome),
+        ),
+        "transacoes": (
+            TransacaoOut,
+            select(Transacao).where(Transacao.responsavel_id == user_id).order_by(Transacao.data_competencia.desc()),
+            select(*colunas(Transacao, TransacaoOut))
+            .where(Transacao.responsavel_id == user_id)
+            .order_by(Transacao.data_competencia.desc()),
+        ),
+        "agendamentos": (
+            AgendamentoOut,
+            select(Agendamento)
+            .options(joinedload(Agendamento.paciente))
+            .where(Agendamento.responsavel_id == user_id)
+            .order_by(Agendamento.data_hora_inicio),
+            select(*colunas(Agendamento, AgendamentoOut), *pac_ag)
+            .join(Paciente, Agendamento.paciente_id == Paciente.id)
+            .where(Agendamento.responsavel_id == user_id)
+            .order_by(Agendamento.data_hora_inicio),
+        ),
+    }
+
+
+def _atual(session: Session, schema, query) -> tuple[float, float, int]:
+    t0 = time.perf_counter()
+    objetos = session.scalars(query).unique().all()
+    t1 = time.perf_counter()
+    # O que o FastAPI faz com response_model: valida from_attributes e gera JSON
+    dados = TypeAdapter(list[schema]).validate_python(objetos, from_attributes=True)
+    corpo = json.dumps([item.model_dump(mode="json") for item in dados], separators=(",", ":")).encode()
+    t2 = time.perf_counter()
+    session.expunge_all()
+    return t1 - t0, t2 - t1, len(corpo)
+
+
+def _rapido(session: Session, schema, query) -> tuple[float, float, int]:
+    t0 = time.perf_counter()
+    linhas = session.execute(query).mappings().all()
+    t1 = time.perf_counter()
+    corpo = ORJSONResponse(montar(linhas, schema)).body
+    t2 = time.perf_counter()
+    return t1 - t0, t2 - t1, len(corpo)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    user_id = _popular(args.rows)
+    print(f"{'listagem':>13} {'caminho':>7} {'consulta_ms':>12} {'serializa_ms':>13} {'total_ms':>9} {'KB':>7}")
+    with Session(engine) as session:
+        for nome, (schema, query_orm, query_colunas) in _casos(user_id).items():
+            totais = {}
+            for caminho, fn, query in (("atual", _atual, query_orm), ("rapido", _rapido, query_colunas)):
+                consulta, serializa, tamanho = min(
+                    (fn(session, schema, query) for _ in range(args.repeat)), key=lambda r: r[0] + r[1]
+                )
+                totais[caminho] = consulta + serializa
+                print(f"{nome:>13} {caminho:>7} {consulta * 1000:>12.1f} {serializa * 1000:>13.1f} "
+                      f"{totais[caminho] * 1000:>9.1f} {tamanho / 1024:>7.0f}")
+            print(f"{'':>13} ganho: {totais['atual'] / totais['rapido']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Verifica que a exportacao em streaming tem memoria constante.
+
+Popula o banco apontado por DATABASE_URL (descartavel, ja migrado) em degraus e,
+a cada degrau, baixa as duas exportacoes direto pela aplicacao ASGI descartando
+o corpo. O pico de RSS (ru_maxrss) nao pode crescer mais que --max-growth-mb
+entre o primeiro e o ultimo degrau; sai com codigo 1 caso contrario:
+
+    python -m scripts.check_export_memory --steps 10000 200000 --max-growth-mb 32
+"""
+import argparse
+import asyncio
+import resource
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, insert, select
+
+from database import engine
+from models import Agendamento, Paciente, Transacao, User
+from security import create_access_token, get_password_hash
+
+CHUNK = 10_000
+ROTAS = ["/financeiro/transacoes/export", "/agendamentos/export?formato=ndjson"]
+
+
+def _pico_mb() -> float:
+    # Linux reporta ru_maxrss em KiB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _preparar() -> tuple[int, int]:
+    with engine.begin() as conn:
+        user_id = conn.execute(
+            insert(User).returning(User.id),
+            {"nome": "Bench", "email": f"bench{time.time_ns()}@aura.app",
+             "hashed_password": get_password_hash("bench"), "role": "doctor", "is_active": True},
+        ).scalar_one()
+        paciente_id = conn.execute(
+            insert(Paciente).returning(Paciente.id),
+            {"nome": "Paciente Bench", "telefone": "0", "responsavel_id": user_id},
+        ).scalar_one()
+    return user_id, paciente_id
+
+
+def _popular(ate: int, user_id: int, paciente_id: int) -> None:
+    base = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    with engine.begin() as conn:
+        atual = conn.execute(
+            select(func.count()).select_from(Transacao).where(Transacao.responsavel_id == user_id)
+        ).scalar_one()
+        for inicio in range(atual, ate, CHUNK):
+            ids = range(inicio, min(inicio + CHUNK, ate))
+            conn.execute(insert(Transacao), [
+                {"descricao": f"Transacao {i}", "valor": 100, "tipo": "receita", "categoria": "consulta",
+                 "pago": True, "data_competencia": base + timedelta(minutes=i), "responsavel_id": user_id}
+                for i in ids
+            ])
+            conn.execute(insert(Agendamento), [
+                {"paciente_id": paciente_id, "data_hora_inicio": base + timedelta(minutes=30 * i),
+                 "data_hora_fim": base + timedelta(minutes=30 * i + 30), "tipo": "consulta",
+                 "status": "agendado", "responsavel_id": user_id}
+                for i in ids
+            ])
+
+
+async def _baixar(app, caminho: str, token: str) -> int:
+    """Chama a aplicacao ASGI e conta os bytes do corpo sem guarda-los."""
+    path, _, query = caminho.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+        "root_path": "", "headers": [(b"host", b"bench"), (b"authorization", f"Bearer {token}".encode())],
+        "client": ("127.0.0.1", 0), "server": ("bench", 80),
+    }
+    recebido = {"bytes": 0, "status": None}
+    mensagens = [{"type": "http.request", "body": b"", "more_body": False}]
+    fim = asyncio.Event()
+
+    async def receive():
+        if mensagens:
+            return mensagens.pop()
+        # Cliente nunca desconecta: o Starlette cancela esta espera ao terminar o corpo
+        await fim.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            recebido["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            recebido["bytes"] += len(message.get("body", b""))
+
+    await app(scope, receive, send)
+    fim.set()
+    if recebido["status"] != 200:
+        raise SystemExit(f"{caminho} respondeu {recebido['status']}")
+    return recebido["bytes"]
+
+
+async def _medir(steps: list[int]) -> list[float]:
+    # Um unico event loop: o pool da engine assincrona fica preso ao loop que o criou
+    from main import app
+
+    user_id, paciente_id = _preparar()
+    token = create_access_token(str(user_id))
+
+    picos = []
+    print(f"{'linhas':>10} {'MB enviados':>12} {'pico RSS MB':>12}")
+    for total in steps:
+        _popular(total, user_id, paciente_id)
+        enviados = 0
+        for rota in ROTAS:
+            enviados += await _baixar(app, rota, token)
+        picos.append(_pico_mb())
+        print(f"{total:>10} {enviados / 2**20:>12.1f} {picos[-1]:>12.1f}")
+    return picos
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", type=int, nargs="+", default=[10_000, 200_000])
+    parser.add_argument("--max-growth-mb", type=float, default=32)
+    args = parser.parse_args()
+
+    picos = asyncio.run(_medir(args.steps))
+    crescimento = picos[-1] - picos[0]
+    print(f"crescimento do pico: {crescimento:.1f} MB (limite {args.max_growth_mb} MB)")
+    if crescimento > args.max_growth_mb:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
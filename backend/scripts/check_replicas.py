@@ -0,0 +1,103 @@
+"""Verifica o roteamento de leituras para as replicas (ver replicas.py).
+
+Roda contra um primario e ao menos uma replica de verdade (DATABASE_URL e
+DATABASE_REPLICA_URLS, banco ja migrado), direto pela aplicacao ASGI:
+
+1. cria um paciente e o le de volta na mesma hora com o cookie aura_lsn: a
+   leitura tem que encontra-lo (no primario ou numa replica que ja alcancou o LSN);
+2. sem o cookie, espera a replica alcancar o primario e confere que as leituras
+   passam a ser servidas por ela.
+
+Sai com codigo 1 se alguma etapa falhar; o estado final de /internal/replicas
+vai para a saida padrao.
+
+    python -m scripts.check_replicas --timeout 30
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import httpx
+from sqlalchemy import insert
+
+from config import settings
+from database import engine
+from main import app
+from models import User
+from security import create_access_token, get_password_hash
+
+INTERNO = {"X-Internal-Token": settings.internal_token}
+
+
+def _usuario() -> int:
+    with engine.begin() as conn:
+        return conn.execute(
+            insert(User).returning(User.id),
+            {"nome": "Replica Check", "email": f"replica{time.time_ns()}@aura.app",
+             "hashed_password": get_password_hash("replica"), "role": "doctor", "is_active": True},
+        ).scalar_one()
+
+
+async def _estado(client: httpx.AsyncClient) -> dict:
+    return (await client.get("/internal/replicas", headers=INTERNO)).json()
+
+
+async def _executar(timeout: float) -> list[str]:
+    falhas = []
+    token = create_access_token(subject=str(_usuario()))
+    transporte = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app), httpx.AsyncClient(
+        transport=transporte, base_url="http://check", headers={"Authorization": f"Bearer {token}"}
+    ) as client:
+        # O monitor precisa de uma verificacao antes de liberar as replicas
+        limite = time.monotonic() + timeout
+        while not any(r["status"] == "ok" for r in (await _estado(client))["replicas"].values()):
+            if time.monotonic() > limite:
+                return ["nenhuma replica ficou elegivel: " + json.dumps((await _estado(client))["replicas"])]
+            await asyncio.sleep(0.5)
+
+        criado = await client.post("/pacientes/", json={"nome": "Paciente Replica", "telefone": "0"})
+        if criado.status_code != 201 or "aura_lsn" not in client.cookies:
+            return [f"escrita sem cookie aura_lsn (status {criado.status_code})"]
+        paciente_id = criado.json()["id"]
+
+        lido = await client.get(f"/pacientes/{paciente_id}")
+        if lido.status_code != 200:
+            falhas.append(f"leitura logo apos a escrita nao viu o paciente (status {lido.status_code})")
+
+        client.cookies.clear()
+        antes = sum(r["reads"] for r in (await _estado(client))["replicas"].values())
+        limite = time.monotonic() + timeout
+        while True:
+            lido = await client.get(f"/pacientes/{paciente_id}")
+            depois = sum(r["reads"] for r in (await _estado(client))["replicas"].values())
+            if lido.status_code == 200 and depois > antes:
+                break
+            if time.monotonic() > limite:
+                falhas.append("sem cookie, as leituras nao passaram para a replica dentro do timeout")
+                break
+            antes = depois
+            await asyncio.sleep(0.5)
+
+        print(json.dumps(await _estado(client), indent=2))
+    return falhas
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--timeout", type=float, default=30, help="segundos de espera pela replica")
+    args = parser.parse_args()
+    if not settings.database_replica_urls:
+        print("DATABASE_REPLICA_URLS vazio: nada para verificar", file=sys.stderr)
+        return 1
+
+    falhas = asyncio.run(_executar(args.timeout))
+    for falha in falhas:
+        print("FALHA:", falha, file=sys.stderr)
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,256 @@
+"""Verifica os planos de execucao das consultas feitas pelas rotas.
+
+Popula o banco apontado por DATABASE_URL com dados sinteticos, exercita as rotas
+via TestClient capturando cada consulta emitida (SELECT, e tambem os lookups
+dentro de INSERT/UPDATE/DELETE) e roda EXPLAIN sobre ela; sem ANALYZE, nada e
+executado. Sai com codigo 1 se algum plano usar Seq Scan em uma tabela da
+aplicacao.
+
+Uso (a partir de backend/, com um Postgres descartavel ja migrado):
+
+    alembic upgrade head
+    python -m scripts.explain_check
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+from datetime import datetime, timedelta, timezone
+
+# Os planos independem do driver; o modo sincrono permite capturar os SQLs via psycopg2
+os.environ["DATABASE_ASYNC"] = "false"
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event, insert, text
+
+from database import engine
+from importacao import DEFINICAO_STAGING, STAGING
+from models import Agendamento, Paciente, PasswordResetToken, Transacao, User
+from particoes import manutencao_particoes
+from security import get_password_hash
+
+SEED_PASSWORD = "explain-check"
+TABELAS = {"users", "pacientes", "agendamentos", "transacoes", "password_reset_tokens"}
+# Comandos com plano proprio; BEGIN/SAVEPOINT/SET e afins ficam de fora
+COMANDOS = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+# Particoes mensais (particoes.py) contam como a tabela mae
+PARTICAO = re.compile(r"_(p\d{4}_\d{2}|padrao)$")
+
+
+def seed(usuarios: int = 2_000, pacientes: int = 20_000, agendamentos: int = 50_000, transacoes: int = 50_000):
+    rng = random.Random(42)
+    agora = datetime.now(timezone.utc)
+    senha = get_password_hash(SEED_PASSWORD)
+
+    with engine.begin() as conn:
+        conn.execute(
+            insert(User),
+            [
+                {"nome": f"Medico {i}", "email": f"medico{i}@explain.aura", "hashed_password": senha,
+                 "role": "doctor", "is_active": True, "created_at": agora}
+                for i in range(usuarios)
+            ],
+        )
+        user_ids = [row[0] for row in conn.execute(text("SELECT id FROM users"))]
+
+        conn.execute(
+            insert(Paciente),
+            [
+                {"nome": f"Paciente {i:06d}", "telefone": f"11{i:09d}", "cpf": f"{i:011d}",
+                 "data_cadastro": agora, "responsavel_id": rng.choice(user_ids)}
+                for i in range(pacientes)
+            ],
+        )
+        paciente_ids = [row[0] for row in conn.execute(text("SELECT id FROM pacientes"))]
+
+        linhas = []
+        # Pares (medico, horario) distintos: as constraints de exclusao barram sobreposicoes.
+        # Cada medico atende no proprio consultorio, o que tambem evita conflitos de sala.
+        horarios = 40_001
+        for par in rng.sample(range(len(user_ids) * horarios), agendamentos):
+            inicio = agora + timedelta(minutes=30 * (par % horarios - horarios // 2))
+            linhas.append({
+                "paciente_id": rng.choice(paciente_ids), "data_hora_inicio": inicio,
+                "data_hora_fim": inicio + timedelta(minutes=30), "tipo": "consulta", "status": "agendado",
+                "sala": f"Consultorio {par // horarios}", "responsavel_id": user_ids[par // horarios],
+            })
+        conn.execute(insert(Agendamento), linhas)
+
+        conn.execute(
+            insert(Transacao),
+            [
+                {"descricao": f"Lancamento {i}", "valor": rng.randint(50, 2_000), "tipo": rng.choice(["receita", "despesa"]),
+                 "categoria": rng.choice(["consulta", "aluguel", "material"]), "pago": rng.random() < 0.7,
+                 "data_competencia": agora - timedelta(days=rng.randint(0, 720)), "responsavel_id": rng.choice(user_ids)}
+                for i in range(transacoes)
+            ],
+        )
+        conn.execute(
+            insert(PasswordResetToken),
+            [
+                {"user_id": rng.choice(user_ids), "token_hash": "x", "is_used": rng.random() < 0.9,
+                 "expires_at": agora, "created_at": agora - timedelta(minutes=rng.randint(0, 60_000))}
+                for _ in range(5_000)
+            ],
+        )
+        conn.execute(text("ANALYZE"))
+
+    # Tira as linhas de historico da particao padrao, como o loop de particoes.py faz em producao
+    asyncio.run(manutencao_particoes.garantir())
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+
+
+def exercitar_rotas(client: TestClient) -> None:
+    email = "medico0@explain.aura"
+    token = client.post("/auth/login", json={"email": email, "password": SEED_PASSWORD}).json()["access_token"]
+    client.headers["Authorization"] = f"Bearer {token}"
+
+    client.get("/auth/me")
+    client.get("/dashboard/")
+    pacientes = client.get("/pacientes/").json()
+    if pacientes:
+        client.get(f"/pacientes/{pacientes[0]['id']}")
+    # Busca: prefixo curto do nome, trigrama, prefixo do telefone e CPF exato
+    for termo in ("Pa", "ente 0123", "1100001", "000.000.012-34"):
+        client.get("/pacientes/search", params={"q": termo})
+
+    agora = datetime.now(timezone.utc)
+    pagina = client.get(
+        "/agendamentos/",
+        params={"inicio": agora.isoformat(), "fim": (agora + timedelta(days=7)).isoformat(), "limit": 5},
+    ).json()
+    client.get("/agendamentos/", params={"cursor": pagina.get("next_cursor") or "", "limit": 20})
+    client.get("/agendamentos/agenda", params={"limit": 5})
+    semana = {"inicio": agora.date().isoformat(), "fim": (agora + timedelta(days=6)).date().isoformat()}
+    client.get("/agendamentos/disponibilidade", params=semana)
+    client.get("/agendamentos/disponibilidade", params={**semana, "sala": ["Consultorio 0", "Consultorio 1"]})
+    client.get("/financeiro/transacoes/")
+    client.get("/financeiro/")
+    client.get("/financeiro/resumo")
+    client.get("/financeiro/resumo", params={"inicio": (agora - timedelta(days=90)).date().isoformat()})
+    trimestre = {"inicio": (agora - timedelta(days=90)).date().isoformat(), "fim": agora.date().isoformat()}
+    client.get("/financeiro/transacoes/export", params=trimestre)
+    client.get("/financeiro/transacoes/export", params={**trimestre, "formato": "ndjson", "categoria": "consulta"})
+    client.get("/agendamentos/export", params=semana)
+    client.get("/agendamentos/export", params={**semana, "formato": "ndjson", "sala": "Consultorio 0"})
+
+    # Rotas de escrita: os lookups que fazem antes de gravar tambem precisam de indice
+    client.post("/auth/register", json={"nome": "Novo", "email": "novo@explain.aura", "password": "x"})
+    client.post("/auth/forgot-password", json={"email": email})
+    client.post("/auth/change-password", json={"current_password": "errada", "new_password": "x"})
+    paciente = client.post("/pacientes/", json={"nome": "Paciente Novo", "telefone": "11999999999"}).json()
+    def agendar(inicio: datetime, **extra) -> None:
+        client.post(
+            "/agendamentos/",
+            json={"paciente_id": paciente["id"], "data_hora_inicio": inicio.isoformat(),
+                  "data_hora_fim": (inicio + timedelta(minutes=30)).isoformat(), "tipo": "consulta", **extra},
+        )
+
+    agendar(agora + timedelta(days=3650))
+    # Conflito de sala e de medico: a constraint barra e buscar_conflitos monta o 409
+    proximos = client.get("/agendamentos/", params={"inicio": agora.isoformat(), "limit": 1}).json()["items"]
+    for ocupado in proximos:
+        agendar(datetime.fromisoformat(ocupado["data_hora_inicio"]), sala=ocupado["sala"])
+    # Na virada do mes a sobreposicao e conferida antes do commit (agenda.conferir_sobreposicao)
+    virada = datetime(agora.year + agora.month // 12, agora.month % 12 + 1, 1, tzinfo=timezone.utc)
+    agendar(virada - timedelta(minutes=15), sala="Consultorio novo")
+    client.post(
+        "/financeiro/transacoes/",
+        json={"descricao": "Consulta", "valor": 150, "tipo": "receita", "categoria": "consulta", "pago": True},
+    )
+    # Lote offline: paciente novo por temp_id, agendamento que o referencia e transacao; o reenvio
+    # do mesmo lote passa pela consulta de idempotencia
+    inicio_sync = agora + timedelta(days=3651)
+    lote = {"mutacoes": [
+        {"tipo": "paciente", "chave": "explain-p", "temp_id": "tmp-1",
+         "dados": {"nome": "Paciente Offline", "telefone": "11988888888"}},
+        {"tipo": "agendamento", "chave": "explain-a",
+         "dados": {"paciente_id": "tmp-1", "data_hora_inicio": inicio_sync.isoformat(),
+                   "data_hora_fim": (inicio_sync + timedelta(minutes=30)).isoformat(), "tipo": "consulta"}},
+        {"tipo": "transacao", "chave": "explain-t",
+         "dados": {"descricao": "Consulta", "valor": 150, "tipo": "receita", "categoria": "consulta"}},
+    ]}
+    client.post("/sync", json=lote)
+    client.post("/sync", json=lote)
+
+    # Exclusao do paciente cancela os agendamentos futuros dele; os clientes veem tudo pelo ?since=
+    marca = client.get("/pacientes/", params={"limit": 1}).headers.get("X-Watermark")
+    client.delete(f"/pacientes/{paciente['id']}")
+    for lista in ("/pacientes/", "/agendamentos/", "/financeiro/transacoes/"):
+        client.get(lista, params={"since": marca})
+    client.post("/auth/reset-password", json={"email": email, "token": "000000", "new_password": "x"})
+    # Importacao: um CPF novo, um ja cadastrado (seed) e um repetido no arquivo
+    client.post(
+        "/pacientes/bulk",
+        content="nome,telefone,cpf\nNovo,1,99999999999\nRepetido,2,00000000001\nDe novo,3,99999999999\n",
+        headers={"Content-Type": "text/csv"},
+    )
+
+
+def seq_scans(plano: dict, vazias: set[str]) -> list[str]:
+    encontrados = []
+    relacao = plano.get("Relation Name", "")
+    tabela = PARTICAO.sub("", relacao)
+    if plano.get("Node Type") == "Seq Scan" and tabela in TABELAS and relacao not in vazias:
+        encontrados.append(tabela)
+    for filho in plano.get("Plans", []):
+        encontrados.extend(seq_scans(filho, vazias))
+    return encontrados
+
+
+def main() -> int:
+    if engine.dialect.name != "postgresql":
+        print("explain_check requer PostgreSQL (DATABASE_URL atual usa %s)" % engine.dialect.name)
+        return 2
+
+    seed()
+    with engine.connect() as conn:
+        # Particoes quase vazias (meses futuros, o comeco do historico) sao lidas por Seq Scan sem custo relevante
+        vazias = {
+            nome for (nome,) in conn.execute(text("SELECT relname FROM pg_class WHERE relispartition AND relpages < 10"))
+        }
+
+    capturadas: list[tuple[str, object]] = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _capturar(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(COMANDOS) and not executemany:
+            capturadas.append((statement, parameters))
+
+    from main import app
+
+    exercitar_rotas(TestClient(app))
+    event.remove(engine, "before_cursor_execute", _capturar)
+
+    falhas = 0
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        # A staging da importacao e temporaria: recriada aqui, com o tamanho do arquivo enviado e
+        # analisada como em importacao.consolidar, para os planos que a leem
+        cursor.execute(f"CREATE TEMP TABLE {STAGING} {DEFINICAO_STAGING}")
+        cursor.execute(
+            f"INSERT INTO {STAGING} (linha, cpf) SELECT g, lpad(g::text, 11, '9') FROM generate_series(1, 3) g"
+        )
+        cursor.execute(f"ANALYZE {STAGING}")
+        for statement, parameters in capturadas:
+            cursor.execute("EXPLAIN (FORMAT JSON) " + statement, parameters)
+            plano = cursor.fetchone()[0]
+            if isinstance(plano, str):
+                plano = json.loads(plano)
+            tabelas = seq_scans(plano[0]["Plan"], vazias)
+            if tabelas:
+                falhas += 1
+                print("SEQ SCAN em %s:\n  %s\n" % (", ".join(sorted(set(tabelas))), " ".join(statement.split())))
+    finally:
+        raw.close()
+
+    print("%d consultas verificadas, %d com Seq Scan" % (len(capturadas), falhas))
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
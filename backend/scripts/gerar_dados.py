@@ -0,0 +1,174 @@
+"""Gera uma clinica sintetica para benchmarks e testes de carga.
+
+Popula o banco apontado por DATABASE_URL (descartavel, ja migrado) com medicos,
+pacientes, agendamentos e transacoes. Com a mesma --seed e os mesmos volumes o
+resultado e o mesmo (com as datas relativas ao dia da geracao), para que rodadas
+de benchmark sejam comparaveis.
+
+- Medicos: medico0@bench.aura.app, medico1@..., senha "bench".
+- Pacientes: distribuidos entre os medicos, com CPF unico e nomes acentuados.
+- Agendamentos: em horarios de 30 min das 8h as 18h (fuso da clinica), sem
+  sobreposicao por medico nem por sala (as constraints de exclusao da 0006
+  continuam valendo). Metade no passado, metade no futuro.
+- Transacoes: espalhadas pelos ultimos --dias. O resumo_financeiro e
+  reconstruido no fim, ja que a carga em massa nao passa pelas rotas.
+
+    python -m scripts.gerar_dados --medicos 20 --pacientes 200000 --agendamentos 1000000 --transacoes 5000000
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, time as dt_time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import insert, select, text
+
+from config import settings
+from database import engine
+from models import Agendamento, Paciente, Transacao, User
+from rollups import reconstruir
+from security import get_password_hash
+
+CHUNK = 10_000
+DOMINIO = "bench.aura.app"
+SENHA = "bench"
+HORARIOS_POR_DIA = 20  # 8h as 18h, de 30 em 30 minutos
+
+PRIMEIROS = ["José", "João", "Maria", "Ana", "Antônio", "Francisco", "Luíza", "Lúcia", "Márcio", "Conceição",
+             "Sebastião", "Letícia", "Inês", "Otávio", "Cláudia", "Rafael", "Bruna", "Thiago", "Débora", "Caio"]
+SOBRENOMES = ["Silva", "Santos", "Oliveira", "Souza", "Conceição", "Araújo", "Gonçalves", "Lima", "Gomes",
+              "Ribeiro", "Carvalho", "Simões", "Brandão", "Magalhães", "Assunção", "Pereira", "Rocha", "Peçanha"]
+TIPOS_CONSULTA = ["consulta", "retorno", "exame", "procedimento"]
+CATEGORIAS = {
+    "receita": ["consulta", "retorno", "exame", "procedimento", "convenio"],
+    "despesa": ["aluguel", "material", "salarios", "impostos", "marketing"],
+}
+
+
+def email_medico(indice: int) -> str:
+    return f"medico{indice}@{DOMINIO}"
+
+
+def _medicos(conn, total: int) -> list[int]:
+    if conn.execute(select(User.id).where(User.email == email_medico(0))).first() is not None:
+        sys.exit(f"{email_medico(0)} ja existe: use um banco novo")
+    senha = get_password_hash(SENHA)
+    return conn.execute(
+        insert(User).returning(User.id, sort_by_parameter_order=True),
+        [{"nome": f"Dr(a). Bench {i}", "email": email_medico(i), "hashed_password": senha,
+          "role": "doctor", "is_active": True} for i in range(total)],
+    ).scalars().all()
+
+
+def _pacientes(conn, total: int, medicos: list[int], rng: random.Random) -> dict[int, list[int]]:
+    por_medico: dict[int, list[int]] = {m: [] for m in medicos}
+    for inicio in range(0, total, CHUNK):
+        linhas = []
+        for i in range(inicio, min(inicio + CHUNK, total)):
+            nome = f"{rng.choice(PRIMEIROS)} {rng.choice(SOBRENOMES)} {rng.choice(SOBRENOMES)}"
+            linhas.append({
+                "nome": nome,
+                "telefone": f"({rng.randint(11, 99)}) 9{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}",
+                "email": f"paciente{i}@{DOMINIO}",
+                "cpf": f"{i:011d}",
+                "responsavel_id": medicos[i % len(medicos)],
+            })
+        resultado = conn.execute(
+            insert(Paciente).returning(Paciente.id, Paciente.responsavel_id, sort_by_parameter_order=True), linhas
+        )
+        for paciente_id, medico_id in resultado:
+            por_medico[medico_id].append(paciente_id)
+    return por_medico
+
+
+def _agendamentos(conn, total: int, pacientes: dict[int, list[int]], rng: random.Random) -> None:
+    tz = ZoneInfo(settings.clinic_timezone)
+    medicos = [m for m, ids in pacientes.items() if ids]
+    por_medico = -(-total // len(medicos))
+    dias = -(-por_medico // HORARIOS_POR_DIA)
+    primeiro_dia = datetime.now(tz).date() - timedelta(days=dias // 2)
+    agora = datetime.now(timezone.utc)
+
+    for inicio in range(0, total, CHUNK):
+        linhas = []
+        for i in range(inicio, min(inicio + CHUNK, total)):
+            # Horario k do medico: cada medico tem sua sala, entao nada se sobrepoe
+            posicao, k = i % len(medicos), i // len(medicos)
+            medico = medicos[posicao]
+            dia = primeiro_dia + timedelta(days=k // HORARIOS_POR_DIA)
+            hora_inicio = datetime.combine(dia, dt_time(8), tz) + timedelta(minutes=30 * (k % HORARIOS_POR_DIA))
+            hora_inicio = hora_inicio.astimezone(timezone.utc)
+            if hora_inicio < agora:
+                status = rng.choices(["finalizado", "cancelado", "confirmado"], [85, 10, 5])[0]
+            else:
+                status = rng.choices(["agendado", "confirmado", "cancelado"], [60, 35, 5])[0]
+            linhas.append({
+                "paciente_id": rng.choice(pacientes[medico]),
+                "data_hora_inicio": hora_inicio,
+                "data_hora_fim": hora_inicio + timedelta(minutes=30),
+                "tipo": rng.choice(TIPOS_CONSULTA),
+                "status": status,
+                "valor_previsto": rng.choice([150, 200, 250, 300, 450]),
+                "sala": f"Sala {posicao + 1}",
+                "observacoes": rng.choice([None, None, "Retorno", "Trazer exames", "Primeira consulta"]),
+                "responsavel_id": medico,
+            })
+        conn.execute(insert(Agendamento), linhas)
+
+
+def _transacoes(conn, total: int, medicos: list[int], dias: int, rng: random.Random) -> None:
+    agora = datetime.now(timezone.utc)
+    segundos = dias * 86_400
+    for inicio in range(0, total, CHUNK):
+        linhas = []
+        for i in range(inicio, min(inicio + CHUNK, total)):
+            tipo = "receita" if rng.random() < 0.7 else "despesa"
+            categoria = rng.choice(CATEGORIAS[tipo])
+            linhas.append({
+                "descricao": f"{categoria.capitalize()} {i}",
+                "valor": round(rng.uniform(50, 2_000), 2),
+                "tipo": tipo,
+                "categoria": categoria,
+                "pago": rng.random() < 0.8,
+                "data_competencia": agora - timedelta(seconds=rng.randrange(segundos)),
+                "responsavel_id": rng.choice(medicos),
+            })
+        conn.execute(insert(Transacao), linhas)
+
+
+def _etapa(nome: str, fn, *args):
+    # Uma transacao por etapa: uma falha no meio nao deixa a etapa pela metade
+    inicio = time.perf_counter()
+    with engine.begin() as conn:
+        resultado = fn(conn, *args)
+    print(f"{nome:>18}: {time.perf_counter() - inicio:8.1f} s")
+    return resultado
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--medicos", type=int, default=20)
+    parser.add_argument("--pacientes", type=int, default=200_000)
+    parser.add_argument("--agendamentos", type=int, default=1_000_000)
+    parser.add_argument("--transacoes", type=int, default=5_000_000)
+    parser.add_argument("--dias", type=int, default=730, help="janela das transacoes, em dias ate hoje")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    if args.medicos < 1 or args.pacientes < args.medicos:
+        parser.error("use ao menos um medico e um paciente por medico")
+
+    rng = random.Random(args.seed)
+    medicos = _etapa("medicos", _medicos, args.medicos)
+    pacientes = _etapa("pacientes", _pacientes, args.pacientes, medicos, rng)
+    _etapa("agendamentos", _agendamentos, args.agendamentos, pacientes, rng)
+    _etapa("transacoes", _transacoes, args.transacoes, medicos, args.dias, rng)
+    _etapa("resumo_financeiro", reconstruir)
+
+    if engine.dialect.name == "postgresql":
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("ANALYZE"))
+
+
+if __name__ == "__main__":
+    main()
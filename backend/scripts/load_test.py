@@ -0,0 +1,76 @@
+"""Teste de carga simples contra uma instancia da API em execucao.
+
+Mede vazao e latencia com N clientes concorrentes (padrao 200). Para comparar
+os caminhos de banco, suba a API duas vezes e rode o script contra cada uma:
+
+    DATABASE_ASYNC=true  uvicorn main:app --port 8000
+    DATABASE_ASYNC=false uvicorn main:app --port 8001
+
+    python -m scripts.load_test --url http://localhost:8000 --concurrency 200
+    python -m scripts.load_test --url http://localhost:8001 --concurrency 200
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+ROTAS = ["/agendamentos/", "/pacientes/", "/financeiro/transacoes/", "/auth/me"]
+
+
+async def _cliente(client: httpx.AsyncClient, fim: float, latencias: list[float], erros: list[int]) -> None:
+    i = 0
+    while time.perf_counter() < fim:
+        rota = ROTAS[i % len(ROTAS)]
+        i += 1
+        inicio = time.perf_counter()
+        try:
+            response = await client.get(rota)
+            if response.status_code >= 400:
+                erros.append(response.status_code)
+        except httpx.HTTPError:
+            erros.append(0)
+        latencias.append(time.perf_counter() - inicio)
+
+
+async def executar(url: str, email: str, senha: str, concorrencia: int, duracao: float) -> dict:
+    limites = httpx.Limits(max_connections=concorrencia, max_keepalive_connections=concorrencia)
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=30) as client:
+        login = await client.post("/auth/login", json={"email": email, "password": senha})
+        login.raise_for_status()
+        client.headers["Authorization"] = f"Bearer {login.json()['access_token']}"
+
+        latencias: list[float] = []
+        erros: list[int] = []
+        fim = time.perf_counter() + duracao
+        await asyncio.gather(*(_cliente(client, fim, latencias, erros) for _ in range(concorrencia)))
+
+    quantis = statistics.quantiles(latencias, n=100) if len(latencias) > 1 else [0.0] * 99
+    return {
+        "concorrencia": concorrencia,
+        "requisicoes": len(latencias),
+        "erros": len(erros),
+        "req_por_segundo": round(len(latencias) / duracao, 1),
+        "p50_ms": round(quantis[49] * 1000, 1),
+        "p95_ms": round(quantis[94] * 1000, 1),
+        "p99_ms": round(quantis[98] * 1000, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--email", default="dr.kelven@aura.app")
+    parser.add_argument("--password", default="aura123")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=30.0)
+    args = parser.parse_args()
+
+    resultado = asyncio.run(executar(args.url, args.email, args.password, args.concurrency, args.duration))
+    for chave, valor in resultado.items():
+        print(f"{chave:>16}: {valor}")
+
+
+if __name__ == "__main__":
+    main()
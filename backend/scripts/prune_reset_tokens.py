@@ -0,0 +1,25 @@
+"""Remove tokens de recuperacao usados ou expirados de todos os usuarios.
+
+As rotas ja limpam os tokens do proprio usuario; este script cobre quem nunca
+voltou. Pensado para rodar periodicamente (cron):
+
+    python -m scripts.prune_reset_tokens
+"""
+from datetime import datetime, timezone
+
+from database import SessionLocal
+from security import stale_reset_tokens
+
+
+def main() -> None:
+    db = SessionLocal()
+    try:
+        result = db.execute(stale_reset_tokens(datetime.now(timezone.utc)))
+        db.commit()
+        print("%d tokens removidos" % result.rowcount)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
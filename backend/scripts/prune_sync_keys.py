@@ -0,0 +1,22 @@
+"""Remove as chaves de idempotencia de POST /sync mais velhas que SYNC_IDEMPOTENCY_TTL_DAYS.
+
+Pensado para rodar periodicamente (cron):
+
+    python -m scripts.prune_sync_keys
+"""
+from database import SessionLocal
+from mutacoes import chaves_expiradas
+
+
+def main() -> None:
+    db = SessionLocal()
+    try:
+        result = db.execute(chaves_expiradas())
+        db.commit()
+        print("%d chaves removidas" % result.rowcount)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
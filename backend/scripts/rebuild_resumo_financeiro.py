@@ -0,0 +1,42 @@
+"""Recalcula a tabela resumo_financeiro a partir de transacoes.
+
+    python -m scripts.rebuild_resumo_financeiro          # reconstroi tudo
+    python -m scripts.rebuild_resumo_financeiro --check  # so compara; sai com 1 se divergir
+
+Os meses de transacoes ja arquivados (scripts/archive_partitions.py) ficam de
+fora: seus buckets sao mantidos como estao.
+"""
+import argparse
+import sys
+
+from database import engine
+from particoes import primeiro_mes_online
+from rollups import reconstruir, verificar
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="store_true", help="apenas verifica a consistencia")
+    args = parser.parse_args()
+
+    with engine.begin() as conn:
+        desde = primeiro_mes_online(conn, "transacoes")
+        if desde is not None:
+            print("meses anteriores a %s arquivados: buckets mantidos" % desde.isoformat())
+        if args.check:
+            divergencias = verificar(conn, desde)
+            for item in divergencias[:50]:
+                print(item)
+            print("%d buckets divergentes" % len(divergencias))
+            return 1 if divergencias else 0
+
+        if engine.dialect.name == "postgresql":
+            # Bloqueia escritas concorrentes enquanto o resumo e recriado
+            conn.exec_driver_sql("LOCK TABLE transacoes IN SHARE MODE")
+        total = reconstruir(conn, desde)
+        print("%d buckets gravados" % total)
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,18 +1,23 @@
+import hashlib
+import hmac
+import time
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from typing import Optional
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import settings
 from database import SessionLocal, get_db
-from models import User
+from hashing import hash_password, password_pool, pwd_context, verify_and_update
+from models import PasswordResetToken, User
+from principal_cache import Principal, principal_cache
 from schemas import TokenPayload
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 
@@ -21,42 +26,128 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return hash_password(password)
 
 
-def create_access_token(subject: str, expires_delta: Optional[timedelta] = None) -> str:
+def reset_token_digest(user_id: int, token: str) -> str:
+    """HMAC-SHA256 do token de recuperacao, ligado ao usuario.
+
+    Por ser chaveado, o digest pode ser buscado por igualdade num indice: sem a
+    chave nao ha como montar um digest valido nem extrair algo do tempo de busca.
+    """
+    message = f"{user_id}:{token}".encode()
+    return hmac.new(settings.reset_token_secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def stale_reset_tokens(now: datetime, user_id: Optional[int] = None):
+    """DELETE dos tokens usados ou expirados (mantem a ultima hora para o limite de emissao)."""
+    stmt = delete(PasswordResetToken).where(
+        PasswordResetToken.is_used.is_(True) | (PasswordResetToken.expires_at < now),
+        PasswordResetToken.created_at < now - timedelta(hours=1),
+    )
+    if user_id is not None:
+        stmt = stmt.where(PasswordResetToken.user_id == user_id)
+    return stmt.execution_options(synchronize_session=False)
+
+
+def create_access_token(
+    subject: str, expires_delta: Optional[timedelta] = None, token_version: int = 0
+) -> str:
     expire = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=settings.access_token_expire_minutes))
-    to_encode = {"exp": expire, "sub": str(subject)}
+    to_encode = {"exp": expire, "sub": str(subject), "ver": token_version}
     return jwt.encode(to_encode, settings.jwt_secret, algorithm=settings.jwt_algorithm)
 
 
-def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
-    user = db.query(User).filter(User.email == email).first()
+@lru_cache(maxsize=4096)
+def _decode_token(token: str) -> TokenPayload:
+    # Tokens invalidos levantam JWTError e nao entram no cache; a expiracao e
+    # reconferida a cada uso em get_current_user
+    return TokenPayload(**jwt.decode(token, settings.jwt_secret, algorithms=[settings.jwt_algorithm]))
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    # bcrypt e CPU-bound: roda no pool dedicado (hashing.password_pool)
+    valid, _ = await password_pool.run(verify_and_update, plain_password, hashed_password)
+    return valid
+
+
+async def get_password_hash_async(password: str) -> str:
+    return await password_pool.run(hash_password, password)
+
+
+async def authenticate_user(db: AsyncSession, email: str, password: str) -> Optional[User]:
+    user = await db.scalar(select(User).where(User.email == email))
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    valid, new_hash = await password_pool.run(verify_and_update, password, user.hashed_password)
+    if not valid:
         return None
+    if new_hash:
+        # Parametros do CryptContext mudaram (ex.: BCRYPT_ROUNDS): regrava o hash; o commit fica com o chamador
+        user.hashed_password = new_hash
     return user
 
 
-def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)) -> User:
+async def set_user_active(db: AsyncSession, user_id: int, ativo: bool) -> bool:
+    """Ativa ou desativa o usuario e revoga os tokens ja emitidos.
+
+    `is_active` e `token_version` mudam no mesmo UPDATE: nao ha janela em que o
+    usuario esteja desativado com tokens antigos ainda validos. Devolve False se
+    o usuario nao existe.
+    """
+    result = await db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(is_active=ativo, token_version=func.coalesce(User.token_version, 0) + 1)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    principal_cache.invalidate(user_id)
+    return result.rowcount == 1
+
+
+async def get_current_user(db: AsyncSession = Depends(get_db), token: str = Depends(oauth2_scheme)) -> Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Credenciais invalidas ou token expirado",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, settings.jwt_secret, algorithms=[settings.jwt_algorithm])
-        token_data = TokenPayload(**payload)
-        if token_data.sub is None:
-            raise credentials_exception
+        token_data = _decode_token(token)
     except JWTError:
         raise credentials_exception
+    if token_data.sub is None or (token_data.exp is not None and token_data.exp <= time.time()):
+        raise credentials_exception
 
-    user = db.query(User).filter(User.id == int(token_data.sub)).first()
-    if user is None:
+    user_id = int(token_data.sub)
+    principal = principal_cache.get(user_id, token_data.ver)
+    if principal is None:
+        user = await db.get(User, user_id)
+        if user is None or (user.token_version or 0) != token_data.ver:
+            raise credentials_exception
+        principal = Principal.from_user(user)
+        principal_cache.put(principal)
+        # Devolve a conexao ao pool ja: sem isso ela fica presa numa transacao aberta ate o fim da
+        # requisicao, mesmo em rotas que leem por outras sessoes (replica, dashboard). A sessao
+        # continua utilizavel e pega outra conexao se a rota precisar
+        await db.close()
+
+    if not principal.is_active:
         raise credentials_exception
-    return user
+    return principal
+
+
+def auth_cache_stats() -> dict:
+    decode = _decode_token.cache_info()
+    return {
+        "principals": principal_cache.snapshot(),
+        "decoded_tokens": {
+            "size": decode.currsize,
+            "maxsize": decode.maxsize,
+            "hits": decode.hits,
+            "misses": decode.misses,
+        },
+    }
 
 
 def ensure_default_admin() -> None:
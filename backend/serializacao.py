@@ -0,0 +1,103 @@
+"""Caminho rapido das listagens: colunas -> dict -> orjson.
+
+Em vez de montar instancias ORM e valida-las com `from_attributes`, as rotas de
+listagem selecionam so as colunas dos schemas de saida e devolvem os dicts numa
+`ORJSONResponse`. Os schemas continuam sendo o contrato: `colunas` e `montar`
+seguem os campos deles, e o `response_model` das rotas documenta a resposta.
+
+`resposta_condicional` acrescenta um ETag forte (hash do corpo) e responde 304
+sem corpo quando o cliente ja tem aquela representacao (If-None-Match).
+"""
+import hashlib
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Mapping, Optional
+
+import orjson
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+
+def _default(valor: Any):
+    # Numeric chega como Decimal; os schemas o expoem como float
+    if isinstance(valor, Decimal):
+        return float(valor)
+    raise TypeError(f"Tipo nao serializavel: {type(valor).__name__}")
+
+
+def dumps(conteudo: Any) -> bytes:
+    return orjson.dumps(conteudo, default=_default, option=orjson.OPT_UTC_Z)
+
+
+class ORJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def _etag(corpo: bytes) -> str:
+    return '"' + hashlib.sha256(corpo).hexdigest()[:32] + '"'
+
+
+def _etag_confere(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match usa comparacao fraca: W/"x" casa com "x"
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def cabecalhos_condicionais(corpo: bytes, headers: Optional[dict] = None) -> dict:
+    return {**(headers or {}), "ETag": _etag(corpo), "Cache-Control": "private, no-cache"}
+
+
+def responder_corpo(request: Request, corpo: bytes, cabecalhos: dict) -> Response:
+    """Corpo JSON ja serializado, com os cabecalhos de `cabecalhos_condicionais` (ETag incluso)."""
+    if _etag_confere(request.headers.get("if-none-match"), cabecalhos["ETag"]):
+        return Response(status_code=304, headers=cabecalhos)
+    return Response(corpo, media_type="application/json", headers=cabecalhos)
+
+
+def resposta_condicional(request: Request, conteudo: Any, headers: Optional[dict] = None) -> Response:
+    corpo = dumps(conteudo)
+    return responder_corpo(request, corpo, cabecalhos_condicionais(corpo, headers))
+
+
+def _submodelo(anotacao) -> Optional[type[BaseModel]]:
+    return anotacao if isinstance(anotacao, type) and issubclass(anotacao, BaseModel) else None
+
+
+def colunas(model, schema: type[BaseModel], prefixo: str = "") -> list:
+    """Colunas de `model` presentes em `schema`, rotuladas `prefixo + campo`."""
+    tabela = model.__table__.c
+    return [getattr(model, nome).label(prefixo + nome) for nome in schema.model_fields if nome in tabela]
+
+
+@lru_cache(maxsize=None)
+def _plano(schema: type[BaseModel], prefixo: str) -> tuple:
+    plano = []
+    for nome, campo in schema.model_fields.items():
+        submodelo = _submodelo(campo.annotation)
+        if submodelo is not None:
+            plano.append((nome, None, _plano(submodelo, f"{prefixo}{nome}__")))
+        else:
+            plano.append((nome, prefixo + nome, None))
+    return tuple(plano)
+
+
+def _aplicar(linha: Mapping, plano: tuple) -> dict:
+    return {
+        nome: linha[chave] if subplano is None else _aplicar(linha, subplano)
+        for nome, chave, subplano in plano
+    }
+
+
+def montar(linhas, schema: type[BaseModel]) -> list[dict]:
+    """Converte linhas (`result.mappings()`) em dicts no formato de `schema`.
+
+    Campos que sao outro schema (ex.: `AgendamentoOut.paciente`) leem as colunas
+    rotuladas `campo__subcampo`, como geradas por `colunas(..., prefixo="campo__")`.
+    """
+    plano = _plano(schema, "")
+    return [_aplicar(linha, plano) for linha in linhas]
@@ -0,0 +1,53 @@
+"""Sincronizacao incremental das listagens (?since=<watermark>).
+
+Toda escrita em pacientes, agendamentos e transacoes avanca `updated_at`, e
+exclusoes apenas preenchem `deleted_at`. Sem `since`, as listagens devolvem as
+linhas ativas; com `since`, devolvem tudo o que mudou depois do watermark,
+inclusive as excluidas (tombstones, com `deleted_at` preenchido).
+
+O watermark devolvido em X-Watermark fica MARGEM atras do relogio: uma transacao
+iniciada antes da consulta e confirmada depois dela tem `updated_at` anterior ao
+instante da consulta, e so e vista se o proximo `since` ainda cobrir esse
+intervalo. Linhas da margem podem voltar repetidas; o cliente aplica por id.
+"""
+import base64
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi import HTTPException
+
+from models import utcnow
+
+MARGEM = timedelta(seconds=30)
+WATERMARK_HEADER = "X-Watermark"
+
+
+def encode_watermark(instante: datetime) -> str:
+    return base64.urlsafe_b64encode(instante.isoformat().encode()).decode().rstrip("=")
+
+
+def decode_watermark(valor: Optional[str]) -> Optional[datetime]:
+    if not valor:
+        return None
+    try:
+        instante = datetime.fromisoformat(base64.urlsafe_b64decode(valor + "=" * (-len(valor) % 4)).decode())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Watermark invalido")
+    if instante.tzinfo is None:
+        raise HTTPException(status_code=400, detail="Watermark invalido")
+    return instante.astimezone(timezone.utc)
+
+
+def proximo_watermark(since: Optional[datetime]) -> str:
+    """Watermark para a proxima chamada; calcule-o antes de consultar."""
+    instante = utcnow() - MARGEM
+    if since is not None and since > instante:
+        instante = since
+    return encode_watermark(instante)
+
+
+def filtro(model, since: Optional[datetime]):
+    """Linhas ativas (sem since) ou alteradas depois de since, incluindo tombstones."""
+    if since is None:
+        return model.deleted_at.is_(None)
+    return model.updated_at > since
@@ -0,0 +1,203 @@
+"""Fila write-behind para escritas nao criticas (last_login, auditoria, log de acesso).
+
+O login carimbava User.last_login com um commit e um refresh no caminho mais
+quente sem autenticacao. Agora a rota so enfileira o evento: um loop no
+lifespan grava tudo a cada WRITE_BEHIND_INTERVAL_SECONDS, em lotes de ate
+WRITE_BEHIND_BATCH_SIZE linhas por statement.
+
+- Eventos com chave coalescem: dez logins do mesmo usuario no intervalo viram
+  uma linha so no UPDATE ... FROM (VALUES ...). Eventos sem chave (ex.: uma
+  futura trilha de auditoria) sao acumulados e gravados em lote.
+- A fila e limitada a WRITE_BEHIND_MAX_PENDING eventos; acima disso eventos novos
+  sao descartados e contados em "dropped" (o valor perdido nao e critico).
+- Um lote que falha volta para a fila, sem sobrescrever valores mais novos.
+- No shutdown a fila e gravada antes de fechar o processo.
+
+O preco e o atraso: o last_login fica no banco ate um intervalo depois do login
+("lag_seconds_max" em /internal/write-behind), e um kill -9 perde o que estiver
+na fila.
+"""
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from sqlalchemy import DateTime, Integer, bindparam, column, func, update, values
+
+from config import settings
+from database import open_session
+from models import User
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Destino:
+    """Onde um tipo de evento e gravado: `gravar(db, linhas)` recebe o lote ja coalescido."""
+
+    nome: str
+    gravar: Callable[[Any, list[dict]], Awaitable[None]]
+
+
+class WriteBehind:
+    def __init__(self, intervalo: float, max_pendentes: int, lote: int):
+        self.intervalo = intervalo
+        self.max_pendentes = max_pendentes
+        self.lote = lote
+        self._lock = threading.Lock()
+        # (destino, chave) -> (linha, enfileirado_em); chave None vira um contador unico
+        self._pendentes: dict[tuple[Destino, Hashable], tuple[dict, float]] = {}
+        self._sequencia = 0
+        self._tarefa: Optional[asyncio.Task] = None
+        self._parar: Optional[asyncio.Event] = None
+        self._stats = {
+            "enqueued": 0,
+            "coalesced": 0,
+            "dropped": 0,
+            "written": 0,
+            "flushes": 0,
+            "flush_failures": 0,
+            "lag_seconds_total": 0.0,
+            "lag_seconds_max": 0.0,
+            "flush_seconds_total": 0.0,
+            "flush_seconds_max": 0.0,
+        }
+
+    def registrar(self, destino: Destino, linha: dict, chave: Optional[Hashable] = None) -> bool:
+        """Enfileira `linha`; com `chave`, substitui o evento pendente de mesma chave."""
+        agora = time.monotonic()
+        with self._lock:
+            self._stats["enqueued"] += 1
+            if chave is not None and (destino, chave) in self._pendentes:
+                _, enfileirado_em = self._pendentes[(destino, chave)]
+                # Mantem o instante do primeiro evento: o atraso medido e o do mais antigo
+                self._pendentes[(destino, chave)] = (linha, enfileirado_em)
+                self._stats["coalesced"] += 1
+                return True
+            if len(self._pendentes) >= self.max_pendentes:
+                self._stats["dropped"] += 1
+                return False
+            if chave is None:
+                self._sequencia += 1
+                chave = ("seq", self._sequencia)
+            self._pendentes[(destino, chave)] = (linha, agora)
+            return True
+
+    async def gravar(self) -> int:
+        """Grava tudo o que esta pendente; devolve quantas linhas foram gravadas."""
+        with self._lock:
+            pendentes, self._pendentes = self._pendentes, {}
+        if not pendentes:
+            return 0
+
+        por_destino: dict[Destino, list[tuple[Hashable, dict, float]]] = {}
+        for (destino, chave), (linha, enfileirado_em) in pendentes.items():
+            por_destino.setdefault(destino, []).append((chave, linha, enfileirado_em))
+
+        gravadas = 0
+        for destino, itens in por_destino.items():
+            for inicio in range(0, len(itens), self.lote):
+                parte = itens[inicio:inicio + self.lote]
+                comeco = time.perf_counter()
+                try:
+                    async with open_session() as db:
+                        await destino.gravar(db, [linha for _, linha, _ in parte])
+                        await db.commit()
+                except Exception:
+                    logger.exception("write-behind: falha ao gravar %d linhas em %s", len(parte), destino.nome)
+                    self._devolver(destino, parte)
+                    continue
+                duracao, agora = time.perf_counter() - comeco, time.monotonic()
+                gravadas += len(parte)
+                with self._lock:
+                    self._stats["written"] += len(parte)
+                    self._stats["flushes"] += 1
+                    self._stats["flush_seconds_total"] += duracao
+                    self._stats["flush_seconds_max"] = max(self._stats["flush_seconds_max"], duracao)
+                    # Atraso de cada linha: do primeiro evento enfileirado ate o commit
+                    self._stats["lag_seconds_total"] += sum(agora - e for _, _, e in parte)
+                    self._stats["lag_seconds_max"] = max(
+                        self._stats["lag_seconds_max"], agora - min(e for _, _, e in parte)
+                    )
+        return gravadas
+
+    def _devolver(self, destino: Destino, itens: list[tuple[Hashable, dict, float]]) -> None:
+        with self._lock:
+            self._stats["flush_failures"] += 1
+            for chave, linha, enfileirado_em in itens:
+                if (destino, chave) in self._pendentes:
+                    # Chegou um valor mais novo enquanto o lote falhava: ele prevalece
+                    continue
+                if len(self._pendentes) >= self.max_pendentes:
+                    self._stats["dropped"] += 1
+                    continue
+                self._pendentes[(destino, chave)] = (linha, enfileirado_em)
+
+    async def _loop(self, parar: asyncio.Event) -> None:
+        # Espera o evento em vez de cancelar a tarefa: um lote em voo nunca e interrompido
+        while not parar.is_set():
+            try:
+                await asyncio.wait_for(parar.wait(), self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.gravar()
+            except Exception:
+                logger.exception("write-behind: falha inesperada no flush")
+
+    def iniciar(self) -> None:
+        if self._tarefa is None:
+            self._parar = asyncio.Event()
+            self._tarefa = asyncio.get_running_loop().create_task(self._loop(self._parar))
+
+    async def parar(self) -> None:
+        """Para o loop, que grava o que ficou na fila antes de sair (chamado no shutdown)."""
+        if self._tarefa is not None:
+            self._parar.set()
+            await self._tarefa
+            self._tarefa = None
+        else:
+            await self.gravar()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            pendentes = len(self._pendentes)
+            mais_antigo = min((e for _, e in self._pendentes.values()), default=None)
+            return {
+                "interval_seconds": self.intervalo,
+                "max_pending": self.max_pendentes,
+                "pending": pendentes,
+                "oldest_pending_seconds": time.monotonic() - mais_antigo if mais_antigo is not None else 0.0,
+                **self._stats,
+            }
+
+
+async def _gravar_last_login(db, linhas: list[dict]) -> None:
+    if db.get_bind().dialect.name == "postgresql":
+        v = values(
+            column("id", Integer), column("last_login", DateTime(timezone=True)), name="v"
+        ).data([(linha["id"], linha["last_login"]) for linha in linhas])
+        # GREATEST: o lote de outro worker pode chegar depois com um login mais antigo
+        await db.execute(
+            update(User)
+            .where(User.id == v.c.id)
+            .values(last_login=func.greatest(func.coalesce(User.last_login, v.c.last_login), v.c.last_login))
+        )
+        return
+    # SQLite nao aceita VALUES com nomes de coluna no FROM: executemany por chave
+    tabela = User.__table__
+    await db.execute(
+        update(tabela).where(tabela.c.id == bindparam("b_id")).values(last_login=bindparam("b_last_login")),
+        [{"b_id": linha["id"], "b_last_login": linha["last_login"]} for linha in linhas],
+    )
+
+
+LAST_LOGIN = Destino("users.last_login", _gravar_last_login)
+
+write_behind = WriteBehind(
+    intervalo=settings.write_behind_interval_seconds,
+    max_pendentes=settings.write_behind_max_pending,
+    lote=settings.write_behind_batch_size,
+)
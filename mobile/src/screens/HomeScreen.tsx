@@ -10,7 +10,7 @@ import {
 import { SafeAreaView } from "react-native-safe-area-context";
 import { Bot, CheckCircle2, FileText, LogOut, MoreHorizontal, Stethoscope } from "lucide-react-native";
 
-import { Agendamento, AuraAPI } from "../services/api";
+import { AuraAPI, Dashboard } from "../services/api";
 
 type HomeScreenProps = {
   token: string;
@@ -19,27 +19,23 @@ type HomeScreenProps = {
 };
 
 export default function HomeScreen({ token, userName, onLogout }: HomeScreenProps) {
-  const [agenda, setAgenda] = useState<Agendamento[]>([]);
+  const [dashboard, setDashboard] = useState<Dashboard | null>(null);
   const [loading, setLoading] = useState(true);
   const [refreshing, setRefreshing] = useState(false);
   const [apiStatus, setApiStatus] = useState<"online" | "offline">("online");
 
-  const doctorName = useMemo(() => userName ?? "Dr. Kelven", [userName]);
+  const doctorName = useMemo(
+    () => dashboard?.user.nome ?? userName ?? "Dr. Kelven",
+    [dashboard, userName]
+  );
 
   const fetchData = useCallback(async () => {
     if (!token) return;
     try {
-      const health = await AuraAPI.healthCheck();
-      if (health.status === "offline") {
-        setApiStatus("offline");
-        setLoading(false);
-        setRefreshing(false);
-        return;
-      }
+      // Uma requisicao traz tudo o que a home exibe; sem mudancas o backend responde 304
+      const dados = await AuraAPI.getDashboard();
+      setDashboard(dados);
       setApiStatus("online");
-
-      const dadosAgenda = await AuraAPI.getAgenda();
-      setAgenda(dadosAgenda);
     } catch (error: any) {
       console.error("Erro ao carregar home:", error);
       if (error?.response?.status === 401 && onLogout) {
@@ -62,7 +58,8 @@ export default function HomeScreen({ token, userName, onLogout }: HomeScreenProp
     fetchData();
   };
 
-  const proximoPaciente = agenda.find(
+  const agenda = dashboard?.hoje ?? [];
+  const proximoPaciente = dashboard?.proximos.find(
     (a) => a.status === "agendado" || a.status === "confirmado"
   );
 
@@ -116,12 +113,14 @@ export default function HomeScreen({ token, userName, onLogout }: HomeScreenProp
 
         <View className="px-4 mb-6 flex-row gap-3">
           <View className="flex-1 bg-void-900 p-4 rounded-2xl border border-void-800 items-center">
-            <Text className="text-3xl font-bold text-white">{agenda.length}</Text>
+            <Text className="text-3xl font-bold text-white">
+              {dashboard?.contagens.agendamentos_hoje ?? 0}
+            </Text>
             <Text className="text-[10px] text-gray-500 uppercase font-bold mt-1">Pacientes</Text>
           </View>
           <View className="flex-1 bg-void-900 p-4 rounded-2xl border border-void-800 items-center">
             <Text className="text-3xl font-bold text-emerald-400">
-              {agenda.filter((a) => a.status === "finalizado").length}
+              {dashboard?.contagens.atendidos_hoje ?? 0}
             </Text>
             <Text className="text-[10px] text-gray-500 uppercase font-bold mt-1">Atendidos</Text>
           </View>
@@ -46,6 +46,9 @@ const api = axios.create({
 let authToken: string | null = null;
 
 export const setAuthToken = (token?: string | null) => {
+  if ((token ?? null) !== authToken) {
+    limparSincronizacao();
+  }
   authToken = token ?? null;
   if (authToken) {
     api.defaults.headers.common.Authorization = `Bearer ${authToken}`;
@@ -87,6 +90,8 @@ export interface Paciente {
   cpf?: string;
   data_cadastro: string;
   responsavel_id?: number;
+  updated_at: string;
+  deleted_at?: string | null;
 }
 
 export interface Agendamento {
@@ -101,6 +106,21 @@ export interface Agendamento {
   observacoes?: string;
   paciente: Paciente;
   responsavel_id?: number;
+  updated_at: string;
+  deleted_at?: string | null;
+}
+
+export interface AgendamentoPage {
+  items: Agendamento[];
+  next_cursor?: string | null;
+}
+
+export interface AgendaParams {
+  inicio?: string;
+  fim?: string;
+  cursor?: string;
+  limit?: number;
+  since?: string;
 }
 
 export interface Transacao {
@@ -112,6 +132,45 @@ export interface Transacao {
   pago: boolean;
   data_competencia: string;
   responsavel_id?: number;
+  updated_at: string;
+  deleted_at?: string | null;
+}
+
+export interface ResumoItem {
+  chave: string;
+  total: number;
+  quantidade: number;
+}
+
+export interface ResumoCategoria extends ResumoItem {
+  tipo: "receita" | "despesa" | string;
+}
+
+export interface ResumoFinanceiro {
+  receitas: number;
+  despesas: number;
+  saldo: number;
+  receitas_pagas: number;
+  receitas_pendentes: number;
+  despesas_pagas: number;
+  despesas_pendentes: number;
+  quantidade: number;
+  por_tipo: ResumoItem[];
+  por_categoria: ResumoCategoria[];
+  por_mes: { mes: string; receitas: number; despesas: number; saldo: number }[];
+}
+
+export interface Dashboard {
+  user: User;
+  hoje: Agendamento[];
+  proximos: Agendamento[];
+  financeiro: ResumoFinanceiro;
+  contagens: {
+    pacientes: number;
+    agendamentos_hoje: number;
+    atendidos_hoje: number;
+    agendamentos_futuros: number;
+  };
 }
 
 export interface CreatePacienteDTO {
@@ -121,6 +180,145 @@ export interface CreatePacienteDTO {
   cpf?: string;
 }
 
+// ---------------------------------------------------------------------------
+// GET condicional (ETag) e sincronizacao incremental (?since=)
+// ---------------------------------------------------------------------------
+
+// Ultimo corpo recebido por URL + params: com If-None-Match o backend responde 304 sem corpo
+const respostasEmCache = new Map<string, { etag: string; data: unknown }>();
+
+const getCondicional = async <T>(url: string, params: object = {}) => {
+  const chave = `${url}?${JSON.stringify(params)}`;
+  const emCache = respostasEmCache.get(chave);
+  const response = await api.get<T>(url, {
+    params,
+    headers: emCache ? { "If-None-Match": emCache.etag } : undefined,
+    validateStatus: (status) => (status >= 200 && status < 300) || status === 304,
+  });
+  const watermark: string | undefined = response.headers["x-watermark"];
+  if (response.status === 304 && emCache) {
+    return { data: emCache.data as T, watermark };
+  }
+  if (response.headers.etag) {
+    respostasEmCache.set(chave, { etag: response.headers.etag, data: response.data });
+  }
+  return { data: response.data, watermark };
+};
+
+type Sincronizavel = { id: number; deleted_at?: string | null };
+
+interface EstadoSync<T extends Sincronizavel> {
+  escopo?: string;
+  watermark?: string;
+  itens: Map<number, T>;
+}
+
+const novoEstado = <T extends Sincronizavel>(): EstadoSync<T> => ({ itens: new Map() });
+
+let agendaSync = novoEstado<Agendamento>();
+let financeiroSync = novoEstado<Transacao>();
+
+function limparSincronizacao() {
+  respostasEmCache.clear();
+  agendaSync = novoEstado<Agendamento>();
+  financeiroSync = novoEstado<Transacao>();
+}
+
+// Aplica alteracoes e tombstones (deleted_at preenchido) por id
+const aplicarDelta = <T extends Sincronizavel>(estado: EstadoSync<T>, itens: T[]) => {
+  for (const item of itens) {
+    if (item.deleted_at) {
+      estado.itens.delete(item.id);
+    } else {
+      estado.itens.set(item.id, item);
+    }
+  }
+};
+
+// ---------------------------------------------------------------------------
+// Fila offline de criacoes (POST /sync)
+// ---------------------------------------------------------------------------
+// Criacoes feitas sem rede entram na fila com uma chave de idempotencia e vao ao backend em lotes,
+// cada lote numa unica transacao. Reenviar um lote (timeout, Wi-Fi que caiu) e seguro: o backend
+// devolve o resultado ja gravado em vez de duplicar. Um agendamento pode referenciar o temp_id de um
+// paciente ainda na fila; `ids` traz o id definitivo de cada temp_id.
+
+export type TempId = string;
+
+export type CreateAgendamentoDTO = Omit<
+  Agendamento,
+  "id" | "paciente" | "paciente_id" | "responsavel_id" | "updated_at" | "deleted_at"
+> & { paciente_id: number | TempId };
+
+export type CreateTransacaoDTO = Omit<
+  Transacao,
+  "id" | "data_competencia" | "responsavel_id" | "updated_at" | "deleted_at"
+>;
+
+export type Mutacao =
+  | { tipo: "paciente"; chave: string; temp_id?: TempId; dados: CreatePacienteDTO }
+  | { tipo: "agendamento"; chave: string; temp_id?: TempId; dados: CreateAgendamentoDTO }
+  | { tipo: "transacao"; chave: string; temp_id?: TempId; dados: CreateTransacaoDTO };
+
+export interface ResultadoMutacao {
+  chave: string;
+  tipo: Mutacao["tipo"];
+  temp_id?: TempId | null;
+  id: number;
+  repetida: boolean;
+  dados: Paciente | Agendamento | Transacao;
+}
+
+export interface SyncResponse {
+  resultados: ResultadoMutacao[];
+  ids: Record<TempId, number>;
+}
+
+// Limite do backend: SYNC_MAX_MUTATIONS (500)
+const MUTACOES_POR_LOTE = 200;
+
+const filaMutacoes: Mutacao[] = [];
+let envioEmAndamento: Promise<SyncResponse> | null = null;
+
+const novoId = (prefixo: string) =>
+  `${prefixo}-${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`;
+
+const enfileirar = (mutacao: Omit<Mutacao, "chave" | "temp_id">): TempId => {
+  const tempId = novoId("tmp");
+  filaMutacoes.push({ ...mutacao, chave: novoId("m"), temp_id: tempId } as Mutacao);
+  return tempId;
+};
+
+export const queuePaciente = (dados: CreatePacienteDTO) => enfileirar({ tipo: "paciente", dados });
+
+export const queueAgendamento = (dados: CreateAgendamentoDTO) => enfileirar({ tipo: "agendamento", dados });
+
+export const queueTransacao = (dados: CreateTransacaoDTO) => enfileirar({ tipo: "transacao", dados });
+
+export const pendingMutacoes = (): readonly Mutacao[] => filaMutacoes;
+
+// Envia a fila em lotes, na ordem. Um lote so sai da fila depois da resposta: se a rede cair no meio,
+// a proxima chamada reenvia o mesmo lote com as mesmas chaves. Um lote recusado (4xx, com `indice` e
+// `chave` no detail) interrompe o envio e continua na fila.
+export const flushMutacoes = (): Promise<SyncResponse> => {
+  if (!envioEmAndamento) {
+    envioEmAndamento = (async () => {
+      const total: SyncResponse = { resultados: [], ids: {} };
+      while (filaMutacoes.length > 0) {
+        const lote = filaMutacoes.slice(0, MUTACOES_POR_LOTE);
+        const response = await api.post<SyncResponse>("/sync", { mutacoes: lote });
+        filaMutacoes.splice(0, lote.length);
+        total.resultados.push(...response.data.resultados);
+        Object.assign(total.ids, response.data.ids);
+      }
+      return total;
+    })().finally(() => {
+      envioEmAndamento = null;
+    });
+  }
+  return envioEmAndamento;
+};
+
 // ---------------------------------------------------------------------------
 // Funcoes de servico
 // ---------------------------------------------------------------------------
@@ -131,14 +329,78 @@ export const login = async (email: string, password: string): Promise<AuthRespon
   return response.data;
 };
 
-export const fetchAgenda = async (): Promise<Agendamento[]> => {
-  const response = await api.get<Agendamento[]>("/agendamentos/");
+// Janela padrao: a semana visivel a partir de hoje
+const semanaVisivel = (): AgendaParams => {
+  const inicio = new Date();
+  inicio.setHours(0, 0, 0, 0);
+  const fim = new Date(inicio);
+  fim.setDate(fim.getDate() + 7);
+  return { inicio: inicio.toISOString(), fim: fim.toISOString() };
+};
+
+export const fetchAgendaPage = async (params: AgendaParams = {}): Promise<AgendamentoPage> => {
+  const response = await api.get<AgendamentoPage>("/agendamentos/", { params });
   return response.data;
 };
 
+export const fetchAgenda = async (params: AgendaParams = semanaVisivel()): Promise<Agendamento[]> => {
+  const itens: Agendamento[] = [];
+  let cursor: string | undefined;
+  do {
+    const page = await fetchAgendaPage({ ...params, cursor });
+    itens.push(...page.items);
+    cursor = page.next_cursor ?? undefined;
+  } while (cursor);
+  return itens;
+};
+
+// Agenda da janela visivel mantida localmente: a primeira chamada carrega a janela inteira e as
+// seguintes pedem so o que mudou desde o ultimo watermark. O delta vem sem filtro de janela, para
+// que remarcacoes para fora dela tambem cheguem; a janela e aplicada aqui.
+export const syncAgenda = async (params: AgendaParams = semanaVisivel()): Promise<Agendamento[]> => {
+  const escopo = `${params.inicio ?? ""}|${params.fim ?? ""}`;
+  if (agendaSync.escopo !== escopo) {
+    agendaSync = { ...novoEstado<Agendamento>(), escopo };
+  }
+  const filtros: AgendaParams = agendaSync.watermark ? { since: agendaSync.watermark } : params;
+
+  let watermark: string | undefined;
+  let cursor: string | undefined;
+  do {
+    const pagina = await getCondicional<AgendamentoPage>("/agendamentos/", { ...filtros, cursor });
+    // O watermark da primeira pagina e anterior a todas as leituras seguintes
+    watermark = watermark ?? pagina.watermark;
+    aplicarDelta(agendaSync, pagina.data.items);
+    cursor = pagina.data.next_cursor ?? undefined;
+  } while (cursor);
+  agendaSync.watermark = watermark ?? agendaSync.watermark;
+
+  const inicio = params.inicio ? Date.parse(params.inicio) : -Infinity;
+  const fim = params.fim ? Date.parse(params.fim) : Infinity;
+  return [...agendaSync.itens.values()]
+    .filter((a) => Date.parse(a.data_hora_inicio) >= inicio && Date.parse(a.data_hora_inicio) < fim)
+    .sort((a, b) => Date.parse(a.data_hora_inicio) - Date.parse(b.data_hora_inicio));
+};
+
 export const fetchFinanceiro = async (): Promise<Transacao[]> => {
-  const response = await api.get<Transacao[]>("/financeiro/");
-  return response.data;
+  const { data } = await getCondicional<Transacao[]>("/financeiro/");
+  return data;
+};
+
+export const syncFinanceiro = async (): Promise<Transacao[]> => {
+  const filtros = financeiroSync.watermark ? { since: financeiroSync.watermark } : {};
+  const { data, watermark } = await getCondicional<Transacao[]>("/financeiro/", filtros);
+  aplicarDelta(financeiroSync, data);
+  financeiroSync.watermark = watermark ?? financeiroSync.watermark;
+  return [...financeiroSync.itens.values()].sort(
+    (a, b) => Date.parse(b.data_competencia) - Date.parse(a.data_competencia)
+  );
+};
+
+// Home em uma requisicao: perfil, agenda de hoje, proximos, resumo do mes e contagens
+export const fetchDashboard = async (): Promise<Dashboard> => {
+  const { data } = await getCondicional<Dashboard>("/dashboard/");
+  return data;
 };
 
 export const createPaciente = async (payload: CreatePacienteDTO): Promise<Paciente> => {
@@ -163,8 +425,15 @@ export const AuraAPI = {
     return response.data;
   },
 
+  getDashboard: fetchDashboard,
+
   getPacientes: async (): Promise<Paciente[]> => {
-    const response = await api.get<Paciente[]>("/pacientes/");
+    const { data } = await getCondicional<Paciente[]>("/pacientes/");
+    return data;
+  },
+
+  searchPacientes: async (q: string, limit = 20): Promise<Paciente[]> => {
+    const response = await api.get<Paciente[]>("/pacientes/search", { params: { q, limit } });
     return response.data;
   },
 
@@ -172,8 +441,29 @@ export const AuraAPI = {
 
   getAgenda: fetchAgenda,
 
+  getAgendaPage: fetchAgendaPage,
+
+  syncAgenda,
+
   getFinanceiro: fetchFinanceiro,
 
+  syncFinanceiro,
+
+  queuePaciente,
+
+  queueAgendamento,
+
+  queueTransacao,
+
+  pendingMutacoes,
+
+  flushMutacoes,
+
+  getResumoFinanceiro: async (params: { inicio?: string; fim?: string } = {}) => {
+    const response = await api.get<ResumoFinanceiro>("/financeiro/resumo", { params });
+    return response.data;
+  },
+
   createAgendamento: async (payload: Omit<Agendamento, "id" | "paciente">) => {
     const response = await api.post<Agendamento>("/agendamentos/", payload);
     return response.data;